@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import zmq
+
+# The benchmark exercises the real encoder (processors) and the real clients
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "processors"))
+sys.path.append(os.path.join(ROOT, "clients"))
+from wire_format import encode_batch
+from client_sub import ClientSub
+from async_client_sub import AsyncClientSub
+
+TOPIC = "ProcessedData"
+
+
+def publish(port, n_channels: int, batch_size: int, rate: float, duration: float, warmup: float = 0.5):
+    """Publish synthetic batches at a fixed rate, run in its own process so it does not count in the client's CPU time
+
+    Args:
+        port (multiprocessing.Value): set to the port bound by the publisher
+        n_channels (int): number of channels
+        batch_size (int): number of samples per batch
+        rate (float): batches per second
+        duration (float): seconds of stream
+        warmup (float, optional): seconds left to the subscriber to connect. Defaults to 0.5.
+    """
+    context = zmq.Context()
+    pub = context.socket(zmq.PUB)
+    port.value = pub.bind_to_random_port("tcp://127.0.0.1")
+    time.sleep(warmup)
+
+    samples = (400 + 50 * np.random.randn(batch_size, n_channels)).astype(np.float32)
+    n_batches = int(duration * rate)
+    start = time.perf_counter()
+    for seq in range(n_batches + 1):
+        # Sleep until the batch is due so the stream is paced like the amplifier
+        delay = start + seq / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        samplestamps = np.arange(seq * batch_size, (seq + 1) * batch_size, dtype=np.int64)
+        # The last batch is empty and tells the client to stop
+        batch = (samplestamps, samples) if seq < n_batches else (samplestamps[:0], samples[:0])
+        pub.send_multipart([TOPIC.encode()] + encode_batch(*batch, time.time(), seq), copy=False)
+
+    pub.close(linger=1000)
+    context.term()
+
+
+def run_threaded(port: int) -> list:
+    """Receive on a thread into a queue and consume on the main thread, as in eeg_visualizer.py
+
+    Returns:
+        list: latency of each batch in milliseconds, from publishing to consumption
+    """
+    client = ClientSub(sub_port=port, req_port=port + 1, sub_topic=TOPIC)
+    batches = queue.Queue()
+    receiving = threading.Event()
+    receiving.set()
+
+    def receive():
+        while receiving.is_set():
+            data = client.get_data(timeout=100)
+            if data is not None:
+                batches.put(data)
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+
+    latencies = []
+    while True:
+        samplestamps, samples, timestamp = batches.get()
+        if len(samples) == 0:
+            break
+        latencies.append((time.time() - timestamp) * 1000)
+
+    receiving.clear()
+    receiver.join()
+    client.close()
+    return latencies
+
+
+def run_async(port: int) -> list:
+    """Consume with `async for` on an asyncio event loop
+
+    Returns:
+        list: latency of each batch in milliseconds, from publishing to consumption
+    """
+    async def consume():
+        client = AsyncClientSub(sub_port=port, req_port=port + 1, sub_topic=TOPIC)
+        latencies = []
+        async for samplestamps, samples, timestamp in client:
+            if len(samples) == 0:
+                break
+            latencies.append((time.time() - timestamp) * 1000)
+        client.close()
+        return latencies
+
+    return asyncio.run(consume())
+
+
+def bench(run, n_channels: int, batch_size: int, rate: float, duration: float) -> dict:
+    """Run one client against a fresh publisher process
+
+    Returns:
+        dict: latency percentiles in milliseconds, received batches and client CPU use in percent of one core
+    """
+    port = multiprocessing.Value("i", 0)
+    publisher = multiprocessing.Process(target=publish, args=(port, n_channels, batch_size, rate, duration))
+    publisher.start()
+    while port.value == 0:
+        time.sleep(0.01)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    latencies = np.array(run(port.value))
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+    publisher.join()
+
+    return {"received": len(latencies),
+            "p50_ms": np.percentile(latencies, 50), "p99_ms": np.percentile(latencies, 99),
+            "max_ms": latencies.max(), "cpu_percent": cpu / wall * 100}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the asyncio client with the receiver thread + queue pattern")
+    parser.add_argument("--channels", type=int, default=64, help="channels per sample")
+    parser.add_argument("--batch-size", type=int, default=10, help="samples per batch")
+    parser.add_argument("--rate", type=float, default=200, help="batches per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of stream per client")
+    parser.add_argument("--output", type=str, default=None, help="optional CSV file for the results")
+    args = parser.parse_args()
+
+    rows = []
+    print("{:>8} {:>9} {:>9} {:>9} {:>9} {:>6}".format("client", "received", "p50 ms", "p99 ms", "max ms", "CPU %"))
+    for name, run in (("thread", run_threaded), ("asyncio", run_async)):
+        result = bench(run, args.channels, args.batch_size, args.rate, args.duration)
+        rows.append((name, result))
+        print("{:>8} {:>9d} {:>9.3f} {:>9.3f} {:>9.3f} {:>6.1f}".format(
+            name, result["received"], result["p50_ms"], result["p99_ms"], result["max_ms"], result["cpu_percent"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write("client,received,p50_ms,p99_ms,max_ms,cpu_percent\n")
+            for name, result in rows:
+                file.write("{},{received},{p50_ms},{p99_ms},{max_ms},{cpu_percent}\n".format(name, **result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "notebooks"))
+from common_spatial_pattern import compute_covariance_matrix, mean_covariance_matrix
+
+
+def per_trial_mean_covariance(X):
+    """The former covariance path of `csp`: one matrix per trial in a Python list"""
+    return np.mean([compute_covariance_matrix(trial) for trial in X], axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-trial and the chunked covariance computation of csp")
+    parser.add_argument("--trials", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--chunk", type=int, default=16, help="trials per chunk")
+    parser.add_argument("--output", type=str, default=None, help="optional CSV file for the results")
+    args = parser.parse_args()
+
+    rows = []
+    print("{:>7} {:>14} {:>14} {:>14}".format("trials", "per-trial (s)", "chunked (s)", "float32 (s)"))
+    for n_trials in args.trials:
+        X = np.random.randn(n_trials, args.channels, args.samples)
+
+        start = time.perf_counter()
+        reference = per_trial_mean_covariance(X)
+        per_trial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cov = mean_covariance_matrix(X, chunk_size=args.chunk)
+        chunked = time.perf_counter() - start
+        assert np.allclose(cov, reference)
+
+        start = time.perf_counter()
+        mean_covariance_matrix(X, chunk_size=args.chunk, dtype=np.float32)
+        chunked_float32 = time.perf_counter() - start
+
+        rows.append((n_trials, per_trial, chunked, chunked_float32))
+        print("{:>7} {:>14.3f} {:>14.3f} {:>14.3f}".format(*rows[-1]))
+
+    if args.output is not None:
+        np.savetxt(args.output, np.array(rows), delimiter=",", fmt=["%d", "%.4f", "%.4f", "%.4f"],
+                   header="trials,per_trial_s,chunked_s,chunked_float32_s", comments="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import csv
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "clients"))
+from utils import DataLogger
+
+
+def write_dict_writer(path: str, ch_names: list, batches: list):
+    """The former per-row logging path of the EEG visualizer and the motor imagery task"""
+    with open(path, "w", newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=["samplestamps"] + ch_names)
+        writer.writeheader()
+        for samplestamps, samples in batches:
+            data = {"samplestamps": samplestamps.tolist()}
+            for i, ch in enumerate(ch_names):
+                data[ch] = samples[:, i].tolist()
+
+            num_rows = len(next(iter(data.values())))
+            for i in range(num_rows):
+                row = {key: value[i] for key, value in data.items()}
+                writer.writerow(row)
+
+
+def write_data_logger(path: str, ch_names: list, batches: list, fmt: str, fsync: bool):
+    with DataLogger(path, ch_names, fmt=fmt, fsync=fsync) as logger:
+        for samplestamps, samples in batches:
+            logger.write(samplestamps, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the csv.DictWriter logging path with DataLogger")
+    parser.add_argument("--channels", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--batch", type=int, default=10, help="samples per batch")
+    parser.add_argument("--seconds", type=float, default=20, help="seconds of data to log")
+    parser.add_argument("--sfreq", type=int, default=500, help="sampling rate of the simulated stream")
+    parser.add_argument("--output", type=str, default=None, help="optional CSV file for the results")
+    args = parser.parse_args()
+
+    n_batches = int(args.seconds * args.sfreq / args.batch)
+    directory = tempfile.mkdtemp()
+    rows = []
+    print("{:>8} {:>22} {:>12} {:>10}".format("channels", "writer", "rows/s", "realtime"))
+    try:
+        for n_channels in args.channels:
+            ch_names = ["C{}".format(i + 1) for i in range(n_channels)]
+            stamps = np.arange(n_batches * args.batch, dtype=np.int64)
+            batches = [(stamps[i * args.batch:(i + 1) * args.batch],
+                        (400 + 50 * np.random.randn(args.batch, n_channels)).astype(np.float32).astype(np.float64))
+                       for i in range(n_batches)]
+
+            writers = [("csv.DictWriter", lambda path: write_dict_writer(path, ch_names, batches)),
+                       ("DataLogger csv", lambda path: write_data_logger(path, ch_names, batches, "csv", False)),
+                       ("DataLogger npy", lambda path: write_data_logger(path, ch_names, batches, "npy", False)),
+                       ("DataLogger npy+fsync", lambda path: write_data_logger(path, ch_names, batches, "npy", True))]
+            for name, write in writers:
+                start = time.perf_counter()
+                write(os.path.join(directory, "data.csv"))
+                elapsed = time.perf_counter() - start
+                rows_per_second = n_batches * args.batch / elapsed
+                rows.append([n_channels, name, rows_per_second])
+                print("{:>8} {:>22} {:>12.0f} {:>9.1f}x".format(n_channels, name, rows_per_second, rows_per_second / args.sfreq))
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["channels", "writer", "rows_per_second"])
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
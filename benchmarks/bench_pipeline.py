@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+import zmq
+
+# The stand-in BaseZmqProcessor comes first, so the real processors run without NeuroWorks
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "benchmarks", "stand_in"))
+sys.path.append(os.path.join(ROOT, "processors"))
+sys.path.append(os.path.join(ROOT, "clients"))
+from BaseZmqProcessor import BaseZmqProcessor
+
+PROCESSORS = ["PublisherZmqProcessor", "PipelineZmqProcessor", "UnityZmqProcessor"]
+
+
+def load_source(recording: str, n_channels: int, n_samples: int):
+    """Build the replayed stream from a recording, or synthetic EEG without one
+
+    A recording (a CSV with a samplestamps column, e.g. clients/logs/eeg_visualizer/*.csv) is
+    repeated to `n_samples` rows and its channels tiled to `n_channels`. The first channel is
+    replaced by the samplestamps, which the clients read back to match each message to the time
+    it was handed to `process`, whatever the message format.
+
+    Returns:
+        tuple: (samplestamps, samples) of shapes (n_samples,) and (n_samples, n_channels), float32 samples
+    """
+    if recording:
+        import pandas as pd
+        data = pd.read_csv(recording)
+        channels = data.drop(columns="samplestamps").to_numpy(dtype=np.float32)
+        rows = np.resize(np.arange(len(channels)), n_samples)
+        columns = np.resize(np.arange(channels.shape[1]), n_channels)
+        samples = channels[rows][:, columns]
+    else:
+        samples = (400 + 50 * np.random.randn(n_samples, n_channels)).astype(np.float32)
+    samplestamps = np.arange(n_samples, dtype=np.int64)
+    samples[:, 0] = samplestamps
+    return samplestamps, samples
+
+
+def receive(port: int, topic: str, message_format: str, done, results):
+    """Client process: receive until `done` is set and report the arrival time of every message
+
+    Binary batches are received with ClientSub, Unity's messages with a plain SUB socket, as the
+    NetMQ client does, and decoded with `json.loads` or `decode_unity_batch`.
+    """
+    keys = []
+    arrivals = []
+    start_cpu = time.process_time()
+    if message_format == "binary":
+        from client_sub import ClientSub
+        client = ClientSub(sub_port=port, req_port=port + 1, sub_topic=topic)
+        results.put("ready")
+        while not done.is_set() or client.poller.poll(0):
+            data = client.get_data(timeout=100)
+            if data is not None:
+                arrivals.append(time.time())
+                keys.append(int(data[1][0, 0]))
+        stats = client.stats
+        client.close()
+    else:
+        context = zmq.Context()
+        socket = context.socket(zmq.SUB)
+        socket.connect("tcp://localhost:{}".format(port))
+        socket.setsockopt_string(zmq.SUBSCRIBE, topic)
+        results.put("ready")
+        from wire_format import decode_unity_batch
+        stats = {"messages": 0}
+        while not done.is_set() or socket.poll(0):
+            if not socket.poll(100):
+                continue
+            _, message = socket.recv_multipart()
+            arrivals.append(time.time())
+            if message_format == "unity-binary":
+                keys.append(decode_unity_batch(message)[0])
+            else:
+                samples = json.loads(message)["samples"]
+                keys.append(int(samples[0][0] if isinstance(samples[0], list) else samples[0]))
+            stats["messages"] += 1
+        socket.close(linger=0)
+        context.term()
+    results.put({"keys": keys, "arrivals": arrivals, "cpu_s": time.process_time() - start_cpu,
+                 "client_stats": {key: value for key, value in stats.items() if key != "latency_ms"}})
+
+
+def run(processor_name: str, samplestamps, samples, batch_size: int, sfreq: float, port: int, unity_format: str = "json") -> dict:
+    """Replay the stream through one processor at the sampling rate and measure it end to end
+
+    Returns:
+        dict: latency percentiles, throughput, processor and client CPU, and the processor's stage timings
+    """
+    module = __import__(processor_name)
+    kwargs = {"batch_size": batch_size, "pub_port": port, "rep_port": port + 1, "snapshot_port": port + 2, "stats_interval": 0}
+    message_format = "binary"
+    if processor_name == "UnityZmqProcessor":
+        del kwargs["snapshot_port"]  # Unity does not serve snapshots
+        kwargs.update(unity_format=unity_format, channels=list(range(samples.shape[1])))
+        message_format = "unity-binary" if unity_format == "binary" else "json"
+    processor = getattr(module, processor_name)(**kwargs)
+
+    # Spawned rather than forked, the processor's ZeroMQ context must not be copied into the client
+    spawn = multiprocessing.get_context("spawn")
+    done = spawn.Event()
+    results = spawn.Queue()
+    client = spawn.Process(target=receive, args=(port, processor.pub_topic, message_format, done, results))
+    client.start()
+    results.get()
+    time.sleep(0.5)  # let the subscription reach the publisher
+
+    n_batches = len(samplestamps) // batch_size
+    n_channels = samples.shape[1]
+    calls = {}
+    call_times = np.empty(n_batches)
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for i in range(n_batches):
+        # Hand each batch over when its last sample would have been acquired
+        delay = start + (i + 1) * batch_size / sfreq - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        batch = slice(i * batch_size, (i + 1) * batch_size)
+        calls[int(samplestamps[batch][0])] = time.time()
+        call_start = time.perf_counter()
+        processor.process(n_channels, samplestamps[batch], samples[batch])
+        call_times[i] = time.perf_counter() - call_start
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+
+    time.sleep(0.2)
+    done.set()
+    result = results.get()
+    client.join()
+    if hasattr(processor, "worker"):
+        processor.stop()
+    processor.pub_socket.close(linger=0)
+    if hasattr(processor, "info_service"):
+        processor.info_service.stop()
+    if getattr(processor, "snapshot_socket", None) is not None:
+        processor.snapshot_socket.close(linger=0)
+
+    latencies = np.array([arrival - calls[key] for key, arrival in zip(result["keys"], result["arrivals"])]) * 1000
+    return {"processor": processor_name if processor_name != "UnityZmqProcessor" else "{} ({})".format(processor_name, unity_format),
+            "batches": n_batches,
+            "received": len(latencies),
+            "samples_per_s": n_batches * batch_size / wall,
+            "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p90": float(np.percentile(latencies, 90)),
+                           "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())} if len(latencies) else None,
+            "processor_cpu_us_per_batch": cpu / n_batches * 1e6,
+            # Time the acquisition callback is held by `process`
+            "process_call_us": {"p50": float(np.percentile(call_times, 50)) * 1e6, "p99": float(np.percentile(call_times, 99)) * 1e6},
+            "client_cpu_us_per_batch": result["cpu_s"] / max(len(latencies), 1) * 1e6,
+            "stages": processor.instrumentation.summary()["stages"],
+            "client_stats": result["client_stats"]}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a stream through the processors and measure it up to the clients")
+    parser.add_argument("--processors", nargs="+", default=PROCESSORS, choices=PROCESSORS, help="processors to run")
+    parser.add_argument("--channels", type=int, default=32, help="channels per sample")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100], help="samples per batch")
+    parser.add_argument("--sfreq", type=float, default=1024, help="sampling rate of the replayed stream in Hz")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of stream per run")
+    parser.add_argument("--unity-formats", nargs="+", default=["json", "binary"], choices=["json", "binary"], help="message formats of UnityZmqProcessor")
+    parser.add_argument("--recording", type=str, default=None, help="CSV recording to replay instead of synthetic data")
+    parser.add_argument("--port", type=int, default=7000, help="first of the ports used by the processors")
+    parser.add_argument("--output", type=str, default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    samplestamps, samples = load_source(args.recording, args.channels, int(args.duration * args.sfreq))
+    BaseZmqProcessor.study_info = {"channelNames": ["C{}".format(i + 1) for i in range(args.channels)], "samplingRate": args.sfreq}
+
+    runs = []
+    port = args.port
+    print("{:>29} {:>6} {:>9} {:>9} {:>9} {:>9} {:>12} {:>12} {:>12}".format(
+        "processor", "batch", "received", "p50 ms", "p99 ms", "max ms", "call p99 us", "proc us/b", "client us/b"))
+    # Every processor and format, with UnityZmqProcessor publishing all the channels
+    configs = [(name, unity_format) for name in args.processors
+               for unity_format in (args.unity_formats if name == "UnityZmqProcessor" else [None])]
+    for processor_name, unity_format in configs:
+        for batch_size in args.batch_sizes:
+            # Each run binds new sockets on fresh ports, a failed run may leave its ports bound
+            port += 10
+            try:
+                result = run(processor_name, samplestamps, samples, batch_size, args.sfreq, port - 10, unity_format)
+            except Exception as e:
+                print("{:>29} {:>6} failed: {}".format(processor_name, batch_size, e))
+                runs.append({"processor": processor_name, "batch_size": batch_size, "error": str(e)})
+                continue
+            result["batch_size"] = batch_size
+            runs.append(result)
+            latency = result["latency_ms"] or {"p50": np.nan, "p99": np.nan, "max": np.nan}
+            print("{:>29} {:>6} {:>9} {:>9.3f} {:>9.3f} {:>9.3f} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                result["processor"], batch_size, "{}/{}".format(result["received"], result["batches"]),
+                latency["p50"], latency["p99"], latency["max"], result["process_call_us"]["p99"],
+                result["processor_cpu_us_per_batch"], result["client_cpu_us_per_batch"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                       "config": vars(args), "runs": runs}, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import time
+import json
+import argparse
+import platform
+import multiprocessing
+from multiprocessing import resource_tracker
+import numpy as np
+
+# Reuses the stand-in SDK setup and the replayed stream of the pipeline benchmark
+from bench_pipeline import BaseZmqProcessor, load_source, git_commit
+from PublisherZmqProcessor import PublisherZmqProcessor
+
+TRANSPORTS = ["tcp", "shm"]
+
+
+def receive(port: int, transport: str, done, results):
+    """Client process: receive until `done` is set, sum every batch and report when it arrived
+
+    The sum reads every sample once, so the zero-copy views of the shared-memory transport are
+    compared with the TCP batches on the same work rather than on receiving alone.
+    """
+    from client_sub import ClientSub
+    # Spawned processes share the benchmark's resource tracker, which would then lose track of the
+    # processor's rings; start the client's own, as an independent client process has
+    resource_tracker._resource_tracker._fd = None
+    resource_tracker._resource_tracker._pid = None
+    client = ClientSub(sub_port=port, req_port=port + 1, snapshot_port=port + 2, shared_memory=transport == "shm")
+    results.put("ready")
+    keys = []
+    arrivals = []
+    checksum = 0.0
+    start_cpu = time.process_time()
+    while not done.is_set() or client.poller.poll(0):
+        data = client.get_data(timeout=100)
+        if data is not None:
+            samplestamps, samples, _ = data
+            checksum += float(samples.sum())
+            arrivals.append(time.time())
+            keys.append(int(samplestamps[0]))
+    cpu = time.process_time() - start_cpu
+    stats = {key: value for key, value in client.stats.items() if key != "latency_ms"}
+    client.close()
+    results.put({"keys": keys, "arrivals": arrivals, "cpu_s": cpu, "client_stats": stats})
+
+
+def run(transport: str, samplestamps, samples, batch_size: int, sfreq: float, port: int, n_clients: int) -> dict:
+    """Replay the stream through PublisherZmqProcessor to `n_clients` subscribers on one transport
+
+    Returns:
+        dict: latency percentiles over all the clients, processor CPU and mean client CPU per batch
+    """
+    processor = PublisherZmqProcessor(batch_size=batch_size, pub_port=port, rep_port=port + 1, snapshot_port=port + 2,
+                                      history_seconds=0, stats_interval=0, shared_memory=transport == "shm")
+
+    spawn = multiprocessing.get_context("spawn")
+    done = spawn.Event()
+    results = spawn.Queue()
+    clients = [spawn.Process(target=receive, args=(port, transport, done, results)) for _ in range(n_clients)]
+    for client in clients:
+        client.start()
+    for _ in clients:
+        results.get()
+    time.sleep(0.5)  # let the subscriptions reach the publisher
+
+    n_batches = len(samplestamps) // batch_size
+    n_channels = samples.shape[1]
+    calls = {}
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for i in range(n_batches):
+        delay = start + (i + 1) * batch_size / sfreq - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        batch = slice(i * batch_size, (i + 1) * batch_size)
+        calls[int(samplestamps[batch][0])] = time.time()
+        processor.process(n_channels, samplestamps[batch], samples[batch])
+    cpu = time.process_time() - start_cpu
+
+    time.sleep(0.2)
+    done.set()
+    client_results = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+    processor.pub_socket.close(linger=0)
+    processor.info_service.stop()
+    processor.snapshot_socket.close(linger=0)
+    processor.close_rings()
+
+    latencies = np.array([arrival - calls[key] for result in client_results
+                          for key, arrival in zip(result["keys"], result["arrivals"])]) * 1000
+    received = [len(result["keys"]) for result in client_results]
+    return {"transport": transport,
+            "batches": n_batches,
+            "received": min(received),
+            "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p99": float(np.percentile(latencies, 99)),
+                           "max": float(latencies.max())} if len(latencies) else None,
+            "processor_cpu_us_per_batch": cpu / n_batches * 1e6,
+            "client_cpu_us_per_batch": float(np.mean([result["cpu_s"] / max(len(result["keys"]), 1) for result in client_results])) * 1e6,
+            "stages": processor.instrumentation.summary()["stages"],
+            "client_stats": [result["client_stats"] for result in client_results]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the TCP and shared-memory transports between a processor and clients on one host")
+    parser.add_argument("--transports", nargs="+", default=TRANSPORTS, choices=TRANSPORTS, help="transports to run")
+    parser.add_argument("--channels", type=int, nargs="+", default=[64, 256, 1024], help="channels per sample")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100], help="samples per batch")
+    parser.add_argument("--clients", type=int, default=3, help="subscribers per run, e.g. visualizer, logger and game")
+    parser.add_argument("--sfreq", type=float, default=2048, help="sampling rate of the replayed stream in Hz")
+    parser.add_argument("--duration", type=float, default=3, help="seconds of stream per run")
+    parser.add_argument("--port", type=int, default=7400, help="first of the ports used by the processors")
+    parser.add_argument("--output", type=str, default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    runs = []
+    port = args.port
+    print("{:>9} {:>8} {:>6} {:>9} {:>9} {:>9} {:>9} {:>12} {:>12}".format(
+        "transport", "channels", "batch", "received", "p50 ms", "p99 ms", "max ms", "proc us/b", "client us/b"))
+    for n_channels in args.channels:
+        samplestamps, samples = load_source(None, n_channels, int(args.duration * args.sfreq))
+        BaseZmqProcessor.study_info = {"channelNames": ["C{}".format(i + 1) for i in range(n_channels)], "samplingRate": args.sfreq}
+        for batch_size in args.batch_sizes:
+            for transport in args.transports:
+                port += 10
+                result = run(transport, samplestamps, samples, batch_size, args.sfreq, port - 10, args.clients)
+                result.update(channels=n_channels, batch_size=batch_size)
+                runs.append(result)
+                latency = result["latency_ms"] or {"p50": np.nan, "p99": np.nan, "max": np.nan}
+                print("{:>9} {:>8} {:>6} {:>9} {:>9.3f} {:>9.3f} {:>9.3f} {:>12.1f} {:>12.1f}".format(
+                    transport, n_channels, batch_size, "{}/{}".format(result["received"], result["batches"]),
+                    latency["p50"], latency["p99"], latency["max"],
+                    result["processor_cpu_us_per_batch"], result["client_cpu_us_per_batch"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                       "config": vars(args), "runs": runs}, file, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import zmq
+
+# The benchmark exercises the real encoder (processors) and the real client decoder (clients)
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "processors"))
+sys.path.append(os.path.join(ROOT, "clients"))
+from wire_format import encode_batch, decode_batch
+
+# Same channel/batch grid as the recordings in clients/logs/eeg_visualizer
+CHANNELS = [1, 2, 4, 8, 16, 32, 64, 128]
+BATCH_SIZES = [1, 10, 50, 100, 200]
+
+
+def make_batch(n_channels: int, batch_size: int):
+    """Create a synthetic batch shaped like the NeuroWorks stream
+
+    Args:
+        n_channels (int): number of channels
+        batch_size (int): number of samples in the batch
+
+    Returns:
+        tuple: (samplestamps, samples) as the lists handed to `process`
+    """
+    samplestamps = list(range(83352194, 83352194 + batch_size))
+    samples = (400 + 50 * np.random.randn(batch_size, n_channels)).astype(np.float32)
+    return samplestamps, [list(sample) for sample in samples]
+
+
+def bench_round_trip(push: zmq.Socket, pull: zmq.Socket, wire_format: str, samplestamps, samples, n_iter: int) -> float:
+    """Time publish-side encoding, a loopback send and client-side decoding
+
+    Returns:
+        float: mean time per batch in microseconds
+    """
+    start = time.perf_counter()
+    for seq in range(n_iter):
+        frames = encode_batch(samplestamps, samples, time.time(), seq, wire_format)
+        push.send_multipart([b"ProcessedData"] + frames, copy=False)
+        topic, *frames = pull.recv_multipart(copy=False)
+        decode_batch(frames)
+    return (time.perf_counter() - start) / n_iter * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the binary and pickle wire formats")
+    parser.add_argument("--iterations", type=int, default=2000, help="batches sent per grid point")
+    parser.add_argument("--output", type=str, default=None, help="optional CSV file for the results")
+    args = parser.parse_args()
+
+    context = zmq.Context()
+    push = context.socket(zmq.PAIR)
+    port = push.bind_to_random_port("tcp://127.0.0.1")
+    pull = context.socket(zmq.PAIR)
+    pull.connect("tcp://127.0.0.1:{}".format(port))
+
+    rows = []
+    print("{:>8} {:>6} {:>12} {:>12} {:>8}".format("channels", "batch", "pickle (us)", "binary (us)", "speedup"))
+    try:
+        for n_channels in CHANNELS:
+            for batch_size in BATCH_SIZES:
+                samplestamps, samples = make_batch(n_channels, batch_size)
+                results = {}
+                for wire_format in ("pickle", "binary"):
+                    bench_round_trip(push, pull, wire_format, samplestamps, samples, n_iter=50)  # warm up
+                    results[wire_format] = bench_round_trip(push, pull, wire_format, samplestamps, samples, args.iterations)
+
+                speedup = results["pickle"] / results["binary"]
+                rows.append((n_channels, batch_size, results["pickle"], results["binary"], speedup))
+                print("{:>8} {:>6} {:>12.1f} {:>12.1f} {:>7.2f}x".format(*rows[-1]))
+    finally:
+        push.close()
+        pull.close()
+        context.term()
+
+    if args.output is not None:
+        np.savetxt(args.output, np.array(rows), delimiter=",", fmt=["%d", "%d", "%.3f", "%.3f", "%.3f"],
+                   header="channels,batch_size,pickle_us,binary_us,speedup", comments="")
+
+
+if __name__ == "__main__":
+    main()
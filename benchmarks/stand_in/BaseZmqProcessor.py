@@ -0,0 +1,31 @@
+import time
+import zmq
+
+class BaseZmqProcessor():
+    """Stand-in for the NeuroWorks SDK base processor, for benchmarks only
+
+    Provides what the processors in `processors` use from the SDK (a ZeroMQ context, the info
+    socket, `request_info` and the call timers) without connecting to NeuroWorks. The benchmark
+    calls `process` itself with the batches it replays; the study info returned by `request_info`
+    is `study_info`, which the benchmark sets to match the replayed stream.
+    """
+
+    study_info = {"channelNames": ["C{}".format(i + 1) for i in range(32)], "samplingRate": 1024.0}
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source, unused. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from, unused. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests, unused. Defaults to 5598.
+        """
+        self.sub_ip = sub_ip
+        self.batch_size = batch_size
+        self.context: zmq.Context = zmq.Context.instance()
+        self.info_socket = None
+        self.curr_time = time.time()
+        self.last_time = self.curr_time
+
+    def request_info(self, socket) -> dict:
+        return dict(self.study_info)
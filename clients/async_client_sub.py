@@ -0,0 +1,239 @@
+import json
+import time
+import asyncio
+import zmq
+import zmq.asyncio
+from zmq import Socket
+import numpy as np
+
+from client_sub import ClientSub
+from stream_history import SNAPSHOT_REQUEST, SNAPSHOT_REPLY
+
+class AsyncClientSub(ClientSub):
+    """asyncio version of ClientSub
+
+    Receives on `zmq.asyncio` sockets, so several subscriptions (raw data, predictions, events...)
+    can be awaited side by side on one event loop, next to the user interface, without threads.
+    Decoding and the stream counters in `stats` are the same as ClientSub's; `get_channel_names`,
+    `get_data` and `drain` are coroutines, and the client is an async iterator of batches:
+
+        async for samplestamps, samples, timestamp in client:
+            ...
+    """
+
+    def __init__(self, sub_ip: str = "localhost", sub_port: int = 6000, req_port: int = 6001, sub_topic: str = "ProcessedData",
+                 conflate: bool = False, fill_gaps: int = 0, snapshot_port: int = 6002, context: zmq.asyncio.Context = None,
+                 shared_memory: bool = False, channel_group: str = None):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            sub_port (int, optional): Port to subscribe to receive batch processed data. Defaults to 6000.
+            req_port (int, optional): Port to request the channel names from. Defaults to 6001.
+            sub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            conflate(bool, optional): Only keep the latest batch: `get_data` discards the batches that were already waiting. Defaults to False.
+            fill_gaps(int, optional): Fill gaps of up to this many missing samplestamps with NaN samples, so the data stays aligned to sample time. Defaults to 0 (no filling).
+            snapshot_port(int, optional): Port to fetch the recent history of the topic from, see `get_snapshot`. Defaults to 6002.
+            context (zmq.asyncio.Context, optional): Context to create the sockets in. Defaults to the shared instance, so all the subscriptions use one context.
+            shared_memory(bool, optional): Read the batches from the publisher's shared-memory ring instead of over TCP, see ClientSub. Defaults to False.
+            channel_group(str, optional): Receive only the channels of this group of the publisher's `channel_groups`, see ClientSub. Defaults to None.
+        """
+        # The sockets are created here on the asyncio context, instead of by ClientSub's constructor
+        self.setup_state(sub_ip, sub_port, req_port, sub_topic, conflate, fill_gaps, snapshot_port, shared_memory, channel_group)
+        self.closed = False
+
+        self.context: zmq.asyncio.Context = context if context is not None else zmq.asyncio.Context.instance()
+
+        self.sub_socket: Socket = self.context.socket(zmq.SUB)
+        self.sub_socket.connect("tcp://{}:{}".format(self.sub_ip, self.sub_port))
+        self.sub_socket.setsockopt_string(zmq.SUBSCRIBE, self.subscription())
+        print(f"Connected SUB socket to tcp://{self.sub_ip}:{self.sub_port} with topic '{self.subscription()}'")
+
+        self.req_socket: Socket = self.context.socket(zmq.REQ)
+        self.req_socket.connect("tcp://{}:{}".format(self.sub_ip, self.req_port))
+        print(f"Connected REQ socket to tcp://{self.sub_ip}:{self.req_port}")
+
+    async def get_channel_names(self, timeout: int = 1000):
+        """Request the channel names from the publisher, retrying until they arrive
+
+        Args:
+            timeout (int, optional): Time to wait for each reply in milliseconds before asking again. Defaults to 1000.
+
+        Returns:
+            list: the channel names
+        """
+        while self.ch_names is None:
+            try:
+                print("Requesting channel names...")
+                await self.req_socket.send("get_channel_names".encode())
+                if await self.req_socket.poll(timeout):
+                    ch_names = await self.req_socket.recv_string()
+                    ch_names = ch_names.split('\n')
+                    print("Sent request!")
+                    if self.channel_group is not None:
+                        reply = await self.request("get_config", timeout)
+                        ch_names = self.group_channel_names(ch_names, json.loads(reply) if reply is not None else None)
+                    self.ch_names = ch_names
+                else:
+                    # A REQ socket cannot send again before it gets its reply, start over with a new one
+                    self.req_socket.close(linger=0)
+                    self.req_socket = self.context.socket(zmq.REQ)
+                    self.req_socket.connect("tcp://{}:{}".format(self.sub_ip, self.req_port))
+            except zmq.ZMQError as e:
+                print(f"Error getting channel names: {e}")
+                await asyncio.sleep(0.1)
+        return self.ch_names
+
+    async def request(self, request: str, timeout: int = 1000) -> str:
+        """Send a request to the publisher's info service and return its reply, or None if none arrived in time"""
+        await self.req_socket.send(request.encode())
+        if not await self.req_socket.poll(timeout):
+            self.req_socket.close(linger=0)
+            self.req_socket = self.context.socket(zmq.REQ)
+            self.req_socket.connect("tcp://{}:{}".format(self.sub_ip, self.req_port))
+            print("No reply to {} from tcp://{}:{}".format(request, self.sub_ip, self.req_port))
+            return None
+        reply = await self.req_socket.recv_string()
+        if reply.startswith("error: "):
+            print("Request {} failed: {}".format(request, reply[len("error: "):]))
+            return None
+        return reply
+
+    async def get_info(self, timeout: int = 1000) -> dict:
+        """Request the study info and the publisher's state in one reply, see ClientSub.get_info"""
+        reply = await self.request("get_info", timeout)
+        return json.loads(reply) if reply is not None else None
+
+    async def get_snapshot(self, timeout: int = 1000):
+        """Fetch the publisher's recent history of the topic, to call once before reading the live stream
+
+        Args:
+            timeout (int, optional): Maximum time to wait for the live stream, then for the reply, in milliseconds. Defaults to 1000.
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp) of the concatenated history, or None if there is none
+        """
+        # Wait until the subscription is active, as in ClientSub.get_snapshot
+        await self.sub_socket.poll(timeout)
+
+        if self.snapshot_socket is None:
+            self.snapshot_socket = self.context.socket(zmq.DEALER)
+            self.snapshot_socket.setsockopt(zmq.LINGER, 0)
+            self.snapshot_socket.connect("tcp://{}:{}".format(self.sub_ip, self.snapshot_port))
+
+        # Discard the reply to an earlier request that timed out
+        while await self.snapshot_socket.poll(0):
+            await self.snapshot_socket.recv_multipart()
+
+        await self.snapshot_socket.send_multipart([SNAPSHOT_REQUEST, self.sub_topic.encode()])
+        if not await self.snapshot_socket.poll(timeout):
+            print("No snapshot received from tcp://{}:{}".format(self.sub_ip, self.snapshot_port))
+            return None
+
+        reply, topic, *frames = await self.snapshot_socket.recv_multipart(copy=False)
+        if reply.bytes != SNAPSHOT_REPLY or not frames:
+            return None
+        return self._decode(topic, frames)
+
+    async def _recv(self, flags: int = 0):
+        """Receive and decode one batch, raises zmq.Again when `flags` is zmq.NOBLOCK and nothing is pending"""
+        topic, *frames = await self.sub_socket.recv_multipart(flags=flags, copy=False)
+        return self._decode(topic, frames)
+
+    async def get_data(self, timeout: int = None):
+        """Receive the next batch
+
+        Args:
+            timeout (int, optional): Maximum time to wait in milliseconds, 0 to return immediately. Defaults to None (wait forever).
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp), or None if no batch arrived in time or on a socket error. In conflate mode, the newest pending batch.
+                Messages that are discarded (duplicates, decoding errors) do not end the wait.
+        """
+        deadline = time.monotonic() + timeout / 1000 if timeout is not None else None
+        try:
+            while True:
+                if not await self.sub_socket.poll(self._remaining(deadline)):
+                    return None
+
+                data = await self._recv()
+                if self.conflate:
+                    # Keep only the newest of the batches that are already waiting
+                    while True:
+                        try:
+                            newer = await self._recv(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if newer is not None:
+                            self.stats["conflated"] += data is not None
+                            data = newer
+
+                if data is not None:
+                    return data
+        except zmq.ZMQError as e:
+            if not self.closed:
+                print(f"Error fetching data: {e}")
+            return None
+
+    async def drain(self):
+        """Receive every batch that is already waiting, without waiting for new ones
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp of the newest batch) with the batches concatenated, or None if nothing was waiting
+        """
+        batches = []
+        while True:
+            try:
+                data = await self._recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if data is not None:
+                batches.append(data)
+
+        if not batches:
+            return None
+        if len(batches) == 1:
+            return batches[0]
+        return (np.concatenate([batch[0] for batch in batches]),
+                np.concatenate([batch[1] for batch in batches]),
+                batches[-1][2])
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.closed:
+            data = await self.get_data()
+            if data is not None:
+                return data
+        raise StopAsyncIteration
+
+    def close(self):
+        """Close the sockets and the shared-memory rings and end the iteration; the shared context is left open"""
+        self.closed = True
+        for socket in (self.sub_socket, self.req_socket, self.snapshot_socket):
+            if socket is not None:
+                socket.close(linger=0)
+        self.close_rings()
+
+
+async def main():
+    # Raw data and decoder predictions on one event loop
+    data_client = AsyncClientSub(sub_port=6000, sub_topic="ProcessedData")
+    pred_client = AsyncClientSub(sub_port=6000, sub_topic="Predictions", conflate=True)
+
+    async def print_batches(client):
+        async for samplestamps, samples, timestamp in client:
+            print(f"{client.sub_topic}: {len(samples)} samples, latency {client.stats['latency_ms']:.2f} ms")
+
+    try:
+        await data_client.get_channel_names()
+        await asyncio.gather(print_batches(data_client), print_batches(pred_client))
+    finally:
+        data_client.close()
+        pred_client.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Subscriber stopped by user")
@@ -1,29 +1,42 @@
+import os
+import sys
 import zmq
-import pickle
-import struct
 from zmq import Socket
 import time
+import json
+import numpy as np
+
+# The wire format (and the other modules shared with the processors) lives in the processors folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "processors"))
+from wire_format import decode_batch
+from stream_history import SNAPSHOT_REQUEST, SNAPSHOT_REPLY
+from shared_ring import SharedRingReader, SHM_TOPIC_PREFIX, decode_notification
+from channel_groups import group_topic, resolve_group
 
 class ClientSub():
-    def __init__(self, sub_ip: str = "localhost", sub_port: int = 6000, req_port: int = 6001, sub_topic: str = "ProcessedData"):
+    def __init__(self, sub_ip: str = "localhost", sub_port: int = 6000, req_port: int = 6001, sub_topic: str = "ProcessedData", conflate: bool = False,
+                 fill_gaps: int = 0, snapshot_port: int = 6002, shared_memory: bool = False, channel_group: str = None):
         """Class constructor
         Args:
             sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
             sub_port (int, optional): Port to subscribe to receive batch processed data. Defaults to 5000.
             sub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            conflate(bool, optional): Only keep the latest batch: `get_data` discards the batches that were already waiting. Defaults to False.
+            fill_gaps(int, optional): Fill gaps of up to this many missing samplestamps with NaN samples, so the data stays aligned to sample time. Defaults to 0 (no filling).
+            snapshot_port(int, optional): Port to fetch the recent history of the topic from, see `get_snapshot`. Defaults to 6002.
+            shared_memory(bool, optional): Read the batches from the publisher's shared-memory ring, as views, instead of over TCP. Only on the publisher's host, and the publisher must run with `shared_memory=True`. Defaults to False.
+            channel_group(str, optional): Receive only the channels of this group of the publisher's `channel_groups`, on the topic "<channel_group>/<sub_topic>". Defaults to None (all the channels).
         """
-        self.sub_ip = sub_ip
-        self.sub_port = sub_port
-        self.sub_topic = sub_topic
-        self.req_port = req_port
+        self.setup_state(sub_ip, sub_port, req_port, sub_topic, conflate, fill_gaps, snapshot_port, shared_memory, channel_group)
 
         self.context: zmq.Context = zmq.Context()
         
         try:
             self.sub_socket: Socket = self.context.socket(zmq.SUB)
             self.sub_socket.connect("tcp://{}:{}".format(self.sub_ip, self.sub_port))
-            self.sub_socket.setsockopt_string(zmq.SUBSCRIBE, self.sub_topic)
-            print(f"Connected SUB socket to tcp://{self.sub_ip}:{self.sub_port} with topic '{self.sub_topic}'")
+            # In shared-memory mode only the notifications go through the socket
+            self.sub_socket.setsockopt_string(zmq.SUBSCRIBE, self.subscription())
+            print(f"Connected SUB socket to tcp://{self.sub_ip}:{self.sub_port} with topic '{self.subscription()}'")
         except Exception as e:
             print(f"Error connecting SUB socket: {e}")
 
@@ -34,7 +47,31 @@ class ClientSub():
         except Exception as e:
             print(f"Error connecting REQ socket: {e}")
         
+        self.poller = zmq.Poller()
+        self.poller.register(self.sub_socket, zmq.POLLIN)
+
+    def setup_state(self, sub_ip: str, sub_port: int, req_port: int, sub_topic: str, conflate: bool, fill_gaps: int,
+                    snapshot_port: int, shared_memory: bool, channel_group: str):
+        """Set the attributes that do not depend on the sockets, shared with AsyncClientSub (see the constructor for the arguments)"""
+        self.sub_ip = sub_ip
+        self.sub_port = sub_port
+        self.channel_group = channel_group
+        self.sub_topic = group_topic(channel_group, sub_topic) if channel_group is not None else sub_topic
+        self.req_port = req_port
+        self.snapshot_port = snapshot_port
+        self.snapshot_socket = None
+        self.shared_memory = shared_memory
+        self.rings = {}  # shared-memory ring read on each topic
+        self.conflate = conflate
+        self.fill_gaps = fill_gaps
+
         self.ch_names = None
+        self.last_seq = None
+        self.reset_stats()
+
+    def subscription(self) -> str:
+        """Return the topic the SUB socket subscribes to"""
+        return SHM_TOPIC_PREFIX + self.sub_topic if self.shared_memory else self.sub_topic
 
     def get_channel_names(self):
         while self.ch_names is None:
@@ -42,41 +79,317 @@ class ClientSub():
                 print("Requesting channel names...")
                 self.req_socket.send("get_channel_names".encode())
                 ch_names = self.req_socket.recv_string()
-                self.ch_names = ch_names.split('\n')
+                ch_names = ch_names.split('\n')
                 print("Sent request!")
+                if self.channel_group is not None:
+                    reply = self.request("get_config")
+                    ch_names = self.group_channel_names(ch_names, json.loads(reply) if reply is not None else None)
+                self.ch_names = ch_names
                 # print(f"Received channel names: {self.ch_names}")
             except Exception as e:
                 print(f"Error getting channel names: {e}")
                 time.sleep(0.1)
 
-    def get_data(self):
+    def group_channel_names(self, ch_names: list, config: dict) -> list:
+        """Return the names of the channels of `channel_group`, from the publisher's config
+
+        Args:
+            ch_names (list): all the channel names of the study
+            config (dict): reply to "get_config", or None if it failed
+
+        Returns:
+            list: names of the group's channels, in the order of the received samples; all the names if the config is missing
+        """
+        if config is None:
+            print("Could not get the channels of group {}, using all the channel names".format(self.channel_group))
+            return ch_names
+        groups = config.get("channel_groups", {})
+        if self.channel_group not in groups:
+            raise KeyError("The publisher has no channel group {} (groups: {})".format(self.channel_group, ", ".join(groups)))
+        return [ch_names[i] for i in resolve_group(groups[self.channel_group], ch_names)]
+
+    def request(self, request: str, timeout: int = 1000) -> str:
+        """Send a request to the publisher's info service and return its reply
+
+        Args:
+            request (str): e.g. "get_sampling_rate", see processors/info_service.py for the list
+            timeout (int, optional): Maximum time to wait for the reply in milliseconds. Defaults to 1000.
+
+        Returns:
+            str: the reply, or None if none arrived in time
+        """
+        self.req_socket.send(request.encode())
+        if not self.req_socket.poll(timeout):
+            # A REQ socket cannot send again before it gets its reply, start over with a new one
+            self.req_socket.close(linger=0)
+            self.req_socket = self.context.socket(zmq.REQ)
+            self.req_socket.connect("tcp://{}:{}".format(self.sub_ip, self.req_port))
+            print("No reply to {} from tcp://{}:{}".format(request, self.sub_ip, self.req_port))
+            return None
+        reply = self.req_socket.recv_string()
+        if reply.startswith("error: "):
+            print("Request {} failed: {}".format(request, reply[len("error: "):]))
+            return None
+        return reply
+
+    def get_info(self, timeout: int = 1000) -> dict:
+        """Request the study info and the publisher's state in one reply
+
+        Returns:
+            dict: "channel_names", "channel_count", "sampling_rate", "seq" (batches published on each topic) and "config", or None if the request failed
+        """
+        reply = self.request("get_info", timeout)
+        return json.loads(reply) if reply is not None else None
+
+    def get_snapshot(self, timeout: int = 1000):
+        """Fetch the publisher's recent history of the topic, to call once before reading the live stream
+
+        The history ends with the newest batch published when the request is answered; the live
+        batches up to that one are then discarded as duplicates by `get_data`, so the stream
+        continues from the history without a gap.
+
+        Args:
+            timeout (int, optional): Maximum time to wait for the live stream, then for the reply, in milliseconds. Defaults to 1000.
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp) of the concatenated history, or None if there is none
+        """
+        # Wait until live batches arrive, i.e. the subscription is active, so that no batch can be
+        # published after the snapshot is taken without also being received live
+        self.poller.poll(timeout)
+
+        if self.snapshot_socket is None:
+            self.snapshot_socket = self.context.socket(zmq.DEALER)
+            self.snapshot_socket.setsockopt(zmq.LINGER, 0)
+            self.snapshot_socket.connect("tcp://{}:{}".format(self.sub_ip, self.snapshot_port))
+
+        # Discard the reply to an earlier request that timed out
+        while self.snapshot_socket.poll(0):
+            self.snapshot_socket.recv_multipart()
+
+        self.snapshot_socket.send_multipart([SNAPSHOT_REQUEST, self.sub_topic.encode()])
+        if not self.snapshot_socket.poll(timeout):
+            print("No snapshot received from tcp://{}:{}".format(self.sub_ip, self.snapshot_port))
+            return None
+
+        reply, topic, *frames = self.snapshot_socket.recv_multipart(copy=False)
+        if reply.bytes != SNAPSHOT_REPLY or not frames:
+            return None
+        return self._decode(topic, frames)
+
+    def close(self):
+        """Close the sockets, the context and the shared-memory rings"""
+        for socket in (self.sub_socket, self.req_socket, self.snapshot_socket):
+            if socket is not None:
+                socket.close(linger=0)
+        self.context.term()
+        self.close_rings()
+
+    def close_rings(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+    def reset_stats(self):
+        """Reset the stream counters
+
+        - messages, bytes: received batches and their size on the wire
+        - gaps, missed: sequence gaps and the number of batches missing in them (e.g. dropped at a high-water mark)
+        - duplicates: batches whose sequence number was already received, they are discarded
+        - restarts: times the sequence started again from 0, i.e. the publisher was restarted
+        - filled: NaN samples inserted into gaps (with `fill_gaps`)
+        - conflated: batches discarded in conflate mode
+        - errors: messages that could not be decoded
+        - overruns: shared-memory batches overwritten before they were read, they are discarded
+        - latency_ms, max_latency_ms, mean_latency_ms: time from the publisher's timestamp to decoding
+        """
+        self.stats = {"messages": 0, "bytes": 0, "gaps": 0, "missed": 0, "duplicates": 0, "restarts": 0,
+                      "filled": 0, "conflated": 0, "errors": 0, "overruns": 0,
+                      "latency_ms": 0.0, "max_latency_ms": 0.0, "mean_latency_ms": 0.0}
+        self.seqs = {}  # last sequence number received on each topic
+        self.last_samplestamps = {}  # last samplestamp received on each topic
+
+    def _recv(self, flags: int = 0):
+        """Receive and decode one batch, raises zmq.Again when `flags` is zmq.NOBLOCK and nothing is pending
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp), or None if the message could not be decoded
+        """
+        topic, *frames = self.sub_socket.recv_multipart(flags=flags, copy=False)
+        return self._decode(topic, frames)
+
+    def _decode(self, topic, frames):
+        """Decode a received message and update the stream counters
+
+        Args:
+            topic (zmq.Frame): topic frame
+            frames (list): frames after the topic
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp), or None if the message could not be decoded or is a duplicate
+        """
+        self.stats["messages"] += 1
+        self.stats["bytes"] += len(topic) + sum(len(frame) for frame in frames)
+
+        topic = topic.bytes
         try:
-            topic, samplestamps, samples, timestamp = self.sub_socket.recv_multipart()
-
-            samplestamps = pickle.loads(samplestamps)
-            samples = pickle.loads(samples)
-            timestamp = struct.unpack('d', timestamp)[0]
-            
-            # print(f"Received data for topic '{topic.decode()}': {data}")
-            
-            return samplestamps, samples, timestamp
+            if topic.startswith(SHM_TOPIC_PREFIX.encode()):
+                # Notifications share the sequence numbers (and so the counters) of the topic itself
+                topic = topic[len(SHM_TOPIC_PREFIX):]
+                data = self._read_shared(topic, frames)
+                if data is None:
+                    self.stats["overruns"] += 1
+                    return None
+                samplestamps, samples, timestamp, self.last_seq = data
+            else:
+                samplestamps, samples, timestamp, self.last_seq = decode_batch(frames)
         except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error decoding data: {e}")
+            return None
+
+        # Sequence numbers are per topic, and only present in the binary wire format
+        if self.last_seq is not None:
+            prev_seq = self.seqs.get(topic)
+            if prev_seq is not None:
+                if self.last_seq == 0 and prev_seq > 0:
+                    # The publisher starts its sequence again when it is restarted, and so may its samplestamps
+                    self.stats["restarts"] += 1
+                    self.last_samplestamps.pop(topic, None)
+                elif self.last_seq <= prev_seq:
+                    self.stats["duplicates"] += 1
+                    return None
+                elif self.last_seq > prev_seq + 1:
+                    self.stats["gaps"] += 1
+                    self.stats["missed"] += self.last_seq - prev_seq - 1
+            self.seqs[topic] = self.last_seq
+
+        if len(samplestamps) > 0:
+            prev_samplestamp = self.last_samplestamps.get(topic)
+            self.last_samplestamps[topic] = samplestamps[-1]
+            if self.fill_gaps and prev_samplestamp is not None:
+                samplestamps, samples = self._fill_gap(prev_samplestamp, samplestamps, samples)
+
+        latency_ms = (time.time() - timestamp) * 1000
+        self.stats["latency_ms"] = latency_ms
+        self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], latency_ms)
+        self.stats["mean_latency_ms"] += (latency_ms - self.stats["mean_latency_ms"]) / self.stats["messages"]
+
+        return samplestamps, samples, timestamp
+
+    def _read_shared(self, topic: bytes, frames):
+        """Read the batch announced by a shared-memory notification, as views of the ring
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp, seq), or None if the batch was already overwritten
+        """
+        seq, position, n_samples, timestamp, name = decode_notification(frames)
+        ring = self.rings.get(topic)
+        if ring is None or ring.name != name:
+            # First batch, or the publisher replaced its ring (restart, new channel count...)
+            if ring is not None:
+                ring.close()
+            ring = self.rings[topic] = SharedRingReader(name)
+        data = ring.read(position, n_samples)
+        if data is None:
+            return None
+        return data[0], data[1], timestamp, seq
+
+    def _fill_gap(self, prev_samplestamp, samplestamps, samples):
+        """Prepend NaN samples for the samplestamps missing between the previous batch and this one
+
+        Gaps longer than `fill_gaps` samples are left as they are, e.g. after a pause of the acquisition.
+        """
+        n_missing = int(samplestamps[0]) - int(prev_samplestamp) - 1
+        if n_missing <= 0 or n_missing > self.fill_gaps:
+            return samplestamps, samples
+
+        missing = np.arange(prev_samplestamp + 1, samplestamps[0], dtype=samplestamps.dtype)
+        dtype = samples.dtype if samples.dtype.kind == "f" else np.float64
+        filled = np.empty((n_missing + len(samples), samples.shape[1]), dtype=dtype)
+        filled[:n_missing] = np.nan
+        filled[n_missing:] = samples
+        self.stats["filled"] += n_missing
+        return np.concatenate([missing, samplestamps]), filled
+
+    def get_data(self, timeout: int = None):
+        """Receive the next batch
+
+        Args:
+            timeout (int, optional): Maximum time to wait in milliseconds, 0 to return immediately. Defaults to None (wait forever).
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp), or None if no batch arrived in time or on a socket error. In conflate mode, the newest pending batch.
+                Messages that are discarded (duplicates, decoding errors, overwritten shared-memory batches) do not end the wait.
+                In shared-memory mode the arrays are read-only views of the ring, overwritten about `shm_capacity` samples later; copy them to keep them longer.
+        """
+        deadline = time.monotonic() + timeout / 1000 if timeout is not None else None
+        try:
+            while True:
+                if not self.poller.poll(self._remaining(deadline)):
+                    return None
+
+                data = self._recv()
+                if self.conflate:
+                    # Keep only the newest of the batches that are already waiting
+                    while True:
+                        try:
+                            newer = self._recv(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if newer is not None:
+                            self.stats["conflated"] += data is not None
+                            data = newer
+
+                if data is not None:
+                    return data
+        except zmq.ZMQError as e:
             print(f"Error fetching data: {e}")
             return None
-    
+
+    @staticmethod
+    def _remaining(deadline: float):
+        """Return the time left until `deadline` (time.monotonic) in milliseconds for `poll`, None for no deadline"""
+        if deadline is None:
+            return None
+        return max(0, int((deadline - time.monotonic()) * 1000))
+
+    def drain(self):
+        """Receive every batch that is already waiting, without blocking
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp of the newest batch) with the batches concatenated, or None if nothing was waiting
+        """
+        batches = []
+        while True:
+            try:
+                data = self._recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if data is not None:
+                batches.append(data)
+
+        if not batches:
+            return None
+        if len(batches) == 1:
+            return batches[0]
+        return (np.concatenate([batch[0] for batch in batches]),
+                np.concatenate([batch[1] for batch in batches]),
+                batches[-1][2])
+
 if __name__ == "__main__":
     client = ClientSub(sub_port=1000)
 
     try:
         while True:
             try:
-                data = client.get_data()
+                data = client.get_data(timeout=1000)
+                if data is None:
+                    print("No data received in the last second")
 
             except KeyboardInterrupt:
                 print("Subscriber stopped by user")
                 break
 
     finally:
-        client.sub_socket.close()
-        client.req_socket.close()
-        client.context.term()
\ No newline at end of file
+        client.close()
\ No newline at end of file
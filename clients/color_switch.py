@@ -22,22 +22,25 @@ color = (255, 0, 0)  # Start with red
 running = True
 clock = pygame.time.Clock()
 
-clientSub = ClientSub(sub_port=1000)
+# Only the newest batch decides the color, so older batches are dropped instead of queued
+clientSub = ClientSub(sub_port=1000, conflate=True)
 data = []
 
 while running:
     try:
-        samplestamps, samples, _ = clientSub.get_data()
-        data = samples[:, 0] # get data from the first channel
-        
-        # Change color of the square if the mean of the data is past a threshold
-        mean = np.mean(data)
-        # print(mean)
-        threshold = 800
-        if mean > threshold:
-            print('Change!')
-            print(mean)
-            color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+        batch = clientSub.get_data(timeout=0)
+        if batch is not None:
+            samplestamps, samples, _ = batch
+            data = samples[:, 0] # get data from the first channel
+
+            # Change color of the square if the mean of the data is past a threshold
+            mean = np.mean(data)
+            # print(mean)
+            threshold = 800
+            if mean > threshold:
+                print('Change!')
+                print(mean)
+                color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
     except:
         print("Did not get data :(")
 
@@ -1,15 +1,19 @@
 import time
 import logging
-import csv
 import threading
 import queue
+from collections import deque
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from client_sub import ClientSub
-from utils import get_unique_filename, setup_logging
+from ring_buffer import RingBuffer
+from decimation import display_factor
+from utils import DataLogger, setup_logging
 
 # Define constants for file paths
 DATA_LOG_FILE = 'logs/eeg_visualizer/data.csv'
+DATA_LOG_FORMAT = 'npy'  # 'csv' for the former CSV layout
 DEBUG_LOG_FILE = 'logs/eeg_visualizer/debug.log'
 
 # Setup logging
@@ -20,29 +24,82 @@ setup_logging(DEBUG_LOG_FILE)
 
 class EEGVizualizer(ClientSub):
     def __init__(self, sub_ip="localhost", sub_port=6000, req_port=6001,
-                 sub_topic="ProcessedData"):
-        super().__init__(sub_ip, sub_port, req_port, sub_topic)
+                 sub_topic="ProcessedData", staging_size=1000, fill_gaps=2000, channel_group=None):
+        # Samples lost upstream are plotted (and logged) as NaN so the plot stays aligned to sample time
+        # With a channel group, only the group's channels are received, plotted and logged
+        super().__init__(sub_ip, sub_port, req_port, sub_topic, fill_gaps=fill_gaps, channel_group=channel_group)
         self.curr_time = time.time()
         self.last_time = self.curr_time
-        self.ch_data = {}
+        self.ch_data = None
         self.lines = []
         self.queue = queue.Queue()
 
+        # Batches received since the last frame, filled by the receiver thread and emptied by the renderer
+        self.staging = deque(maxlen=staging_size)
+        self.receiving = threading.Event()
+        self.receiver_thread = None
+        # Stream counters (received batches, sequence gaps, latency) are kept by ClientSub in self.stats
+        self.render_stats = {"dropped_staging": 0, "coalesced": 0,
+                             "frames": 0, "frame_time_ms": 0.0, "max_frame_time_ms": 0.0}
+
         self.get_channel_names()
 
+    def receive_data(self):
+        """Drain the SUB socket into the staging area until `stop_receiving` is called
+
+        Runs on its own thread so that a slow draw never delays the socket. When the renderer
+        falls behind by more than `staging_size` batches the oldest batches are dropped.
+        """
+        while self.receiving.is_set():
+            # Wake up regularly to check for the end of the stream
+            data = self.get_data(timeout=100)
+            if data is None:
+                continue
+
+            if len(self.staging) == self.staging.maxlen:
+                self.render_stats["dropped_staging"] += 1
+            self.staging.append(data)
+
+    def start_receiving(self):
+        self.receiving.set()
+        self.receiver_thread = threading.Thread(target=self.receive_data, daemon=True)
+        self.receiver_thread.start()
+
+    def stop_receiving(self):
+        self.receiving.clear()
+        if self.receiver_thread is not None:
+            self.receiver_thread.join()
+            self.receiver_thread = None
+
+    def take_staged(self):
+        """Remove every batch staged since the last frame and concatenate them
+
+        Returns:
+            tuple: (samplestamps, samples, timestamp of the newest batch), or None if nothing arrived
+        """
+        batches = []
+        while self.staging:
+            batches.append(self.staging.popleft())
+        if not batches:
+            return None
+
+        self.render_stats["coalesced"] += len(batches) - 1
+        if len(batches) == 1:
+            return batches[0]
+
+        samplestamps = np.concatenate([batch[0] for batch in batches])
+        samples = np.concatenate([batch[1] for batch in batches])
+        return samplestamps, samples, batches[-1][2]
+
     def update_plot(self, frame, ax, sep, win_size):
         try:
-            start_get_data_time = time.time()
-            samplestamps, samples, timestamp = self.get_data()
-            end_get_data_time = time.time()
-
-            data_log = {}
+            start_frame_time = time.time()
+            data = self.take_staged()
+            if data is None:
+                return self.lines
+            samplestamps, samples, timestamp = data
 
             logging.info("Received %d samples", len(samples))
-            data_log["samplestamps"] = samplestamps
-
-            logging.info("Time it takes to pull data: %f ms",
-                         end_get_data_time - start_get_data_time)
 
             # Measure time from the last call in milliseconds
             self.last_time = self.curr_time
@@ -60,17 +117,13 @@ class EEGVizualizer(ClientSub):
                 raise ValueError("Trying to plot more channels than there are in the data")
 
             start_plot_data_time = time.time()
-            for i in range(self.n_channels):
-                data_log[self.ch_names[i]] = samples[:, i]
-                self.ch_data[self.ch_names[i]].extend(samples[:, i] + i*sep)
-                # logging.info(f"Data successfully appended to {self.ch_names[i]}")
-
-                # Limit window size
-                if len(self.ch_data[self.ch_names[i]]) > win_size:
-                    del self.ch_data[self.ch_names[i]][:len(self.ch_names[i]) - win_size]
+            # Offset each channel by its separation and keep only the last win_size samples
+            self.ch_data.write(samples[:, :self.n_channels] + self.offsets)
 
-                self.lines[i].set_ydata(self.ch_data[self.ch_names[i]])
-                self.lines[i].set_xdata(range(len(self.ch_data[self.ch_names[i]])))
+            x = self.ch_data.x_view()
+            y = self.ch_data.view()
+            for i in range(self.n_channels):
+                self.lines[i].set_data(x, y[i])
 
             ax.relim()
             ax.autoscale_view(True, True, True)
@@ -83,25 +136,47 @@ class EEGVizualizer(ClientSub):
             end_plot_data_time = time.time()
 
             logging.info("Time it takes to plot data: %f ms",
-                         end_plot_data_time - start_plot_data_time)
+                         (end_plot_data_time - start_plot_data_time) * 1000)
 
-            self.queue.put(data_log)
-            print("Got Data!")
+            self.queue.put((samplestamps, samples[:, :self.n_channels]))
+
+            frame_time = (time.time() - start_frame_time) * 1000
+            self.render_stats["frames"] += 1
+            self.render_stats["frame_time_ms"] = frame_time
+            self.render_stats["max_frame_time_ms"] = max(self.render_stats["max_frame_time_ms"], frame_time)
+            if self.render_stats["frames"] % self.fps == 0:
+                logging.info("Stream stats: %s, render stats: %s", self.stats, self.render_stats)
 
             return self.lines
 
         except Exception as e:
             logging.error("Failed to get data: %s", str(e))
             print("Did not get data :(")
-            return  # Exit if we failed to get data
+            return self.lines
 
     def plot_data(self,
                   n_channels: int = 1,
                   sep: float = 0,
-                  win_size: int = 2000):
+                  win_size: int = 2000,
+                  fps: int = 30,
+                  max_points: int = 1000):
+        """Plot the stream until the window is closed
+
+        Args:
+            n_channels (int, optional): number of channels to plot. Defaults to 1.
+            sep (float, optional): vertical offset between two channels. Defaults to 0.
+            win_size (int, optional): number of samples shown per channel. Defaults to 2000.
+            fps (int, optional): frame rate of the plot. Defaults to 30.
+            max_points (int, optional): points drawn per line, about the plot width in pixels; the window is
+                reduced to a min-max envelope above it. None to draw every sample, e.g. on the Display topic
+                of DisplayZmqProcessor, which is already reduced. Defaults to 1000.
+        """
         self.n_channels = n_channels  # Set the number of channels you want to plot
-        for i in range(self.n_channels):
-            self.ch_data[self.ch_names[i]] = []
+        # Draw a fixed number of points per line, so the cost of a frame does not grow with the sampling rate
+        decimation = display_factor(win_size, max_points) if max_points else 1
+        self.ch_data = RingBuffer(self.n_channels, win_size, decimation=decimation)
+        self.offsets = np.arange(self.n_channels) * sep
+        self.fps = fps
 
         fig, ax = plt.subplots(figsize=(8, 6 * self.n_channels))
 
@@ -112,37 +187,49 @@ class EEGVizualizer(ClientSub):
                 line, = ax.plot([], [], label=self.ch_names[i])
                 self.lines.append(line)
 
+            # Start from the publisher's recent history instead of an empty plot. It goes to the plot
+            # only: the staged batches are also logged, and the history predates the session
+            snapshot = self.get_snapshot()
+            if snapshot is not None and snapshot[1].shape[1] >= self.n_channels:
+                self.ch_data.write(snapshot[1][:, :self.n_channels] + self.offsets)
+                x = self.ch_data.x_view()
+                y = self.ch_data.view()
+                for i in range(self.n_channels):
+                    self.lines[i].set_data(x, y[i])
+
+            # Render at a fixed frame rate, independently of the rate batches arrive at
+            self.start_receiving()
             ani = FuncAnimation(fig, self.update_plot, fargs=(ax, sep, win_size),
-                                frames=None, blit=True, interval=1, repeat=False)
+                                frames=None, blit=True, interval=1000 / self.fps, repeat=False)
             plt.show()
 
         except Exception as e:
             logging.error("Plotting error: %s", str(e))
             print("Subscriber stopped by user")
 
+        finally:
+            self.stop_receiving()
+            logging.info("Stream stats: %s, render stats: %s", self.stats, self.render_stats)
 
-    def save_data_log(self):
-        csv_file = get_unique_filename(DATA_LOG_FILE)
-
-        with open(csv_file, "w", newline='') as file:
-            fieldnames = ["samplestamps"]
-            fieldnames.extend(self.ch_names[:self.n_channels])
-
-            # Create a CSV DictWriter object
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
 
+    def save_data_log(self):
+        logger = None
+        try:
             while True:
                 data = self.queue.get()
                 if data is None:
                     break
 
-                num_rows = len(next(iter(data.values())))
-                for i in range(num_rows):
-                    row = {key: value[i] for key, value in data.items()}
-                    writer.writerow(row)
+                samplestamps, samples = data
+                if logger is None:
+                    # Open the log on the first batch, once the number of plotted channels is known
+                    logger = DataLogger(DATA_LOG_FILE, self.ch_names[:samples.shape[1]], fmt=DATA_LOG_FORMAT)
+                logger.write(samplestamps, samples)
 
                 self.queue.task_done()
+        finally:
+            if logger is not None:
+                logger.close()
 
 
 if __name__ == "__main__":
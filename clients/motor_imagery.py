@@ -1,11 +1,12 @@
 import time
 import random
-import threading
+import os
 import csv
+import threading
 import queue
 from psychopy import visual, core, event
 from client_sub import ClientSub
-from utils import get_unique_filename
+from utils import DataLogger, StreamClock
 
 # Setup experiment window
 win = visual.Window(fullscr=False, color="black", units="norm")
@@ -42,57 +43,71 @@ trial_duration = 3  # seconds
 rest_duration = 2  # seconds
 
 DATA_LOG_FILE = 'logs/motor_imagery/data.csv'
-csv_file = get_unique_filename(DATA_LOG_FILE)
+DATA_LOG_FORMAT = 'csv'  # the analysis notebook reads the CSV layout
+EVENTS_SUFFIX = '_events.csv'  # stimulus events are written next to the data log
 
 subscriber = ClientSub()
 subscriber.get_channel_names()
 ch_names = subscriber.ch_names
 
-data_lock = threading.Lock()
-# data = {"samplestamps": [], "samples" : [], "stimuli": [], "ch_names": subscriber.ch_names}
-data = {}
-
+# Batches and stimulus events, in the order they happened, for the writer thread
 q = queue.Queue()
 
-stimuli = None
+# Maps the time a stimulus is shown to the samplestamp of the stream at that time
+clock = StreamClock()
+acquiring = threading.Event()
+acquiring.set()
 
 
 def get_data():
-    while True:
-        try:
-            samplestamps, samples, _ = subscriber.get_data()
-            with data_lock:
-                data["samplestamps"] = samplestamps.tolist()
-                data["stim"] = [stimuli] * len(samplestamps)
-                for ch in ch_names:
-                    data[ch] = samples[:, ch_names.index(ch)].tolist()
-                q.put(data)
-        except Exception as e:
-            raise e
+    while acquiring.is_set():
+        # Wait for the next batch without sleeping, but wake up regularly to check for the end of the task
+        data = subscriber.get_data(timeout=100)
+        if data is None:
+            continue
+        receive_time = time.monotonic()
 
-        time.sleep(0.1)  # Adjust this sleep interval as needed
+        samplestamps, samples, _ = data
+        samplestamps.setflags(write=False)
+        samples.setflags(write=False)
+        clock.update(receive_time, samplestamps[-1])
+        q.put(("batch", samplestamps, samples))
 
 
-def save_data_log():
-    csv_file = get_unique_filename(DATA_LOG_FILE)
+def mark_stimulus(label: str):
+    """Record the onset of a stimulus, call right after the flip that shows it"""
+    q.put(("event", time.monotonic(), label))
 
-    with open(csv_file, "w", newline='') as file:
-        fieldnames = ["samplestamps", "stim"]
-        fieldnames.extend(ch_names)
 
-        # Create a CSV DictWriter object
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
+def save_data_log():
+    last_samplestamp = None
+    onset = None
+    with DataLogger(DATA_LOG_FILE, ch_names, fmt=DATA_LOG_FORMAT) as logger, \
+            open(os.path.splitext(logger.path)[0] + EVENTS_SUFFIX, "w", newline="") as events_file:
+        events = csv.writer(events_file)
+        events.writerow(["onset_samplestamp", "offset_samplestamp", "label"])
 
         while True:
-            data = q.get()
-            if data is None:
+            item = q.get()
+            if item is None:
+                # The last stimulus lasts until the end of the recording
+                if onset is not None and last_samplestamp is not None:
+                    events.writerow([onset[0], last_samplestamp + 1, onset[1]])
+                q.task_done()  # Lets q.join() return once everything before the sentinel is written
                 break
 
-            num_rows = len(next(iter(data.values())))
-            for i in range(num_rows):
-                row = {key: value[i] for key, value in data.items()}
-                writer.writerow(row)
+            if item[0] == "batch":
+                _, samplestamps, samples = item
+                logger.write(samplestamps, samples)
+                last_samplestamp = int(samplestamps[-1])
+            else:
+                # Each stimulus ends where the next one starts
+                _, onset_time, label = item
+                onset_samplestamp = clock.samplestamp_at(onset_time)
+                if onset is not None and onset_samplestamp is not None:
+                    events.writerow([onset[0], onset_samplestamp, onset[1]])
+                    events_file.flush()
+                onset = (onset_samplestamp, label) if onset_samplestamp is not None else None
 
             q.task_done()
 
@@ -123,7 +138,7 @@ for trial in range(n_trials):
     # Show fixation
     fixation.draw()
     win.flip()
-    stimuli = "fixation"
+    mark_stimulus("fixation")
     core.wait(rest_duration)
 
     # Show cue
@@ -131,7 +146,7 @@ for trial in range(n_trials):
     cue_image.draw()
     cue_text.draw()
     win.flip()
-    stimuli = cue_text.text
+    mark_stimulus(cue_text.text)
     trial_clock = core.Clock()
 
     # Wait for trial duration or key press
@@ -149,6 +164,8 @@ for trial in range(n_trials):
         print(f"Trial {trial+1}: Trial Finished")
 
 # Clean up
+acquiring.clear()
+data_thread.join()
 q.put(None)
 q.join()
 
@@ -1,8 +1,7 @@
 import random
-import pickle
 import pygame
 from client_sub import ClientSub
-import numpy as np
+from online_decoder import OnlineDecoder
 
 # Initialize Pygame
 pygame.init()
@@ -44,30 +43,49 @@ PLAYER_VELOCITY = 10
 # Initialize clock
 clock = pygame.time.Clock()
 
+# Decode on the acquisition side with DecoderZmqProcessor and only receive its predictions,
+# or receive the raw data batches and decode them here
+USE_DECODER_PROCESSOR = False
+
 # Setup ClientSub for data
-clientSub = ClientSub(sub_port=6000)
+# Only the latest prediction matters, older ones are dropped; raw batches are all needed by the decoder
+clientSub = ClientSub(sub_port=6000, sub_topic="Predictions" if USE_DECODER_PROCESSOR else "ProcessedData",
+                      conflate=USE_DECODER_PROCESSOR)
 
 # Load CSP filters and trained ML model
-filters = np.load('../notebooks/models/csp_filters.npy')
+FILTERS_FILENAME = '../notebooks/models/csp_filters.npy'
 MODEL_FILENAME = '../notebooks/models/MI_model.pkl'
 
-with open(MODEL_FILENAME, 'rb') as file:
-    loaded_model = pickle.load(file)
+# The model was trained on 2000-sample trials; predict every HOP_SIZE samples on the last 2000
+WIN_SIZE = 2000
+HOP_SIZE = 100
+if not USE_DECODER_PROCESSOR:
+    decoder = OnlineDecoder.from_files(FILTERS_FILENAME, MODEL_FILENAME, win_size=WIN_SIZE, hop_size=HOP_SIZE)
+    # Fill the first window with the publisher's recent history so predictions start right away
+    snapshot = clientSub.get_snapshot()
+    if snapshot is not None:
+        decoder.update(snapshot[0][-WIN_SIZE:], snapshot[1][-WIN_SIZE:])
+pred = None
 
 # Main game loop
 RUNNING = True
 while RUNNING:
     try:
-        samplestamps, samples, _ = clientSub.get_data()
-        
-        # Apply CSP filters to the data
-        filtered_data = np.dot(filters, samples)
-        features = np.log(np.var(filtered_data, axis=1))
-        features = features.reshape(1, -1)
+        # Never block the game loop: take what arrived since the last frame, if anything
+        data = clientSub.get_data(timeout=0) if USE_DECODER_PROCESSOR else clientSub.drain()
+        if data is not None:
+            samplestamps, samples, _ = data
+            if USE_DECODER_PROCESSOR:
+                # Each row is [prediction, features...]; keep the latest prediction
+                pred = int(samples[-1, 0])
+            else:
+                # Slide the CSP + LDA window over the batch and keep the latest prediction
+                predictions = decoder.update(samplestamps, samples)
+                if predictions:
+                    pred = predictions[-1]["prediction"]
+                    print("Prediction latency: {:.2f} ms".format(predictions[-1]["latency_ms"]))
 
         # Control the player paddle based on LDA model predictions
-        pred = loaded_model.predict(features)
-
         if pred == 0:
             print("Move up!")
             player_paddle.y -= PLAYER_VELOCITY
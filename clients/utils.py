@@ -1,6 +1,12 @@
 import os
+import csv
+import json
+import time
+import threading
+from collections import deque
 from datetime import datetime
 import logging
+import numpy as np
 
 def get_unique_filename(base_filename):
     """
@@ -39,4 +45,261 @@ def setup_logging(log_file_base: str, log_level=logging.INFO) -> None:
 
 def time_to_float(time_str):
     hours, minutes, seconds = map(int, time_str.split(':'))
-    return hours + minutes/60 + seconds/3600
\ No newline at end of file
+    return hours + minutes/60 + seconds/3600
+
+
+class StreamClock():
+    """Maps local `time.monotonic()` times to the samplestamps of the stream
+
+    Every received batch adds one (receive time, last samplestamp) point. The sampling rate is the
+    least-squares slope of the recent points, and since a batch can only arrive after its last
+    sample was acquired, the point received with the least delay anchors the line. Thread-safe:
+    the acquisition thread calls `update` while other threads call `samplestamp_at`.
+    """
+
+    def __init__(self, history: int = 500):
+        """Class constructor
+        Args:
+            history (int, optional): number of recent batches used for the fit. Defaults to 500.
+        """
+        self.times = deque(maxlen=history)
+        self.samplestamps = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def update(self, receive_time: float, last_samplestamp: int):
+        with self.lock:
+            self.times.append(receive_time)
+            self.samplestamps.append(last_samplestamp)
+
+    def samplestamp_at(self, t: float):
+        """Estimate the samplestamp acquired at a local time
+
+        Args:
+            t (float): a `time.monotonic()` time
+
+        Returns:
+            int: the estimated samplestamp, None before the first batch
+        """
+        with self.lock:
+            times = np.array(self.times)
+            samplestamps = np.array(self.samplestamps, dtype=np.float64)
+        if len(times) == 0:
+            return None
+        if len(times) < 2 or times[-1] == times[0] or samplestamps[-1] == samplestamps[0]:
+            return int(samplestamps[-1])
+
+        rate = np.polyfit(times - times[0], samplestamps, 1)[0]
+        offset = np.max(samplestamps - rate * (times - times[0]))
+        return int(round(rate * (t - times[0]) + offset))
+
+
+def _csv_field(value: str) -> str:
+    """Quote a text field the way csv.writer would, and escape it for use in a %-format string"""
+    if value is None:
+        return ""
+    value = str(value)
+    if any(char in value for char in ',"\r\n'):
+        value = '"' + value.replace('"', '""') + '"'
+    return value.replace("%", "%%")
+
+
+class DataLogger():
+    """Append-only logger that writes whole batches of samples at once
+
+    Two formats are supported:
+        - "npy": a directory with one pair of .npy files per chunk (samplestamps and samples), an
+          append-only `index.csv` with one line per chunk and a `meta.json` describing the columns.
+          Label changes are appended to `labels.csv` as (row, samplestamp, label).
+        - "csv": the same single CSV file as the former csv.DictWriter logs (samplestamps, optional
+          label column, one column per channel), formatted a batch at a time.
+
+    Rows are buffered in memory and flushed once `chunk_size` rows are pending or `flush_interval`
+    seconds have passed since the last flush, whichever comes first.
+    """
+
+    def __init__(self, base_filename: str, columns: list, fmt: str = "npy", chunk_size: int = 5000,
+                 flush_interval: float = 1.0, fsync: bool = False, label_column: str = None, dtype=np.float64):
+        """Class constructor
+        Args:
+            base_filename (str): log file name, made unique with `get_unique_filename`. For the "npy" format the extension is dropped and a directory is created.
+            columns (list): names of the sample columns (channel names)
+            fmt (str, optional): "npy" or "csv". Defaults to "npy".
+            chunk_size (int, optional): number of rows buffered before they are written. Defaults to 5000.
+            flush_interval (float, optional): maximum time in seconds rows stay buffered. Defaults to 1.0.
+            fsync (bool, optional): fsync the files after every flush. Defaults to False.
+            label_column (str, optional): name of a per-batch text label column (e.g. "stim"). Defaults to None.
+            dtype (optional): dtype the samples are stored with. Defaults to np.float64.
+        """
+        if fmt not in ("npy", "csv"):
+            raise ValueError("Unknown data log format '{}', expected 'npy' or 'csv'".format(fmt))
+
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.label_column = label_column
+        self.n_rows = 0
+        self.flushed_rows = 0  # rows written to the chunks, n_rows lags behind while a batch is being copied
+        self.last_flush = time.monotonic()
+
+        if fmt == "csv":
+            self.path = get_unique_filename(base_filename)
+            self.file = open(self.path, "w", newline="")
+            header = ["samplestamps"] + ([label_column] if label_column else []) + self.columns
+            csv.writer(self.file).writerow(header)
+            self.pending = []
+            self.n_pending = 0
+        else:
+            self.path = get_unique_filename(os.path.splitext(base_filename)[0])
+            os.makedirs(self.path)
+            with open(os.path.join(self.path, "meta.json"), "w") as file:
+                json.dump({"version": 1, "columns": self.columns, "label_column": label_column,
+                           "samplestamps_dtype": np.dtype(np.int64).str, "samples_dtype": np.dtype(dtype).str}, file)
+            self.index_file = open(os.path.join(self.path, "index.csv"), "w")
+            self.index_file.write("chunk,first_row,n_rows,first_samplestamp,last_samplestamp\n")
+            self.labels_file = open(os.path.join(self.path, "labels.csv"), "w", newline="") if label_column else None
+            if self.labels_file is not None:
+                self.labels_writer = csv.writer(self.labels_file)
+                self.labels_writer.writerow(["row", "samplestamp", "label"])
+            self.last_label = None
+            self.n_chunks = 0
+            self.stamps_buffer = np.empty(chunk_size, dtype=np.int64)
+            self.samples_buffer = np.empty((chunk_size, len(self.columns)), dtype=dtype)
+            self.n_pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, samplestamps, samples, label: str = None):
+        """Append a batch of rows
+
+        Args:
+            samplestamps ([1D array]): array of n_samples samplestamps
+            samples ([2D array]): array of shape (n_samples, len(columns))
+            label (str, optional): label of every row in the batch, written to the label column. Defaults to None.
+        """
+        samplestamps = np.asarray(samplestamps)
+        samples = np.asarray(samples).reshape(len(samplestamps), len(self.columns))
+
+        if self.fmt == "csv":
+            self._write_csv(samplestamps, samples, label)
+        else:
+            self._write_npy(samplestamps, samples, label)
+        self.n_rows += len(samplestamps)
+
+        if self.n_pending >= self.chunk_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def _write_csv(self, samplestamps, samples, label):
+        if len(samplestamps) == 0:
+            return
+        row_fmt = "%d"
+        if self.label_column:
+            row_fmt += "," + _csv_field(label)
+        # Integer samples are written as integers, like csv.DictWriter did, and floats with their repr
+        integer = samples.dtype.kind in "iu"
+        row_fmt += ("," + ("%d" if integer else "%r")) * len(self.columns) + "\n"
+
+        # Format the whole batch with a single %-operation on plain Python numbers
+        table_dtype = np.int64 if integer else np.float64
+        table = np.column_stack((samplestamps.astype(table_dtype), samples.astype(table_dtype)))
+        self.pending.append((row_fmt * len(table)) % tuple(table.ravel().tolist()))
+        self.n_pending += len(table)
+
+    def _write_npy(self, samplestamps, samples, label):
+        if self.labels_file is not None and label != self.last_label and len(samplestamps) > 0:
+            self.labels_writer.writerow([self.n_rows, samplestamps[0], label])
+            self.last_label = label
+
+        start = 0
+        while start < len(samplestamps):
+            n = min(len(samplestamps) - start, self.chunk_size - self.n_pending)
+            self.stamps_buffer[self.n_pending:self.n_pending + n] = samplestamps[start:start + n]
+            self.samples_buffer[self.n_pending:self.n_pending + n] = samples[start:start + n]
+            self.n_pending += n
+            start += n
+            if self.n_pending == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows to disk"""
+        if self.fmt == "csv":
+            if self.pending:
+                self.file.write("".join(self.pending))
+                self.pending = []
+            self._sync(self.file)
+        else:
+            if self.n_pending > 0:
+                chunk = os.path.join(self.path, "chunk_{:06d}".format(self.n_chunks))
+                for suffix, buffer in (("samplestamps", self.stamps_buffer), ("samples", self.samples_buffer)):
+                    with open("{}.{}.npy".format(chunk, suffix), "wb") as file:
+                        np.save(file, buffer[:self.n_pending])
+                        self._sync(file)
+
+                self.index_file.write("{},{},{},{},{}\n".format(self.n_chunks, self.flushed_rows, self.n_pending,
+                                                              self.stamps_buffer[0], self.stamps_buffer[self.n_pending - 1]))
+                self.n_chunks += 1
+                self.flushed_rows += self.n_pending
+            self._sync(self.index_file)
+            if self.labels_file is not None:
+                self._sync(self.labels_file)
+
+        self.n_pending = 0
+        self.last_flush = time.monotonic()
+
+    def _sync(self, file):
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def close(self):
+        """Flush the buffered rows and close the log"""
+        self.flush()
+        if self.fmt == "csv":
+            self.file.close()
+        else:
+            self.index_file.close()
+            if self.labels_file is not None:
+                self.labels_file.close()
+
+
+def read_data_log(path: str, mmap: bool = False) -> dict:
+    """Read a log directory written by `DataLogger` in the "npy" format
+
+    Args:
+        path (str): the log directory
+        mmap (bool, optional): memory-map the chunks instead of reading them. Defaults to False.
+
+    Returns:
+        dict: "samplestamps" (n_rows,), "samples" (n_rows, n_columns), "columns" and "labels" (list of (row, samplestamp, label)).
+            With `mmap`, "samplestamps" and "samples" are lists of the memory-mapped arrays of every chunk,
+            in order, so that nothing is read before it is used; `np.concatenate` them to read the whole log.
+    """
+    with open(os.path.join(path, "meta.json")) as file:
+        meta = json.load(file)
+
+    with open(os.path.join(path, "index.csv")) as file:
+        chunks = [int(row["chunk"]) for row in csv.DictReader(file)]
+
+    mmap_mode = "r" if mmap else None
+    samplestamps = [np.load(os.path.join(path, "chunk_{:06d}.samplestamps.npy".format(chunk)), mmap_mode=mmap_mode) for chunk in chunks]
+    samples = [np.load(os.path.join(path, "chunk_{:06d}.samples.npy".format(chunk)), mmap_mode=mmap_mode) for chunk in chunks]
+
+    labels = []
+    labels_path = os.path.join(path, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline="") as file:
+            labels = [(int(row["row"]), int(row["samplestamp"]), row["label"]) for row in csv.DictReader(file)]
+
+    if mmap:
+        return {"samplestamps": samplestamps, "samples": samples, "columns": meta["columns"], "labels": labels}
+
+    n_columns = len(meta["columns"])
+    return {"samplestamps": np.concatenate(samplestamps) if chunks else np.empty(0, dtype=meta["samplestamps_dtype"]),
+            "samples": np.concatenate(samples) if chunks else np.empty((0, n_columns), dtype=meta["samples_dtype"]),
+            "columns": meta["columns"],
+            "labels": labels}
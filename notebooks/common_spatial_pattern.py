@@ -3,10 +3,10 @@ from scipy.linalg import eigh
 
 def compute_covariance_matrix(data):
     """Compute the covariance matrix for EEG data.
-    
+
     Parameters:
     data (ndarray): EEG data of shape (n_channels, n_samples)
-    
+
     Returns:
     ndarray: Covariance matrix of shape (n_channels, n_channels)
     """
@@ -16,28 +16,127 @@ def compute_covariance_matrix(data):
     cov_matrix = np.dot(data, data.T) / data.shape[1]
     return cov_matrix
 
-def csp(X1, X2):
+def sum_covariance_matrices(X, chunk_size=16, dtype=np.float64):
+    """Sum the per-trial covariance matrices of EEG data, a chunk of trials at a time.
+
+    Each chunk is demeaned (and cast to `dtype`) into one buffer and reduced with a single batched
+    matrix product, so memory stays bounded by the chunk size whatever the number of trials.
+    X can be a memory-mapped array.
+
+    Parameters:
+    X (ndarray): EEG data of shape (n_trials, n_channels, n_samples)
+    chunk_size (int): Number of trials processed at once
+    dtype (dtype): Precision of the computation, np.float32 halves memory and bandwidth
+
+    Returns:
+    ndarray: Sum of the covariance matrices, shape (n_channels, n_channels), in float64
+    """
+    n_trials, n_channels, n_samples = X.shape
+    cov_sum = np.zeros((n_channels, n_channels), dtype=np.float64)
+    for start in range(0, n_trials, chunk_size):
+        trials = X[start:start + chunk_size]
+        chunk = np.empty(trials.shape, dtype=dtype)
+        np.subtract(trials, trials.mean(axis=2, keepdims=True, dtype=dtype), out=chunk, casting="same_kind")
+        cov_sum += np.matmul(chunk, chunk.transpose(0, 2, 1)).sum(axis=0)
+    return cov_sum / n_samples
+
+def mean_covariance_matrix(X, chunk_size=16, dtype=np.float64, shrinkage=0.0):
+    """Compute the average covariance matrix over trials, with optional shrinkage.
+
+    Parameters:
+    X (ndarray): EEG data of shape (n_trials, n_channels, n_samples)
+    chunk_size (int): Number of trials processed at once
+    dtype (dtype): Precision of the computation
+    shrinkage (float): Shrinkage towards a scaled identity, between 0 (none) and 1
+
+    Returns:
+    ndarray: Average covariance matrix of shape (n_channels, n_channels)
+    """
+    cov = sum_covariance_matrices(X, chunk_size, dtype) / X.shape[0]
+    return shrink_covariance_matrix(cov, shrinkage)
+
+def shrink_covariance_matrix(cov, shrinkage=0.0):
+    """Regularize a covariance matrix by shrinking it towards a scaled identity.
+
+    Parameters:
+    cov (ndarray): Covariance matrix of shape (n_channels, n_channels)
+    shrinkage (float): Shrinkage between 0 (none) and 1 (identity scaled by the average variance)
+
+    Returns:
+    ndarray: Regularized covariance matrix
+    """
+    if shrinkage == 0:
+        return cov
+    if not 0 <= shrinkage <= 1:
+        raise ValueError(f"Shrinkage must be between 0 and 1, got {shrinkage}")
+    n_channels = cov.shape[0]
+    target = np.trace(cov) / n_channels * np.eye(n_channels)
+    return (1 - shrinkage) * cov + shrinkage * target
+
+def _sorted_eigenvectors(cov, cov_total):
+    # Solve the generalized eigenvalue problem
+    eigenvalues, eigenvectors = eigh(cov, cov_total)
+
+    # Sort eigenvalues and corresponding eigenvectors in descending order
+    sorted_indices = np.argsort(eigenvalues)[::-1]
+    return eigenvectors[:, sorted_indices]
+
+def csp(X1, X2, chunk_size=16, dtype=np.float64, shrinkage=0.0):
     """Compute the Common Spatial Patterns (CSP) filters.
-    
+
     Parameters:
     X1 (ndarray): EEG data for class 1, shape (n_trials, n_channels, n_samples)
     X2 (ndarray): EEG data for class 2, shape (n_trials, n_channels, n_samples)
-    
+    chunk_size (int): Number of trials processed at once when computing covariances
+    dtype (dtype): Precision of the covariance computation
+    shrinkage (float): Shrinkage of the class covariances towards a scaled identity, between 0 and 1
+
     Returns:
     ndarray: CSP filters of shape (n_channels, n_channels)
     """
     # Compute average covariance matrices for each class
-    cov1 = np.mean([compute_covariance_matrix(trial) for trial in X1], axis=0)
-    cov2 = np.mean([compute_covariance_matrix(trial) for trial in X2], axis=0)
-    
+    cov1 = mean_covariance_matrix(X1, chunk_size, dtype, shrinkage)
+    cov2 = mean_covariance_matrix(X2, chunk_size, dtype, shrinkage)
+
     # Composite covariance matrix
     cov_total = cov1 + cov2
-    
-    # Solve the generalized eigenvalue problem
-    eigenvalues, eigenvectors = eigh(cov1, cov_total)
-    
-    # Sort eigenvalues and corresponding eigenvectors in descending order
-    sorted_indices = np.argsort(eigenvalues)[::-1]
-    eigenvectors = eigenvectors[:, sorted_indices]
-    
-    return eigenvectors
\ No newline at end of file
+
+    return _sorted_eigenvectors(cov1, cov_total)
+
+def csp_one_vs_rest(X, y, chunk_size=16, dtype=np.float64, shrinkage=0.0):
+    """Compute one-vs-rest Common Spatial Patterns (CSP) filters for more than two classes.
+
+    The covariance of every class is computed once; the covariance of "the rest" is the
+    trial-weighted average of the other classes.
+
+    Parameters:
+    X (ndarray): EEG data of shape (n_trials, n_channels, n_samples)
+    y (ndarray): Class label of each trial, shape (n_trials,)
+    chunk_size (int): Number of trials processed at once when computing covariances
+    dtype (dtype): Precision of the covariance computation
+    shrinkage (float): Shrinkage of the class covariances towards a scaled identity, between 0 and 1
+
+    Returns:
+    classes (ndarray): Sorted unique class labels
+    filters (ndarray): CSP filters of each class against the rest, shape (n_classes, n_channels, n_channels)
+    """
+    y = np.asarray(y)
+    classes = np.unique(y)
+    cov_sums = []
+    n_trials = []
+    for label in classes:
+        idx = np.where(y == label)[0]
+        cov_sums.append(sum(sum_covariance_matrices(X[idx[start:start + chunk_size]], chunk_size, dtype)
+                            for start in range(0, len(idx), chunk_size)))
+        n_trials.append(len(idx))
+    cov_sums = np.array(cov_sums)
+    n_trials = np.array(n_trials)
+
+    filters = []
+    for i in range(len(classes)):
+        cov = shrink_covariance_matrix(cov_sums[i] / n_trials[i], shrinkage)
+        rest = np.delete(np.arange(len(classes)), i)
+        cov_rest = shrink_covariance_matrix(cov_sums[rest].sum(axis=0) / n_trials[rest].sum(), shrinkage)
+        filters.append(_sorted_eigenvectors(cov, cov + cov_rest))
+
+    return classes, np.array(filters)
@@ -1,45 +1,99 @@
 import pywt
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-def compute_freq_band_power(X, sfreq):
+BANDS = {
+    'Delta': (0.5, 4),
+    'Theta': (4, 8),
+    'Alpha': (8, 13),
+    'Beta': (13, 30),
+    'Gamma': (30, 70),
+    'High Gamma': (70, 150)
+}
+
+WAVELET = 'cmor1.5-1.0'  # Complex Morlet wavelet
+SCALES = np.arange(1, 128)
+
+def compute_freq_band_power(X, sfreq, bands=BANDS, n_jobs=1, dtype=np.float64):
     """ Computes the power for EEG frequnecy bands
 
+    The wavelet transform of each trial is computed once, only for the scales whose frequency
+    falls in one of the bands, and reduced to the mean power (|coef|^2) over the scales of each
+    band. Trials are processed in parallel when n_jobs > 1.
+
     Parameters:
     X (nd.array) : EEG data of shape (n_trials, n_channels, n_samples)
     sfreq (int) : Sampling frequency of electrodes
+    bands (dict) : Frequency range (low, high) in Hz of each band, both ends included
+    n_jobs (int) : Number of worker processes, 1 computes the trials in this process
+    dtype (dtype) : dtype of the returned band power
 
     Returns:
-    band_power (dict) : Computed power for EEG frequency bands
-    
+    band_power (nd.array) : Computed power of shape (n_trials, n_bands, n_channels, n_samples), bands in the order of `bands`
+
     """
-    bands = {
-        'Delta': (0.5, 4),
-        'Theta': (4, 8),
-        'Alpha': (8, 13),
-        'Beta': (13, 30),
-        'Gamma': (30, 70),
-        'High Gamma': (70, 150)
-    }
-    
-    band_power = {freq_band: [] for freq_band in bands.keys()}
-
-    for band, (low_freq, high_freq) in bands.items():
-        for trial_data in X:
-            coefficients, freqs = wavelet_transform(trial_data, sfreq)
-
-            # Find the indices of frequencies within the band
-            idx_band = np.logical_and(freqs >= low_freq, freqs <= high_freq)
-            band_power[band].append(coefficients[idx_band, :, :].mean(axis=0))
+    scales, band_masks = band_scales(sfreq, bands)
+    n_trials, n_channels, n_samples = X.shape
+    band_power = np.empty((n_trials, len(bands), n_channels, n_samples), dtype=dtype)
+
+    if n_jobs == 1:
+        for i, trial_data in enumerate(X):
+            band_power[i] = trial_band_power(trial_data, sfreq, scales, band_masks)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(trial_band_power, trial_data, sfreq, scales, band_masks) for trial_data in X]
+            for i, future in enumerate(futures):
+                band_power[i] = future.result()
 
     return band_power
 
-def wavelet_transform(eeg_signal, fs):
+def band_scales(sfreq, bands=BANDS, scales=SCALES, wavelet=WAVELET):
+    """ Selects the wavelet scales that fall in at least one frequency band
+
+    Parameters:
+    sfreq (int) : Sampling frequency of electrodes
+    bands (dict) : Frequency range (low, high) in Hz of each band
+    scales (nd.array) : Candidate scales
+    wavelet (str) : Wavelet name
+
+    Returns:
+    scales (nd.array) : The selected scales
+    band_masks (nd.array) : Boolean array of shape (n_bands, n_selected_scales), the scales of each band
+    """
+    freqs = pywt.scale2frequency(wavelet, scales) * sfreq
+    band_masks = np.array([np.logical_and(freqs >= low_freq, freqs <= high_freq) for low_freq, high_freq in bands.values()])
+    used = band_masks.any(axis=0)
+    return scales[used], band_masks[:, used]
+
+def trial_band_power(trial_data, sfreq, scales, band_masks, wavelet=WAVELET):
+    """ Computes the power of each band for one trial
+
+    Parameters:
+    trial_data (nd.array) : EEG data of shape (n_channels, n_samples)
+    sfreq (int) : Sampling frequency of electrodes
+    scales (nd.array) : Scales to transform, from `band_scales`
+    band_masks (nd.array) : Scales of each band, from `band_scales`
+    wavelet (str) : Wavelet name
+
+    Returns:
+    band_power (nd.array) : Power of shape (n_bands, n_channels, n_samples)
+    """
+    coefficients, _ = wavelet_transform(trial_data, sfreq, scales, wavelet)
+
+    # Reduce the complex coefficients to power, reusing the real part's memory
+    power = coefficients.real
+    power **= 2
+    power += coefficients.imag ** 2
+    del coefficients
+
+    band_power = np.empty((len(band_masks),) + power.shape[1:], dtype=power.dtype)
+    for i, idx_band in enumerate(band_masks):
+        band_power[i] = power[idx_band].mean(axis=0) if idx_band.any() else np.nan
+    return band_power
+
+def wavelet_transform(eeg_signal, fs, scales=SCALES, wavelet=WAVELET):
 
-    # Define wavelet parameters
-    wavelet = 'cmor1.5-1.0'  # Complex Morlet wavelet
-    scales = np.arange(1, 128)
-    
     # Perform Continuous Wavelet Transform (CWT)
     coefficients, frequencies = pywt.cwt(eeg_signal, scales, wavelet, sampling_period=1/fs)
-    
-    return coefficients, frequencies
\ No newline at end of file
+
+    return coefficients, frequencies
@@ -0,0 +1,282 @@
+import os
+import csv
+import json
+import numpy as np
+import pandas as pd
+
+# Labels of the stimuli shown by clients/motor_imagery.py
+REST_LABEL = "fixation"
+CUE_LABELS = {"Right Hand": 0, "Left Hand": 1}
+
+# Event table written next to the data log by clients/motor_imagery.py
+EVENTS_SUFFIX = "_events.csv"
+
+CACHE_VERSION = 2
+
+def load_session(csv_file_path, channels=None, chunksize=100000, cache=True, mmap=True):
+    """Load a motor imagery session log, parsing the CSV only once.
+
+    The CSV is read in chunks into preallocated arrays. With `cache`, the arrays are written to
+    `<csv_file_path>.cache/` as .npy files together with the CSV's modification time and size, and
+    later calls load them from there (memory-mapped with `mmap`) until the CSV changes.
+
+    Stimulus labels come from the event table next to the CSV (`<name>_events.csv`) when there is
+    one, and otherwise from the "stim" column of older logs. A log directory written by
+    `DataLogger` in the "npy" format is read from its chunks instead, without a cache.
+
+    Parameters:
+    csv_file_path (str): Path to the CSV (or "npy" log directory) written by the motor imagery task
+    channels (list): Channel columns to load, all the channel columns by default
+    chunksize (int): Number of rows parsed at once
+    cache (bool): Read from and write to the binary cache
+    mmap (bool): Memory-map the cached arrays instead of reading them
+
+    Returns:
+    dict: "samplestamps" (n_rows,), "samples" (n_rows, n_channels) float32, "stim" (n_rows,) label codes with -1 for no label, "labels" (label of each code) and "ch_names"
+    """
+    if os.path.isdir(csv_file_path):
+        return _apply_events(_load_data_log(csv_file_path, channels, mmap), csv_file_path)
+
+    cache_dir = csv_file_path + ".cache"
+    stat = os.stat(csv_file_path)
+
+    if cache and os.path.exists(os.path.join(cache_dir, "meta.json")):
+        with open(os.path.join(cache_dir, "meta.json")) as file:
+            meta = json.load(file)
+        if (meta["version"], meta["mtime"], meta["size"]) == (CACHE_VERSION, stat.st_mtime, stat.st_size) and \
+                (channels is None or list(channels) == meta["ch_names"]):
+            mmap_mode = "r" if mmap else None
+            # The arrays are sized from the line count, which includes blank lines pandas skips
+            session = {key: np.load(os.path.join(cache_dir, key + ".npy"), mmap_mode=mmap_mode)[:meta["n_rows"]]
+                       for key in ("samplestamps", "samples", "stim")}
+            session["labels"] = meta["labels"]
+            session["ch_names"] = meta["ch_names"]
+            return _apply_events(session, csv_file_path)
+
+    with open(csv_file_path, newline="") as file:
+        header = next(csv.reader(file))
+    if channels is None:
+        channels = log_channels(csv_file_path)
+    n_rows = _count_rows(csv_file_path)
+
+    if cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        allocate = lambda key, shape, dtype: np.lib.format.open_memmap(os.path.join(cache_dir, key + ".npy"), mode="w+", shape=shape, dtype=dtype)
+    else:
+        allocate = lambda key, shape, dtype: np.empty(shape, dtype=dtype)
+    samplestamps = allocate("samplestamps", (n_rows,), np.int64)
+    samples = allocate("samples", (n_rows, len(channels)), np.float32)
+    stim = allocate("stim", (n_rows,), np.int16)
+
+    labels = []
+    codes = {}
+    has_stim = "stim" in header
+    usecols = ["samplestamps"] + (["stim"] if has_stim else []) + list(channels)
+    dtype = {channel: np.float32 for channel in channels}
+    dtype["samplestamps"] = np.int64
+    dtype["stim"] = object
+
+    row = 0
+    for chunk in pd.read_csv(csv_file_path, usecols=usecols, dtype=dtype, chunksize=chunksize, engine="c"):
+        n = len(chunk)
+        samplestamps[row:row + n] = chunk["samplestamps"].to_numpy()
+        samples[row:row + n] = chunk[channels].to_numpy()
+        if has_stim:
+            for label in chunk["stim"].dropna().unique():
+                if label not in codes:
+                    codes[label] = len(labels)
+                    labels.append(label)
+            stim[row:row + n] = chunk["stim"].map(codes).fillna(-1).to_numpy()
+        else:
+            stim[row:row + n] = -1
+        row += n
+
+    if cache:
+        for array in (samplestamps, samples, stim):
+            array.flush()
+        with open(os.path.join(cache_dir, "meta.json"), "w") as file:
+            json.dump({"version": CACHE_VERSION, "mtime": stat.st_mtime, "size": stat.st_size, "n_rows": row,
+                       "labels": labels, "ch_names": list(channels)}, file)
+
+    session = {"samplestamps": samplestamps[:row], "samples": samples[:row], "stim": stim[:row],
+               "labels": labels, "ch_names": list(channels)}
+    return _apply_events(session, csv_file_path)
+
+def log_channels(log_path):
+    """Return the channel columns of a log, a CSV or a DataLogger "npy" log directory
+
+    Parameters:
+    log_path (str): Path to the CSV (or "npy" log directory) written by the motor imagery task
+
+    Returns:
+    list: The channel names, in the order of the columns
+    """
+    if os.path.isdir(log_path):
+        with open(os.path.join(log_path, "meta.json")) as file:
+            return list(json.load(file)["columns"])
+    with open(log_path, newline="") as file:
+        header = next(csv.reader(file))
+    return [column for column in header if column not in ("samplestamps", "stim")]
+
+def _load_data_log(log_path, channels=None, mmap=True):
+    """Load a log directory written by clients/utils.py's DataLogger in the "npy" format"""
+    with open(os.path.join(log_path, "meta.json")) as file:
+        meta = json.load(file)
+    with open(os.path.join(log_path, "index.csv")) as file:
+        chunks = [int(row["chunk"]) for row in csv.DictReader(file)]
+
+    columns = meta["columns"]
+    channels = list(columns) if channels is None else list(channels)
+    indices = [columns.index(channel) for channel in channels]
+    mmap_mode = "r" if mmap else None
+    load = lambda chunk, suffix: np.load(os.path.join(log_path, "chunk_{:06d}.{}.npy".format(chunk, suffix)), mmap_mode=mmap_mode)
+
+    n_rows = sum(len(load(chunk, "samplestamps")) for chunk in chunks)
+    samplestamps = np.empty(n_rows, dtype=np.int64)
+    samples = np.empty((n_rows, len(channels)), dtype=np.float32)
+    row = 0
+    for chunk in chunks:
+        chunk_samples = load(chunk, "samples")
+        n = len(chunk_samples)
+        samplestamps[row:row + n] = load(chunk, "samplestamps")
+        samples[row:row + n] = chunk_samples[:, indices]
+        row += n
+
+    # Label changes of logs written with a label column, each label holds until the next one
+    stim = np.full(n_rows, -1, dtype=np.int16)
+    labels = []
+    labels_path = os.path.join(log_path, "labels.csv")
+    if os.path.exists(labels_path):
+        changes = pd.read_csv(labels_path, dtype={"label": object})
+        rows = np.append(changes["row"].to_numpy(), n_rows)
+        for i, label in enumerate(changes["label"]):
+            if pd.isna(label):
+                continue
+            if label not in labels:
+                labels.append(label)
+            stim[rows[i]:rows[i + 1]] = labels.index(label)
+
+    return {"samplestamps": samplestamps, "samples": samples, "stim": stim, "labels": labels, "ch_names": channels}
+
+def _apply_events(session, csv_file_path):
+    """Label the samples of a session from its event table, if it has one"""
+    events_path = os.path.splitext(csv_file_path)[0] + EVENTS_SUFFIX
+    if not os.path.exists(events_path):
+        return session
+
+    events = pd.read_csv(events_path, dtype={"label": object})
+    labels = list(pd.unique(events["label"]))
+    samplestamps = session["samplestamps"]
+    stim = np.full(len(samplestamps), -1, dtype=np.int16)
+
+    # Samplestamps increase along the log, so each event covers one contiguous range of rows
+    onsets = np.searchsorted(samplestamps, events["onset_samplestamp"].to_numpy())
+    offsets = np.searchsorted(samplestamps, events["offset_samplestamp"].to_numpy())
+    for onset, offset, label in zip(onsets, offsets, events["label"]):
+        stim[onset:offset] = labels.index(label)
+
+    return dict(session, stim=stim, labels=labels)
+
+def _count_rows(csv_file_path, block_size=1 << 24):
+    """Count the data rows of a CSV file without parsing it"""
+    n_lines = 0
+    last = b"\n"
+    with open(csv_file_path, "rb") as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            n_lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        n_lines += 1
+    return n_lines - 1  # header
+
+def segment_trials(stim, labels, rest_label=REST_LABEL, cue_labels=CUE_LABELS):
+    """Segment a session into trials with run-length detection on the stimulus codes.
+
+    A trial starts at the first sample of a rest (fixation) run that is followed by a cue run, and
+    ends at the start of the next rest run (or at the end of the session). Samples without a label
+    are ignored.
+
+    Parameters:
+    stim (ndarray): Label code of each sample, -1 for no label, shape (n_rows,)
+    labels (list): Label of each code
+    rest_label (str): Label of the rest period that starts a trial
+    cue_labels (dict): Class of each cue label
+
+    Returns:
+    starts (ndarray): First sample of each trial
+    stops (ndarray): Sample after the last sample of each trial
+    y (ndarray): Class of each trial
+    """
+    stim = np.asarray(stim)
+    if rest_label not in labels:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rest = labels.index(rest_label)
+    classes = np.full(len(labels), -1)
+    for label, cls in cue_labels.items():
+        if label in labels:
+            classes[labels.index(label)] = cls
+
+    # Runs of identical labels, ignoring unlabelled samples
+    labelled = np.flatnonzero(stim >= 0)
+    codes = stim[labelled]
+    run_starts = np.flatnonzero(np.diff(codes, prepend=-2))
+    run_codes = codes[run_starts]
+    run_starts = labelled[run_starts]
+
+    unknown = (run_codes != rest) & (classes[run_codes] < 0)
+    if unknown.any():
+        raise ValueError(f"Unknown stimuli: {labels[run_codes[unknown][0]]}")
+
+    # A trial is a rest run followed by a cue run
+    is_trial = (run_codes[:-1] == rest) & (run_codes[1:] != rest)
+    trial_runs = np.flatnonzero(is_trial)
+    rest_runs = np.flatnonzero(run_codes == rest)
+
+    starts = run_starts[trial_runs]
+    next_rest = np.searchsorted(rest_runs, trial_runs, side="right")
+    stops = np.append(run_starts, len(stim))[np.append(rest_runs, len(run_starts))[next_rest]]
+    y = classes[run_codes[trial_runs + 1]]
+    return starts, stops, y
+
+def epoch_trials(samples, starts, n_samples=2000, channels_first=True):
+    """Copy fixed-length trials out of a session into one preallocated array.
+
+    Parameters:
+    samples (ndarray): Session data of shape (n_rows, n_channels)
+    starts (ndarray): First sample of each trial
+    n_samples (int): Number of samples kept per trial, from its start
+    channels_first (bool): Return (n_trials, n_channels, n_samples), as csp expects, instead of (n_trials, n_samples, n_channels)
+
+    Returns:
+    ndarray: The trials
+    """
+    n_channels = samples.shape[1]
+    shape = (len(starts), n_channels, n_samples) if channels_first else (len(starts), n_samples, n_channels)
+    X = np.empty(shape, dtype=samples.dtype)
+    for i, start in enumerate(starts):
+        trial = samples[start:start + n_samples]
+        X[i] = trial.T if channels_first else trial
+    return X
+
+def load_trials(csv_file_path, n_samples=2000, channels=None, cache=True):
+    """Load a motor imagery session and return its trials and classes.
+
+    Trials shorter than `n_samples` are dropped.
+
+    Parameters:
+    csv_file_path (str): Path to the CSV (or "npy" log directory) written by the motor imagery task
+    n_samples (int): Number of samples kept per trial, from the start of its rest period
+    channels (list): Channel columns to load, all the channel columns by default
+    cache (bool): Use the binary cache of the session
+
+    Returns:
+    X (ndarray): Trials of shape (n_trials, n_channels, n_samples)
+    y (ndarray): Class of each trial (0 for right hand, 1 for left hand)
+    """
+    session = load_session(csv_file_path, channels=channels, cache=cache)
+    starts, stops, y = segment_trials(session["stim"], session["labels"])
+    complete = stops - starts >= n_samples
+    return epoch_trials(session["samples"], starts[complete], n_samples), y[complete]
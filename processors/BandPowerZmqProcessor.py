@@ -0,0 +1,50 @@
+from PublisherZmqProcessor import PublisherZmqProcessor
+from filter_bank import FilterBankBandPower, BANDS
+
+
+class BandPowerZmqProcessor(PublisherZmqProcessor):
+    """Publishes the processed data like PublisherZmqProcessor, and the live power of the EEG frequency bands
+
+    Band power is computed with causal IIR filter banks (see `filter_bank.FilterBankBandPower`) whose
+    state is carried from batch to batch, and published on its own topic in the same wire format as
+    the data. Each published sample holds the power of every band for every channel, band-major:
+    [band 0 channel 0, ..., band 0 channel N, band 1 channel 0, ...], bands in the order of BANDS.
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 power_topic: str = "BandPower", sfreq: float = 1024.0, bands: dict = BANDS, smoothing: float = 0.25, publish_data: bool = True, **kwargs):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
+            pub_port (int, optional): Port to publish batch processed data. Defaults to 6000.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 6001.
+            pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" or "pickle". Defaults to "binary".
+            power_topic(str, optional): Topic to publish band power. Defaults to "BandPower".
+            sfreq(float, optional): Sampling rate of the study in Hz. Defaults to 1024.
+            bands(dict, optional): Frequency range (low, high) in Hz of each band. Defaults to BANDS.
+            smoothing(float, optional): Time constant of the power envelope in seconds. Defaults to 0.25.
+            publish_data(bool, optional): Also publish the data batches on pub_topic. Defaults to True.
+            kwargs: other arguments of PublisherZmqProcessor (snapshot_port, verbose, stats_interval...)
+        """
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, rep_port, pub_topic, wire_format, **kwargs)
+
+        self.power_topic = power_topic
+        self.publish_data = publish_data
+        self.band_power = FilterBankBandPower(sfreq, bands, smoothing=smoothing)
+        self.config.update(power_topic=power_topic, sfreq=sfreq, bands=self.band_power.bands,
+                           smoothing=smoothing, publish_data=publish_data)
+        print("Publishing power of bands {} to topic {}".format(", ".join(self.band_power.band_names), self.power_topic))
+
+    def process(self, n_channels, samplestamps, samples):
+        """Publish the data (unless `publish_data` is False) and the band power of a batch, see `PublisherZmqProcessor.process_derived`"""
+        self.process_derived(n_channels, samplestamps, samples, self.publish_band_power, self.publish_data)
+
+    def publish_band_power(self, samplestamps, samples):
+        """Compute the band power of a batch and publish it on power_topic"""
+        with self.instrumentation.stage("band_power"):
+            power = self.band_power.process(samples)
+        self.publish(self.power_topic, samplestamps, power.reshape(len(power), -1))
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+from PublisherZmqProcessor import PublisherZmqProcessor
+from online_decoder import OnlineDecoder
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "models")
+
+
+class DecoderZmqProcessor(PublisherZmqProcessor):
+    """Publishes the processed data like PublisherZmqProcessor, and decodes it on the acquisition side
+
+    Predictions are published on their own topic in the same wire format as the data, with one row
+    per prediction: samplestamps holds the samplestamp the decoding window ends on and samples holds
+    [prediction, feature_1, ..., feature_n] as float32. Game clients can subscribe to this topic only
+    and receive a few bytes per decision instead of the full multichannel batches.
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 pred_topic: str = "Predictions", filters_file: str = os.path.join(MODELS_DIR, "csp_filters.npy"), model_file: str = os.path.join(MODELS_DIR, "MI_model.pkl"),
+                 win_size: int = 2000, hop_size: int = 100, publish_data: bool = True, **kwargs):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
+            pub_port (int, optional): Port to publish batch processed data. Defaults to 6000.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 6001.
+            pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" or "pickle". Defaults to "binary".
+            pred_topic(str, optional): Topic to publish predictions. Defaults to "Predictions".
+            filters_file(str, optional): CSP filters saved by the training notebook. Defaults to notebooks/models/csp_filters.npy.
+            model_file(str, optional): Pickled classifier saved by the training notebook. Defaults to notebooks/models/MI_model.pkl.
+            win_size(int, optional): Samples per decoding window. Defaults to 2000.
+            hop_size(int, optional): Samples between two predictions. Defaults to 100.
+            publish_data(bool, optional): Also publish the data batches on pub_topic. Defaults to True.
+            kwargs: other arguments of PublisherZmqProcessor (snapshot_port, verbose, stats_interval...)
+        """
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, rep_port, pub_topic, wire_format, **kwargs)
+
+        self.pred_topic = pred_topic
+        self.publish_data = publish_data
+        self.decoder = OnlineDecoder.from_files(filters_file, model_file, win_size=win_size, hop_size=hop_size)
+        self.config.update(pred_topic=pred_topic, filters_file=filters_file, model_file=model_file,
+                           win_size=win_size, hop_size=hop_size, publish_data=publish_data)
+        print("Publishing predictions to topic {}".format(self.pred_topic))
+
+    def process(self, n_channels, samplestamps, samples):
+        """Publish the data (unless `publish_data` is False) and the predictions of a batch, see `PublisherZmqProcessor.process_derived`"""
+        self.process_derived(n_channels, samplestamps, samples, self.publish_predictions, self.publish_data)
+
+    def publish_predictions(self, samplestamps, samples):
+        """Decode a batch and publish the new predictions on pred_topic"""
+        with self.instrumentation.stage("decode"):
+            predictions = self.decoder.update(samplestamps, samples)
+        if predictions:
+            pred_samplestamps = np.array([pred["samplestamp"] for pred in predictions])
+            pred_samples = np.array([np.concatenate(([pred["prediction"]], pred["features"])) for pred in predictions], dtype=np.float32)
+            self.publish(self.pred_topic, pred_samplestamps, pred_samples)
+            self.instrumentation.log("Sent {} predictions, decoding latency {:.2f} ms", len(predictions), predictions[-1]["latency_ms"])
@@ -0,0 +1,54 @@
+from PublisherZmqProcessor import PublisherZmqProcessor
+from decimation import StreamingDecimator, DECIMATION_MODES
+
+
+class DisplayZmqProcessor(PublisherZmqProcessor):
+    """Publishes the processed data like PublisherZmqProcessor, and a reduced copy of it for displays
+
+    The display stream is decimated on the acquisition side by a `decimation.StreamingDecimator`
+    and published on its own topic in the same wire format as the data. In "envelope" mode each
+    bucket of `factor` samples is published as two rows, its per-channel minimum then maximum,
+    stamped with the first and last samplestamp of the bucket; in "lowpass" mode one low-passed
+    sample in `factor` is published. A visualizer subscribed to this topic draws a fixed number of
+    points per second of signal, whatever the sampling rate, and receives `factor` / 2 (or
+    `factor`) times fewer bytes. Nothing is published until a bucket is complete.
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 display_topic: str = "Display", factor: int = 8, mode: str = "envelope", publish_data: bool = True, **kwargs):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
+            pub_port (int, optional): Port to publish batch processed data. Defaults to 6000.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 6001.
+            pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" or "pickle". Defaults to "binary".
+            display_topic(str, optional): Topic to publish the decimated data. Defaults to "Display".
+            factor(int, optional): Input samples per bucket of the decimator. Defaults to 8.
+            mode(str, optional): One of "envelope" (min-max) or "lowpass" (anti-aliased decimation). Defaults to "envelope".
+            publish_data(bool, optional): Also publish the data batches on pub_topic. Defaults to True.
+            kwargs: other arguments of PublisherZmqProcessor (snapshot_port, verbose, stats_interval...)
+        """
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, rep_port, pub_topic, wire_format, **kwargs)
+
+        if mode not in DECIMATION_MODES:
+            raise ValueError("Unknown decimation mode '{}', expected one of {}".format(mode, DECIMATION_MODES))
+        self.display_topic = display_topic
+        self.publish_data = publish_data
+        self.decimator = StreamingDecimator(factor, mode)
+        self.config.update(display_topic=display_topic, factor=factor, mode=mode, publish_data=publish_data)
+        print("Publishing data decimated by {} ({}) to topic {}".format(factor, mode, self.display_topic))
+
+    def process(self, n_channels, samplestamps, samples):
+        """Publish the data (unless `publish_data` is False) and the decimated data of a batch, see `PublisherZmqProcessor.process_derived`"""
+        self.process_derived(n_channels, samplestamps, samples, self.publish_display, self.publish_data)
+
+    def publish_display(self, samplestamps, samples):
+        """Decimate a batch and publish the complete buckets on display_topic"""
+        with self.instrumentation.stage("decimate"):
+            display_stamps, display_samples = self.decimator.process(samplestamps, samples)
+        if len(display_stamps):
+            self.publish(self.display_topic, display_stamps, display_samples)
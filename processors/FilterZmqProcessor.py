@@ -0,0 +1,86 @@
+import numpy as np
+from PublisherZmqProcessor import PublisherZmqProcessor
+from filter_bank import StreamingSosFilter, Rereference, preprocessing_sos
+
+
+class FilterZmqProcessor(PublisherZmqProcessor):
+    """Publishes the processed data like PublisherZmqProcessor, and a filtered copy of it for the clients
+
+    Each batch is re-referenced (common average or bipolar pairs, optional), then filtered by one
+    causal cascade of second-order sections: notches at the power line frequency and its
+    harmonics followed by a Butterworth band-pass (see `filter_bank.preprocessing_sos`). The
+    filter state is carried from batch to batch and all channels go through a single `sosfilt`
+    call, so the cost per sample is the same at batch_size=1 as with large batches, and the
+    filtered stream is the same however it is cut into batches.
+
+    The filtered batches are published on their own topic in the same wire format and dtype as the
+    data, with one channel per output channel: the input channels, or one per bipolar pair.
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 filter_topic: str = "Filtered", sfreq: float = 1024.0, band: tuple = (1.0, 100.0), line_freq: float = 60.0, harmonics: int = 3,
+                 notch_q: float = 30.0, order: int = 4, reference: str = None, bipolar_pairs: list = None, publish_data: bool = True, **kwargs):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
+            pub_port (int, optional): Port to publish batch processed data. Defaults to 6000.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 6001.
+            pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" or "pickle". Defaults to "binary".
+            filter_topic(str, optional): Topic to publish the filtered data. Defaults to "Filtered".
+            sfreq(float, optional): Sampling rate of the study in Hz. Defaults to 1024.
+            band(tuple, optional): (low, high) cutoffs of the band-pass in Hz, None for no band-pass. Defaults to (1.0, 100.0).
+            line_freq(float, optional): Power line frequency in Hz, 50 or 60, None for no notch. Defaults to 60.0.
+            harmonics(int, optional): Number of line frequency multiples notched. Defaults to 3.
+            notch_q(float, optional): Quality factor of the notches. Defaults to 30.0.
+            order(int, optional): Order of the Butterworth band-pass. Defaults to 4.
+            reference(str, optional): None, "car" (common average) or "bipolar". Defaults to None.
+            bipolar_pairs(list, optional): (channel, reference) pairs for "bipolar", as indices or channel names. Defaults to None.
+            publish_data(bool, optional): Also publish the data batches on pub_topic. Defaults to True.
+            kwargs: other arguments of PublisherZmqProcessor (snapshot_port, verbose, stats_interval...)
+        """
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, rep_port, pub_topic, wire_format, **kwargs)
+
+        self.filter_topic = filter_topic
+        self.publish_data = publish_data
+        self.sos = preprocessing_sos(sfreq, band, line_freq, harmonics, notch_q, order)
+        self.filter = StreamingSosFilter(self.sos)
+        self.reference = reference
+        self.bipolar_pairs = bipolar_pairs
+        # Pairs given as channel names are looked up in the study info here, not on the processing loop
+        pairs = bipolar_pairs if reference != "bipolar" or self.pairs_are_indices() else self.resolve_pairs()
+        self.rereference = Rereference(reference, pairs)
+        self.config.update(filter_topic=filter_topic, sfreq=sfreq, band=band, line_freq=line_freq, harmonics=harmonics,
+                           notch_q=notch_q, order=order, reference=reference, bipolar_pairs=bipolar_pairs,
+                           n_sections=len(self.sos), publish_data=publish_data)
+        print("Publishing data filtered by {} sections ({} reference) to topic {}".format(len(self.sos), reference or "no", self.filter_topic))
+
+    def pairs_are_indices(self) -> bool:
+        return all(isinstance(channel, (int, np.integer)) for pair in self.bipolar_pairs or [] for channel in pair)
+
+    def resolve_pairs(self) -> list:
+        """Return the bipolar pairs as channel indices, looking the channel names up in the study info"""
+        ch_names = list(self.info_service.study_info()['channelNames'])
+        try:
+            return [tuple(channel if isinstance(channel, (int, np.integer)) else ch_names.index(channel) for channel in pair)
+                    for pair in self.bipolar_pairs]
+        except ValueError as e:
+            raise ValueError("Bipolar pair channel not in the study: {}".format(e))
+
+    def process(self, n_channels, samplestamps, samples):
+        """Publish the data (unless `publish_data` is False) and the filtered data of a batch, see `PublisherZmqProcessor.process_derived`"""
+        self.process_derived(n_channels, samplestamps, samples, self.publish_filtered, self.publish_data)
+
+    def publish_filtered(self, samplestamps, samples):
+        """Re-reference and filter a batch and publish it on filter_topic"""
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(len(samplestamps), -1)
+        with self.instrumentation.stage("filter"):
+            filtered = self.filter.process(self.rereference.process(samples))
+            if np.issubdtype(samples.dtype, np.floating):
+                filtered = filtered.astype(samples.dtype, copy=False)
+        self.publish(self.filter_topic, samplestamps, filtered)
@@ -0,0 +1,145 @@
+import time
+import queue
+import threading
+import numpy as np
+from PublisherZmqProcessor import PublisherZmqProcessor
+from pipeline import PublishStage
+
+
+class PipelineZmqProcessor(PublisherZmqProcessor):
+    """Runs an ordered list of stages (see `pipeline.py`) on a worker thread, off the acquisition callback
+
+    `process` only copies the batch into one of `queue_size` preallocated buffers and queues it,
+    so its cost does not depend on the stages; when all the buffers are in use (the worker has
+    fallen `queue_size` batches behind) the batch is dropped and counted. The worker runs the
+    stages in order on the buffer, answers snapshot requests and publishes the stats.
+
+    Every stage is timed under its name, the time batches wait in the queue under "queue", and the
+    queue depth and dropped batches appear in the stats as the "queue_depth" gauge and the
+    "dropped" counter; the instrumentation is only used on the worker thread, the callback
+    only counts the dropped batches in `n_dropped`. The default pipeline only publishes the data,
+    on `pub_topic` and the topics of the channel groups; a pipeline such as filter ->
+    re-reference -> CSP -> publish is built by passing `stages`, e.g. from a subclass, since
+    NeuroWorks creates the processor with its default arguments.
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 stages: list = None, queue_size: int = 64, **kwargs):
+        """Class constructor
+        Args:
+            sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
+            batch_size (int, optional): Batch size to process. Defaults to 1.
+            info_port (int, optional): Port to request study info from. Defaults to 5597.
+            event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
+            pub_port (int, optional): Port to publish batch processed data. Defaults to 6000.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 6001.
+            pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" or "pickle". Defaults to "binary".
+            stages(list, optional): `pipeline.Stage` objects run in order on every batch. Defaults to [PublishStage()], which publishes the data and its channel groups.
+            queue_size(int, optional): Batches that can wait for the worker before new ones are dropped. Defaults to 64.
+            kwargs: other arguments of PublisherZmqProcessor (snapshot_port, verbose, stats_interval...)
+        """
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, rep_port, pub_topic, wire_format, **kwargs)
+
+        self.stages = list(stages) if stages is not None else [PublishStage()]
+        self.queue_size = queue_size
+        self.stage_shape = None  # (n_channels, max_samples) the stages were set up for
+        # Buffers are allocated on the first batch that uses them, once the channel count is known
+        self.free = queue.Queue()
+        for _ in range(queue_size):
+            self.free.put((None, None))
+        self.work = queue.Queue()
+        self.n_dropped = 0  # only written by the callback thread
+        self.recorded_dropped = 0  # only written by the worker
+        self.config.update(stages=[stage.name for stage in self.stages], queue_size=queue_size)
+        print("Running stages {} on the pipeline thread".format(" -> ".join(stage.name for stage in self.stages)))
+
+        self.worker = threading.Thread(target=self.run_pipeline, daemon=True)
+        self.worker.start()
+
+    def process(self, n_channels, samplestamps, samples):
+        """This function will receive `M x N` array of sample data
+            - M is defined by the `--batch` argument provided to `python zmq-sub.py` (see -h for defaults)
+            - N is defined by the `--channels` argument provided to `python zmq-sub.py` (see -h, default is to receive all channels)
+        Args:
+            n_channels (int): the number of channels per sample sent by the publisher (for each zmq message)
+            samplestamps([1D array]): array of batch_size items, each item is a samplestamp
+            samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+        """
+        try:
+            stamps_buffer, samples_buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.n_dropped += 1
+            return
+
+        samplestamps = np.asarray(samplestamps)
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(len(samplestamps), -1)
+        n_samples = len(samplestamps)
+        if (samples_buffer is None or len(samples_buffer) < n_samples or samples_buffer.shape[1] != samples.shape[1]
+                or samples_buffer.dtype != samples.dtype or stamps_buffer.dtype != samplestamps.dtype):
+            size = max(n_samples, self.batch_size)
+            stamps_buffer = np.empty(size, dtype=samplestamps.dtype)
+            samples_buffer = np.empty((size, samples.shape[1]), dtype=samples.dtype)
+        stamps_buffer[:n_samples] = samplestamps
+        samples_buffer[:n_samples] = samples
+
+        self.work.put((stamps_buffer, samples_buffer, n_samples, time.perf_counter()))
+
+    def setup_stages(self, n_channels: int, max_samples: int):
+        """Let the stages allocate their arrays, again when the channel count changes or a batch is larger"""
+        self.stage_shape = (n_channels, max_samples)
+        for stage in self.stages:
+            n_channels = stage.setup(self, n_channels, max_samples)
+
+    def record_dropped(self):
+        """Count the batches the callback dropped since the last call, on the worker thread"""
+        n_dropped = self.n_dropped
+        if n_dropped != self.recorded_dropped:
+            self.instrumentation.count("dropped", n_dropped - self.recorded_dropped)
+            self.recorded_dropped = n_dropped
+
+    def run_pipeline(self):
+        """Worker thread: run the stages on every queued batch until `stop` is called"""
+        instrumentation = self.instrumentation
+        while True:
+            try:
+                item = self.work.get(timeout=0.1)
+            except queue.Empty:
+                # Keep answering snapshot requests while the stream is idle
+                self.handle_requests()
+                self.record_dropped()
+                continue
+            if item is None:
+                break
+
+            stamps_buffer, samples_buffer, n_samples, queued_time = item
+            instrumentation.record("queue", (time.perf_counter() - queued_time) * 1000)
+            # Batches waiting, this one included
+            instrumentation.gauge("queue_depth", self.work.qsize() + 1)
+            self.record_dropped()
+            self.handle_requests()
+
+            if self.stage_shape is None or self.stage_shape[0] != samples_buffer.shape[1] or self.stage_shape[1] < n_samples:
+                self.setup_stages(samples_buffer.shape[1], max(n_samples, self.batch_size))
+            samplestamps, samples = stamps_buffer[:n_samples], samples_buffer[:n_samples]
+            try:
+                for stage in self.stages:
+                    with instrumentation.stage(stage.name):
+                        samplestamps, samples = stage.process(samplestamps, samples)
+            except Exception as e:
+                instrumentation.count("errors")
+                print("Error in the pipeline: {}".format(e))
+            finally:
+                self.free.put((stamps_buffer, samples_buffer))
+
+            self.last_time = self.curr_time
+            self.curr_time = time.time()
+            instrumentation.batch_done(n_samples)
+            instrumentation.log("Processed batch of {} samples, {} waiting", n_samples, self.work.qsize())
+
+    def stop(self):
+        """Process the queued batches and stop the worker"""
+        self.work.put(None)
+        self.worker.join()
@@ -5,12 +5,19 @@ from matplotlib.animation import FuncAnimation
 import threading
 import queue
 from BaseZmqProcessor import BaseZmqProcessor
+from ring_buffer import RingBuffer
+from decimation import display_factor
+from instrumentation import Instrumentation
 
 class PlotZmqProcessor(BaseZmqProcessor):
-    def __init__(self, sub_ip="localhost", batch_size=1, info_port=5597, event_port=5598):
+    def __init__(self, sub_ip="localhost", batch_size=1, info_port=5597, event_port=5598,
+                 verbose=False, stats_interval=5.0, stats_file=None):
         print("Initializing user-defined batch-processor")
 
         super().__init__(sub_ip, batch_size, info_port, event_port)
+
+        # Timing of the queueing stage, printed per batch only when verbose
+        self.instrumentation = Instrumentation(verbose, stats_interval, stats_file)
         
         # Data storage and queue for thread-safe sharing
         self.data_queue = queue.Queue()
@@ -20,36 +27,35 @@ class PlotZmqProcessor(BaseZmqProcessor):
         self.plot_thread.start()
     
     def update_plot(self, frame, axs: plt.Axes):
-        # Create a line object
-        # line, = axs.plot([], [])
-        line_objects = []
-        
         # Update the plot with data from the queue
         while not self.data_queue.empty():
             new_samples = self.data_queue.get_nowait()
-            for ch in range(self.n_channels):
-                self.data[ch].extend(new_samples[:, ch])
-                self.data[ch] = self.data[ch][-2000:]  # Keep only the last 2000 samples
-        
+            self.data.write(new_samples[:, :self.n_channels])  # Keeps only the last win_size samples
+
+        x = self.data.x_view()
+        y = self.data.view()
         for i, ax in enumerate(axs):
-            ax.clear()
-            ax.set_title(f"Channel {i+1}")
-            line, = ax.plot(self.data[i])
+            self.lines[i].set_data(x, y[i])
             ax.relim()
             ax.autoscale_view(True, True, True)
-            line_objects.append(line)
 
-        return line_objects
+        return self.lines
     
-    def plot_data(self, n_channels : int = 2):
+    def plot_data(self, n_channels : int = 2, win_size: int = 2000, max_points: int = 1000):
         self.n_channels = n_channels  # Set the number of channels you want to plot
 
         fig, axs = plt.subplots(self.n_channels, 1, figsize=(8, 6 * self.n_channels))
 
         fig.subplots_adjust(hspace=0.5)
 
-        # Initialize empty lists to store data for each channel
-        self.data = [[] for _ in range(self.n_channels)]
+        # Preallocate the history of each channel, reduced to a min-max envelope of at most max_points
+        # points per line, and create one line per channel
+        self.data = RingBuffer(self.n_channels, win_size, decimation=display_factor(win_size, max_points))
+        self.lines = []
+        for i, ax in enumerate(axs):
+            ax.set_title(f"Channel {i+1}")
+            line, = ax.plot([], [])
+            self.lines.append(line)
         
         # Setup FuncAnimation for real-time updates
         ani = FuncAnimation(fig, self.update_plot, fargs=(axs,), interval=100, blit=False, repeat=False)
@@ -70,10 +76,12 @@ class PlotZmqProcessor(BaseZmqProcessor):
         ###################################
         # YOUR BATCH PROCESSING GOES HERE #
         ###################################
-        self.data_queue.put(np.asarray(samples))
+        with self.instrumentation.stage("queue"):
+            self.data_queue.put(np.asarray(samples))
         
         # measure time from the last call in milliseconds
         self.last_time = self.curr_time
         self.curr_time = time.time()
-        print("Time since last call: {} ms".format((self.curr_time - self.last_time)*1000))
-        print("Received batch of {} samples with {} channels".format(len(samplestamps), n_channels))
\ No newline at end of file
+        self.instrumentation.batch_done(len(samplestamps))
+        self.instrumentation.log("Time since last call: {} ms", (self.curr_time - self.last_time)*1000)
+        self.instrumentation.log("Received batch of {} samples with {} channels", len(samplestamps), n_channels)
\ No newline at end of file
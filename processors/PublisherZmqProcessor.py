@@ -1,10 +1,16 @@
 import numpy as np
 import time
+import json
+import atexit
 import zmq
 from zmq import Socket
-import pickle
 from BaseZmqProcessor import BaseZmqProcessor
-import struct
+from wire_format import encode_batch, WIRE_FORMATS
+from stream_history import StreamHistory, SNAPSHOT_REQUEST, SNAPSHOT_REPLY
+from info_service import InfoService
+from instrumentation import Instrumentation
+from shared_ring import SharedRingWriter, SHM_TOPIC_PREFIX, encode_notification
+from channel_groups import group_topic, resolve_group
 
 class PublisherZmqProcessor(BaseZmqProcessor):
     """Notes:
@@ -13,7 +19,10 @@ class PublisherZmqProcessor(BaseZmqProcessor):
         - If you wish to change the class/file name, be sure to call the subscriber with `--class YourNewName`
     """
     
-    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData"):
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 6000, rep_port: int = 6001, pub_topic : str = "ProcessedData", wire_format: str = "binary",
+                 snapshot_port: int = 6002, history_seconds: float = 10.0,
+                 verbose: bool = False, stats_interval: float = 5.0, stats_file: str = None, stats_topic: str = "Stats",
+                 shared_memory: bool = False, shm_capacity: int = 16384, channel_groups: dict = None, publish_full: bool = True):
         """Class constructor
         Args:
             sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
@@ -22,20 +31,78 @@ class PublisherZmqProcessor(BaseZmqProcessor):
             event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
             pub_port (int, optional): Port to publish batch processed data. Defaults to 5000.
             pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            wire_format(str, optional): "binary" for raw array frames, "pickle" for clients that expect the legacy pickled frames. Defaults to "binary".
+            snapshot_port(int, optional): Port to serve the recent history to late subscribers, None to not serve it. Defaults to 6002.
+            history_seconds(float, optional): Seconds of published batches kept for late subscribers, 0 to keep none. Defaults to 10.0.
+            verbose(bool, optional): Print messages for every batch, which slows down small batches. Defaults to False.
+            stats_interval(float, optional): Seconds between two timing summaries, 0 for none. Defaults to 5.0.
+            stats_file(str, optional): JSON file the timing summaries are written to. Defaults to None.
+            stats_topic(str, optional): Topic the timing summaries are published to as JSON, None to not publish them. Defaults to "Stats".
+            shared_memory(bool, optional): Also write every batch to a shared-memory ring per topic for subscribers on this host, see shared_ring.py. Defaults to False.
+            shm_capacity(int, optional): Samples kept in each ring, which bounds the batch size and how long a subscriber can hold a batch. Defaults to 16384.
+            channel_groups(dict, optional): Channel names (or indices) of each group, published on their own topic "<group>/<pub_topic>", see channel_groups.py. Defaults to None.
+            publish_full(bool, optional): Publish all the channels on pub_topic, set to False when every client subscribes to a group. Defaults to True.
         """
         print("Initializing user-defined batch-processor")
 
         super().__init__(sub_ip, batch_size, info_port, event_port)
 
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError("Unknown wire format '{}', expected one of {}".format(wire_format, WIRE_FORMATS))
+        self.wire_format = wire_format
+        self.seq = {}  # next sequence number of each topic
+        self.stats_topic = stats_topic
+        self.instrumentation = Instrumentation(verbose, stats_interval, stats_file,
+                                               report=self.publish_stats if stats_topic is not None else None)
+
         # Setup the ZeroMQ context & publisher
         self.pub_topic = pub_topic
         self.pub_port = pub_port
         self.pub_socket: Socket = self.context.socket(zmq.PUB)
         self.setupPublisher(self.pub_socket, self.pub_port, self.pub_topic)
 
+        # Settings reported to clients by the "get_config" request, subclasses add their own
+        self.config = {"processor": type(self).__name__, "batch_size": batch_size, "pub_port": pub_port, "rep_port": rep_port,
+                       "snapshot_port": snapshot_port, "pub_topic": pub_topic, "wire_format": wire_format,
+                       "history_seconds": history_seconds, "stats_topic": stats_topic,
+                       "shared_memory": shared_memory, "shm_capacity": shm_capacity,
+                       "channel_groups": {group: list(channels) for group, channels in (channel_groups or {}).items()},
+                       "publish_full": publish_full}
+
+        self.channel_groups = dict(channel_groups or {})
+        self.group_topics = {group: group_topic(group, pub_topic) for group in self.channel_groups}
+        self.publish_full = publish_full
+        for group, topic in self.group_topics.items():
+            # A subscriber to the full data or the stats must not receive the groups by prefix matching
+            if any(topic.startswith(other) for other in (pub_topic, stats_topic) if other):
+                raise ValueError("Channel group {} would be received by the subscribers of another topic".format(group))
+            print("Publishing channel group {} to topic {}".format(group, topic))
+
+        # Requests (channel names, study info...) are answered on their own thread, off the processing loop
         self.rep_port = rep_port
-        self.rep_socket: Socket = self.context.socket(zmq.REP)
-        self.setupReplier(self.rep_socket, self.rep_port)
+        self.info_service = InfoService(self.context, self.rep_port, lambda: self.request_info(self.info_socket), self.status)
+        # Channel groups are looked up in the study's channel names now, so that unknown channels fail
+        # here and the processing loop never waits for the study info
+        self.group_indices = {}
+        if self.channel_groups:
+            ch_names = list(self.info_service.study_info()['channelNames'])
+            self.group_indices = {group: resolve_group(channels, ch_names) for group, channels in self.channel_groups.items()}
+        self.info_service.start()
+
+        # Recent batches of every topic, served in one message to subscribers that join late
+        self.history = StreamHistory(history_seconds) if history_seconds > 0 else None
+        self.snapshot_port = snapshot_port
+        self.snapshot_socket: Socket = None
+        if self.snapshot_port is not None:
+            self.snapshot_socket = self.context.socket(zmq.ROUTER)
+            self.setupReplier(self.snapshot_socket, self.snapshot_port)
+
+        # Shared-memory ring of every topic, created on its first batch; TCP stays for remote subscribers
+        self.shared_memory = shared_memory
+        self.shm_capacity = shm_capacity
+        self.rings = {}
+        if self.shared_memory:
+            atexit.register(self.close_rings)
 
     def setupPublisher(self, socket: zmq.Socket, pub_port: int, pub_topic: str):
         """Bind a PUBlisher to a given port, and print PUB info
@@ -60,6 +127,132 @@ class PublisherZmqProcessor(BaseZmqProcessor):
         socket.bind(url)
         print("Replying on: {}".format(url))
 
+    def publish(self, topic: str, samplestamps, samples, copy: bool = True):
+        """Publish a batch on a topic using the configured wire format
+
+        ZeroMQ sends the arrays after this returns, without copying them, and the history keeps
+        them, so by default the batch is copied once here: the SDK and the stages may reuse their
+        arrays for the next batch.
+
+        Args:
+            topic (str): topic to publish to
+            samplestamps([1D array]): array of batch_size items, each item is a samplestamp
+            samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+            copy(bool, optional): Copy the arrays; False only for arrays that are never modified afterwards. Defaults to True.
+        """
+        instrumentation = self.instrumentation
+        with instrumentation.stage("convert"):
+            samplestamps = np.array(samplestamps, order="C") if copy else np.asarray(samplestamps)
+            samples = np.array(samples, order="C") if copy else np.asarray(samples)
+        seq = self.seq.get(topic, 0)
+        timestamp = time.time()
+        with instrumentation.stage("serialize"):
+            frames = encode_batch(samplestamps, samples, timestamp, seq, self.wire_format)
+        with instrumentation.stage("send"):
+            self.pub_socket.send_multipart([topic.encode()] + frames, copy=False)
+        if self.shared_memory:
+            with instrumentation.stage("shm"):
+                self.publish_shared(topic, samplestamps, samples, timestamp, seq)
+        self.seq[topic] = seq + 1
+        if self.history is not None:
+            with instrumentation.stage("history"):
+                self.history.append(topic, seq, samplestamps, samples, timestamp, copy=False)
+
+    def publish_shared(self, topic: str, samplestamps: np.ndarray, samples: np.ndarray, timestamp: float, seq: int):
+        """Write a batch to the topic's shared-memory ring and notify the subscribers on this host
+
+        The notification is published on SHM_TOPIC_PREFIX + topic with the same sequence number as
+        the TCP batch. A new ring (with a new name) replaces the topic's ring when the channel
+        count or dtypes change, or when a batch is larger than the ring.
+        """
+        if samples.ndim == 1:
+            samples = samples.reshape(len(samplestamps), -1)
+        ring = self.rings.get(topic)
+        if ring is None or not ring.fits(samplestamps, samples):
+            if ring is not None:
+                ring.close()
+            ring = self.rings[topic] = SharedRingWriter(samples.shape[1], max(self.shm_capacity, len(samples)),
+                                                        samplestamps.dtype, samples.dtype)
+            print("Writing topic {} to shared memory {}".format(topic, ring.name))
+        position = ring.write(samplestamps, samples)
+        self.pub_socket.send_multipart([(SHM_TOPIC_PREFIX + topic).encode()]
+                                       + encode_notification(seq, position, len(samples), timestamp, ring.name))
+
+    def close_rings(self):
+        """Remove the shared-memory rings, subscribers still reading them keep their mapping"""
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+    def publish_stream(self, samplestamps, samples):
+        """Publish a batch of the data on pub_topic, unless `publish_full` is False, and its channel groups on their topics"""
+        if self.publish_full:
+            self.publish(self.pub_topic, samplestamps, samples)
+        if self.channel_groups:
+            self.publish_groups(samplestamps, samples)
+
+    def publish_groups(self, samplestamps, samples):
+        """Publish the channels of every channel group on the group's topic"""
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(len(samplestamps), -1)
+        with self.instrumentation.stage("groups"):
+            for group, indices in self.group_indices.items():
+                # Indexing with the group's indices already makes a copy
+                self.publish(self.group_topics[group], samplestamps, samples[:, indices], copy=False)
+
+    def publish_stats(self, summary: dict):
+        """Publish a timing summary of the instrumentation as JSON on the stats topic"""
+        self.pub_socket.send_multipart([self.stats_topic.encode(), json.dumps(summary).encode()])
+
+    def status(self) -> dict:
+        """Return the stream position (batches published on each topic) and the config, for the info service"""
+        return {"seq": dict(self.seq), "config": self.config}
+
+    def handle_requests(self):
+        """Answer the pending requests that need the processing loop's state, without blocking
+
+        Info requests are answered by `self.info_service` on its own thread; snapshots read the
+        history written by `publish`, so they are answered here, between two batches.
+        """
+        with self.instrumentation.stage("requests"):
+            self.handle_snapshot_requests()
+
+    def handle_snapshot_requests(self):
+        """Answer the pending snapshot requests on the ROUTER socket, if any, without blocking
+
+        The reply holds the history of the requested topic as one batch in the binary wire format,
+        whose sequence number is the one of the newest batch included, so the subscriber can skip
+        the live batches it already has.
+        """
+        if self.snapshot_socket is None:
+            return
+        while True:
+            try:
+                identity, request, topic = self.snapshot_socket.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            except ValueError:
+                print("Received a malformed snapshot request")
+                continue
+
+            if request != SNAPSHOT_REQUEST:
+                print("Received unknown snapshot request {}".format(request))
+                continue
+
+            frames = []
+            try:
+                snapshot = self.history.snapshot(topic.decode()) if self.history is not None else None
+                if snapshot is not None:
+                    samplestamps, samples, seq = snapshot
+                    frames = encode_batch(samplestamps, samples, time.time(), seq, "binary")
+            except Exception as e:
+                # Runs on the acquisition callback: reply with no history rather than raising
+                print("Error building the snapshot of topic {}: {}".format(topic.decode(errors="replace"), e))
+                frames = []
+            self.snapshot_socket.send_multipart([identity, SNAPSHOT_REPLY, topic] + frames, copy=False)
+            print("Sent snapshot of topic {}!".format(topic.decode()))
+
     def process(self, n_channels, samplestamps, samples):
         """This function will receive `M x N` array of sample data
             - M is defined by the `--batch` argument provided to `python zmq-sub.py` (see -h for defaults)
@@ -75,33 +268,38 @@ class PublisherZmqProcessor(BaseZmqProcessor):
         # YOUR BATCH PROCESSING GOES HERE #
         ###################################
 
-        # Request to receive channel names
-        try:
-            req = self.rep_socket.recv(flags=zmq.NOBLOCK)
-            print("Received request for channel names!")
-            if  req.decode() == "get_channel_names":
-                info = self.request_info(self.info_socket)
-                ch_names = '\n'.join(info['channelNames'])
-                self.rep_socket.send_string(ch_names)
-                print("Sent channel names!")
-        except:
-            pass
+        self.handle_requests()
 
         ### Example: Publish processed data to the topic specified by self.pub_topic ###
-        current_time = time.time()
-        current_time = struct.pack("d", current_time)
+        self.publish_stream(samplestamps, samples)
+        self.instrumentation.log("Sent samplestamps and samples!")
+
+        self.finish_batch(n_channels, samplestamps)
 
-        samplestamps = np.array(samplestamps)
-        samplestamps_serialized = pickle.dumps(samplestamps)
+    def process_derived(self, n_channels, samplestamps, samples, derive, publish_data: bool = True):
+        """Process a batch for a processor that publishes a stream derived from the data
 
-        samples = np.array(samples)
-        samples_serialized = pickle.dumps(samples)
+        Answers the pending requests, publishes the data like `process` (unless `publish_data` is
+        False), calls `derive` to compute and publish the derived stream, and counts the batch.
+
+        Args:
+            n_channels (int): the number of channels per sample sent by the publisher (for each zmq message)
+            samplestamps([1D array]): array of batch_size items, each item is a samplestamp
+            samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+            derive (callable): called with (samplestamps, samples) to compute and publish the derived stream
+            publish_data (bool, optional): Also publish the data batches on pub_topic. Defaults to True.
+        """
+        self.handle_requests()
+        if publish_data:
+            self.publish_stream(samplestamps, samples)
+        derive(samplestamps, samples)
+        self.finish_batch(n_channels, samplestamps)
 
-        self.pub_socket.send_multipart([self.pub_topic.encode(), samplestamps_serialized, samples_serialized, current_time])
-        print("Sent samplestamps and samples!")
-                
+    def finish_batch(self, n_channels, samplestamps):
+        """Measure the time since the previous batch and count the batch in the instrumentation"""
         # measure time from the last call in milliseconds
         self.last_time = self.curr_time
         self.curr_time = time.time()
-        print("Time since last call: {} ms".format((self.curr_time - self.last_time)*1000))
-        print("Received batch of {} samples with {} channels".format(len(samplestamps), n_channels))
\ No newline at end of file
+        self.instrumentation.batch_done(len(samplestamps))
+        self.instrumentation.log("Time since last call: {} ms", (self.curr_time - self.last_time)*1000)
+        self.instrumentation.log("Received batch of {} samples with {} channels", len(samplestamps), n_channels)
\ No newline at end of file
@@ -1,10 +1,21 @@
 import numpy as np
 import time
-import json
 from PublisherZmqProcessor import PublisherZmqProcessor
+from wire_format import encode_unity_batch
+
+UNITY_FORMATS = ("json", "binary")
 
 class UnityZmqProcessor(PublisherZmqProcessor):
-    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 1000, pub_topic : str = "ProcessedData"):
+    """Publishes a subset of the channels for NetMQ subscribers in Unity
+
+    Two message formats are available, both as [topic, payload]:
+        - "json": {"samples": [...]}, a flat list for one channel, one list per sample for several
+        - "binary": the Unity layout of wire_format.py, a 24-byte header and little-endian float32 samples
+    """
+
+    def __init__(self, sub_ip = "localhost", batch_size: int = 1, info_port: int = 5597, event_port: int = 5598, pub_port: int = 1000, pub_topic : str = "ProcessedData",
+                 verbose: bool = False, stats_interval: float = 5.0, stats_file: str = None,
+                 rep_port: int = 1001, unity_format: str = "json", channels: list = (0,), json_precision: int = None):
         """Class constructor
         Args:
             sub_ip (str, optional): IP addr of the data source. Defaults to "localhost".
@@ -13,10 +24,64 @@ class UnityZmqProcessor(PublisherZmqProcessor):
             event_port (int, optional): Port to submit annotation requests. Defaults to 5598.
             pub_port (int, optional): Port to publish batch processed data. Defaults to 5000.
             pub_topic(str, optional): Topic to publish batch processed data. Defaults to "ProcessedData".
+            verbose(bool, optional): Print messages for every batch. Defaults to False.
+            stats_interval(float, optional): Seconds between two timing summaries, 0 for none. Defaults to 5.0.
+            stats_file(str, optional): JSON file the timing summaries are written to. Defaults to None.
+            rep_port (int, optional): Port to reply to requests on. Defaults to 1001.
+            unity_format(str, optional): "json" or "binary". Defaults to "json".
+            channels(list, optional): Indices of the channels to publish. Defaults to (0,), the first channel.
+            json_precision(int, optional): Significant digits of the samples in JSON, e.g. 9 for shorter messages that still keep every float32 exact. Defaults to None, the same digits as `json.dumps`.
+
+        Unity clients only subscribe, so no history is kept and no snapshot socket is bound.
         """
         print("Initializing user-defined batch-processor")
 
-        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port, pub_topic)
+        if unity_format not in UNITY_FORMATS:
+            raise ValueError("Unknown Unity format '{}', expected one of {}".format(unity_format, UNITY_FORMATS))
+
+        super().__init__(sub_ip, batch_size, info_port, event_port, pub_port=pub_port, rep_port=rep_port, pub_topic=pub_topic,
+                         snapshot_port=None, history_seconds=0, verbose=verbose, stats_interval=stats_interval, stats_file=stats_file)
+
+        self.unity_format = unity_format
+        self.channels = np.asarray(channels, dtype=np.intp)
+        self.json_precision = json_precision
+        self.json_formats = {}  # JSON template of each batch shape
+        self.config.update(unity_format=unity_format, channels=self.channels.tolist())
+
+    def json_format(self, n_samples: int, n_channels: int) -> str:
+        """Return the %-template of the JSON message for a batch shape, built once per shape
+
+        The template is filled with the numbers formatted by `json_numbers`, in one %-operation.
+        """
+        key = (n_samples, n_channels)
+        template = self.json_formats.get(key)
+        if template is None:
+            if n_channels == 1:
+                values = ", ".join(["%s"] * n_samples)
+            else:
+                values = ", ".join(["[" + ", ".join(["%s"] * n_channels) + "]"] * n_samples)
+            template = self.json_formats[key] = '{"samples": [' + values + ']}'
+        return template
+
+    def json_numbers(self, samples: np.ndarray) -> np.ndarray:
+        """Format the samples as JSON numbers, as an array of strings of the same shape
+
+        The numbers are formatted by NumPy rather than through nested Python lists. Floats are
+        written as float64, so float32 samples read the same as with `json.dumps`, and the
+        non-finite values as `json.dumps` writes them: NaN, Infinity and -Infinity.
+        """
+        if samples.dtype.kind != "f":
+            return np.char.mod("%d", samples)
+        samples = samples.astype(np.float64, copy=False)
+        if self.json_precision is not None:
+            numbers = np.char.mod("%.{}g".format(self.json_precision), samples)
+        else:
+            # str of a float64 is its shortest repr, as json.dumps writes it
+            numbers = np.char.mod("%s", samples)
+        finite = np.isfinite(samples)
+        if not finite.all():
+            numbers = np.where(finite, numbers, np.where(np.isnan(samples), "NaN", np.where(samples > 0, "Infinity", "-Infinity")))
+        return numbers
 
     def process(self, n_channels, samplestamps, samples):
         """This function will receive `M x N` array of sample data
@@ -29,16 +94,25 @@ class UnityZmqProcessor(PublisherZmqProcessor):
             samplestamps([1D array]): array of batch_size items, each item is a samplestamp
             samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
         """
-        samples = np.array(samples)
-        samples = samples[:, 0] # Just data from first channel
-        data_dict = {"samples": samples.tolist()}
-
-        samples_serialized = json.dumps(data_dict).encode()
-        self.pub_socket.send_multipart([self.pub_topic.encode(), samples_serialized])
-        print("Message sent!")
+        instrumentation = self.instrumentation
+        with instrumentation.stage("convert"):
+            samples = np.asarray(samples)
+            samples = samples[:, self.channels] # Just data from the selected channels
+        with instrumentation.stage("serialize"):
+            if self.unity_format == "binary":
+                seq = self.seq.get(self.pub_topic, 0)
+                samples_serialized = encode_unity_batch(samplestamps, samples, seq)
+                self.seq[self.pub_topic] = seq + 1
+            else:
+                template = self.json_format(*samples.shape)
+                samples_serialized = (template % tuple(self.json_numbers(samples).ravel())).encode()
+        with instrumentation.stage("send"):
+            self.pub_socket.send_multipart([self.pub_topic.encode(), samples_serialized])
+        instrumentation.log("Message sent!")
 
         self.last_time = self.curr_time
         self.curr_time = time.time()
-        print("Time since last call: {} ms".format((self.curr_time - self.last_time)*1000))
-        print("Received batch of {} samples with {} channels".format(len(samplestamps), n_channels))
+        instrumentation.batch_done(len(samplestamps))
+        instrumentation.log("Time since last call: {} ms", (self.curr_time - self.last_time)*1000)
+        instrumentation.log("Received batch of {} samples with {} channels", len(samplestamps), n_channels)
 
@@ -0,0 +1,255 @@
+"""Fan-out broker between a processor and its subscribers
+
+The broker subscribes once to the processor's PUB socket (XSUB) and re-publishes every message
+to any number of subscribers (XPUB), so the processor sends each batch once whatever the number
+of visualizers, loggers and decoders. Subscriptions are forwarded upstream as clients come and
+go, optionally restricted to an allow-list of topics. Every subscriber has its own queue of at
+most `hwm` messages: a subscriber that falls behind loses its own messages (counted as gaps by
+ClientSub) without delaying the others or the processor.
+
+Messages can also be recorded to a disk tap, written on its own thread from a bounded queue so
+that the disk never delays forwarding, and read back with `read_tap`. The tap subscribes to all
+the allowed topics, so it records them even when no subscriber is connected.
+
+Run next to the processor:
+
+    python broker.py --processor-port 6000 --port 6100 --tap logs/session.tap
+
+and point the clients' `sub_port` to 6100 (requests and snapshots still go to the processor).
+"""
+import os
+import time
+import queue
+import struct
+import argparse
+import threading
+import zmq
+from instrumentation import Instrumentation
+
+TAP_MAGIC = b"NBCT"
+TAP_VERSION = 1
+TAP_HEADER_STRUCT = struct.Struct("<4sB")
+# receive time, number of frames; then every frame as its length and its bytes
+TAP_RECORD_STRUCT = struct.Struct("<dI")
+TAP_FRAME_STRUCT = struct.Struct("<I")
+
+
+class DiskTap(threading.Thread):
+    """Writes the forwarded messages to a file on its own thread
+
+    Messages are handed over through a queue of at most `max_pending` messages; when the disk
+    falls behind the newest messages are dropped and counted in `dropped` rather than delaying
+    the broker.
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        """Class constructor
+        Args:
+            path (str): file to write, overwritten if it exists
+            max_pending (int, optional): messages waiting to be written before new ones are dropped. Defaults to 10000.
+        """
+        super().__init__(daemon=True)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(TAP_HEADER_STRUCT.pack(TAP_MAGIC, TAP_VERSION))
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+
+    def put(self, frames: list, receive_time: float):
+        """Queue a message for writing, without blocking"""
+        try:
+            self.pending.put_nowait((receive_time, frames))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        try:
+            while True:
+                item = self.pending.get()
+                if item is None:
+                    break
+                receive_time, frames = item
+                self.file.write(TAP_RECORD_STRUCT.pack(receive_time, len(frames)))
+                for frame in frames:
+                    data = frame.buffer if isinstance(frame, zmq.Frame) else frame
+                    self.file.write(TAP_FRAME_STRUCT.pack(len(data)))
+                    self.file.write(data)
+                self.written += 1
+        finally:
+            self.file.close()
+
+    def stop(self):
+        """Write the pending messages and close the file"""
+        self.pending.put(None)
+        self.join()
+
+
+def read_tap(path: str):
+    """Read the messages recorded by a DiskTap
+
+    Yields:
+        tuple: (receive time, frames), frames being the message as a list of bytes, topic first.
+            Data batches can be decoded with `wire_format.decode_batch(frames[1:])`.
+    """
+    with open(path, "rb") as file:
+        magic, version = TAP_HEADER_STRUCT.unpack(file.read(TAP_HEADER_STRUCT.size))
+        if magic != TAP_MAGIC or version != TAP_VERSION:
+            raise ValueError("{} is not a tap file of version {}".format(path, TAP_VERSION))
+        while True:
+            record = file.read(TAP_RECORD_STRUCT.size)
+            if len(record) < TAP_RECORD_STRUCT.size:
+                return
+            receive_time, n_frames = TAP_RECORD_STRUCT.unpack(record)
+            frames = []
+            for _ in range(n_frames):
+                length, = TAP_FRAME_STRUCT.unpack(file.read(TAP_FRAME_STRUCT.size))
+                frames.append(file.read(length))
+            yield receive_time, frames
+
+
+class Broker():
+    """XSUB/XPUB forwarder between one processor and many subscribers"""
+
+    def __init__(self, processor_ip: str = "localhost", processor_port: int = 6000, port: int = 6100, hwm: int = 1000,
+                 topics: list = None, tap: str = None, verbose: bool = False, stats_interval: float = 5.0, stats_file: str = None):
+        """Class constructor
+        Args:
+            processor_ip (str, optional): IP addr of the processor. Defaults to "localhost".
+            processor_port (int, optional): Port the processor publishes on. Defaults to 6000.
+            port (int, optional): Port to re-publish on for the subscribers. Defaults to 6100.
+            hwm (int, optional): Messages queued for each subscriber before its new messages are dropped. Defaults to 1000.
+            topics (list, optional): Topics (prefixes) subscribers may subscribe to, None for all. Defaults to None.
+            tap (str, optional): File to record every forwarded message to, see `read_tap`. Defaults to None.
+            verbose (bool, optional): Print every subscription change. Defaults to False.
+            stats_interval (float, optional): Seconds between two summaries of the forwarding times, 0 for none. Defaults to 5.0.
+            stats_file (str, optional): JSON file the summaries are written to. Defaults to None.
+        """
+        self.topics = [topic.encode() for topic in topics] if topics is not None else None
+        self.verbose = verbose
+        self.context = zmq.Context.instance()
+        self.instrumentation = Instrumentation(verbose, stats_interval, stats_file, report=self.report)
+        self.forwarded = {}  # messages forwarded on each topic
+        self.subscriptions = {}  # subscribers of each topic
+        self.running = threading.Event()
+
+        self.xsub_socket = self.context.socket(zmq.XSUB)
+        self.xsub_socket.setsockopt(zmq.RCVHWM, hwm)
+        self.xsub_socket.connect("tcp://{}:{}".format(processor_ip, processor_port))
+        print("Subscribed to the processor on: tcp://{}:{}".format(processor_ip, processor_port))
+
+        self.xpub_socket = self.context.socket(zmq.XPUB)
+        # The high-water mark applies to each subscriber's own queue
+        self.xpub_socket.setsockopt(zmq.SNDHWM, hwm)
+        # Pass every (un)subscription, not only the first and last of a topic, to keep count of the subscribers
+        self.xpub_socket.setsockopt(zmq.XPUB_VERBOSE, 1)
+        self.xpub_socket.setsockopt(zmq.XPUB_VERBOSER, 1)
+        self.xpub_socket.bind("tcp://*:{}".format(port))
+        print("Publishing to the subscribers on: tcp://*:{}".format(port))
+
+        self.tap = DiskTap(tap) if tap is not None else None
+        if self.tap is not None:
+            # The tap records whether or not a subscriber is connected, so it subscribes upstream itself.
+            # XSUB counts the subscriptions of each topic, so the subscribers leaving do not cancel these
+            for topic in self.topics if self.topics is not None else [b""]:
+                self.xsub_socket.send(b"\x01" + topic)
+            print("Recording to {}".format(tap))
+
+    def allowed(self, topic: bytes) -> bool:
+        if self.topics is None:
+            return True
+        # A subscription is allowed if it only matches allowed topics
+        return any(topic.startswith(allowed) for allowed in self.topics)
+
+    def handle_subscription(self, message: bytes):
+        """Forward a subscription change of a subscriber upstream, if its topic is allowed"""
+        if not message or message[0] not in (0, 1):
+            return
+        subscribe, topic = message[0] == 1, message[1:]
+        if not self.allowed(topic):
+            self.instrumentation.log("Refused subscription to topic '{}'", topic.decode(errors="replace"))
+            return
+        count = self.subscriptions.get(topic, 0) + (1 if subscribe else -1)
+        self.subscriptions[topic] = max(count, 0)
+        self.xsub_socket.send(message)
+        self.instrumentation.log("{} topic '{}' ({} subscribers)", "Subscribed to" if subscribe else "Unsubscribed from",
+                                 topic.decode(errors="replace"), self.subscriptions[topic])
+
+    def forward(self):
+        """Forward one message from the processor to the subscribers and the tap"""
+        instrumentation = self.instrumentation
+        with instrumentation.stage("forward"):
+            frames = self.xsub_socket.recv_multipart(copy=False)
+            self.xpub_socket.send_multipart(frames, copy=False)
+        topic = frames[0].bytes
+        self.forwarded[topic] = self.forwarded.get(topic, 0) + 1
+        if self.tap is not None:
+            with instrumentation.stage("tap"):
+                self.tap.put(frames, time.time())
+        instrumentation.batch_done(0)
+
+    def report(self, summary: dict):
+        summary["forwarded"] = {topic.decode(errors="replace"): count for topic, count in self.forwarded.items()}
+        summary["subscriptions"] = {topic.decode(errors="replace"): count for topic, count in self.subscriptions.items() if count}
+        if self.tap is not None:
+            summary["tap"] = {"written": self.tap.written, "dropped": self.tap.dropped}
+        print("Forwarded {batches} messages ({batches_per_s:.1f}/s), forward p99 {p99:.3f} ms, subscriptions {subscriptions}".format(
+            p99=summary["stages"].get("forward", {}).get("p99_ms", 0.0), **summary))
+
+    def run(self):
+        """Forward until `stop` is called"""
+        if self.tap is not None:
+            self.tap.start()
+        poller = zmq.Poller()
+        poller.register(self.xsub_socket, zmq.POLLIN)
+        poller.register(self.xpub_socket, zmq.POLLIN)
+        self.running.set()
+        try:
+            while self.running.is_set():
+                # Wake up regularly to check for `stop`
+                events = dict(poller.poll(100))
+                if self.xpub_socket in events:
+                    self.handle_subscription(self.xpub_socket.recv())
+                if self.xsub_socket in events:
+                    # Forward what is waiting, up to a bound so that subscriptions are not delayed
+                    for _ in range(1000):
+                        self.forward()
+                        if not self.xsub_socket.poll(0):
+                            break
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running.clear()
+
+    def close(self):
+        self.xsub_socket.close(linger=0)
+        self.xpub_socket.close(linger=0)
+        if self.tap is not None:
+            self.tap.stop()
+            print("Recorded {} messages to {} ({} dropped)".format(self.tap.written, self.tap.path, self.tap.dropped))
+            self.tap = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-publish a processor's topics to many subscribers")
+    parser.add_argument("--processor-ip", type=str, default="localhost", help="IP addr of the processor")
+    parser.add_argument("--processor-port", type=int, default=6000, help="port the processor publishes on")
+    parser.add_argument("--port", type=int, default=6100, help="port to re-publish on")
+    parser.add_argument("--hwm", type=int, default=1000, help="messages queued for each subscriber")
+    parser.add_argument("--topics", type=str, nargs="+", default=None, help="topics subscribers may subscribe to (default: all)")
+    parser.add_argument("--tap", type=str, default=None, help="file to record the forwarded messages to")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="seconds between two summaries, 0 for none")
+    parser.add_argument("--stats-file", type=str, default=None, help="JSON file the summaries are written to")
+    parser.add_argument("--verbose", action="store_true", help="print every subscription change")
+    args = parser.parse_args()
+
+    broker = Broker(args.processor_ip, args.processor_port, args.port, args.hwm, args.topics, args.tap,
+                    args.verbose, args.stats_interval, args.stats_file)
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        print("Broker stopped by user")
@@ -0,0 +1,38 @@
+"""Channel groups: subsets of the channels published under their own topic
+
+A group is defined by a list of channel names (looked up in the study's channel names) or
+indices, e.g. {"Motor": ["C3", "Cz", "C4"], "Trigger": [0]}. The batches of a group are published
+on GROUP_TOPIC_FORMAT, e.g. "Motor/ProcessedData", so that subscribers to the group prefix
+("Motor/") receive only those channels and subscribers to "ProcessedData" receive none of them.
+"""
+import numpy as np
+
+GROUP_TOPIC_FORMAT = "{group}/{topic}"
+
+
+def group_topic(group: str, topic: str) -> str:
+    """Return the topic the channels of `group` are published on, for the data topic `topic`"""
+    return GROUP_TOPIC_FORMAT.format(group=group, topic=topic)
+
+
+def resolve_group(channels: list, ch_names: list) -> np.ndarray:
+    """Return the indices of a group's channels
+
+    Args:
+        channels (list): channel names or indices
+        ch_names (list): channel names of the study, in the order of the samples
+
+    Returns:
+        np.ndarray: index of every channel of the group, in the group's order
+    """
+    indices = []
+    for channel in channels:
+        if isinstance(channel, (int, np.integer)):
+            if not 0 <= channel < len(ch_names):
+                raise ValueError("Channel index {} out of range, the study has {} channels".format(channel, len(ch_names)))
+            indices.append(int(channel))
+        elif channel in ch_names:
+            indices.append(ch_names.index(channel))
+        else:
+            raise ValueError("Channel {} is not in the study".format(channel))
+    return np.array(indices, dtype=np.intp)
@@ -0,0 +1,116 @@
+import numpy as np
+from scipy import signal
+from filter_bank import StreamingSosFilter
+
+DECIMATION_MODES = ("envelope", "lowpass")
+
+
+def display_factor(win_size: int, max_points: int, mode: str = "envelope") -> int:
+    """Return the smallest decimation factor plotting `win_size` samples with at most `max_points` points
+
+    Args:
+        win_size (int): number of samples shown per channel
+        max_points (int): points per line, e.g. the plot width in pixels
+        mode (str, optional): one of DECIMATION_MODES, "envelope" gives two points per bucket. Defaults to "envelope".
+
+    Returns:
+        int: decimation factor, 1 when the window already fits
+    """
+    points_per_bucket = 2 if mode == "envelope" else 1
+    return max(1, int(np.ceil(win_size * points_per_bucket / max_points)))
+
+
+class StreamingDecimator():
+    """Reduce a stream to a fixed number of points per `factor` samples, batch by batch
+
+    In "envelope" mode every bucket of `factor` samples becomes two points, its minimum and its
+    maximum (stamped with the first and last samplestamp of the bucket), so spikes and artifacts
+    stay visible however far the stream is reduced. In "lowpass" mode the stream is filtered with a
+    causal Butterworth low-pass below the new Nyquist frequency and one sample in `factor` is kept.
+
+    Samples of an incomplete bucket, the decimation phase and the filter state are carried to the
+    next batch, so the output does not depend on how the stream is cut into batches, including
+    batch_size=1. NaN samples (gaps filled by the client) propagate to the bucket they fall in.
+    """
+
+    def __init__(self, factor: int, mode: str = "envelope", order: int = 8):
+        """Class constructor
+        Args:
+            factor (int): number of input samples per bucket, 1 passes the stream through
+            mode (str, optional): one of DECIMATION_MODES. Defaults to "envelope".
+            order (int, optional): order of the anti-aliasing filter in "lowpass" mode. Defaults to 8.
+        """
+        if mode not in DECIMATION_MODES:
+            raise ValueError("Unknown decimation mode '{}', expected one of {}".format(mode, ", ".join(DECIMATION_MODES)))
+        if factor < 1:
+            raise ValueError("Decimation factor must be at least 1, got {}".format(factor))
+        self.factor = int(factor)
+        self.mode = mode
+        self.points_per_bucket = 2 if mode == "envelope" else 1
+        self.filter = None
+        if mode == "lowpass" and self.factor > 1:
+            # Cutoff at 80% of the decimated Nyquist frequency, normalized to the input Nyquist frequency
+            self.filter = StreamingSosFilter(signal.butter(order, 0.8 / self.factor, output='sos'))
+        self.reset()
+
+    def reset(self):
+        """Forget the carried samples and filter state"""
+        self.pending_stamps = None
+        self.pending_samples = None
+        self.phase = 0
+        if self.filter is not None:
+            self.filter.reset()
+
+    def process(self, samplestamps, samples):
+        """Decimate a batch
+
+        Args:
+            samplestamps ([1D array]): samplestamps of the batch, shape (n_samples,), or None when they are not needed
+            samples ([2D array]): batch of shape (n_samples, n_channels)
+
+        Returns:
+            tuple: (samplestamps, samples) of the output points, possibly empty until a bucket is complete; samplestamps is None if not given
+        """
+        samples = np.asarray(samples)
+        if samplestamps is not None:
+            samplestamps = np.asarray(samplestamps)
+        if self.factor == 1:
+            return samplestamps, samples
+        if self.mode == "lowpass":
+            return self._lowpass(samplestamps, samples)
+        return self._envelope(samplestamps, samples)
+
+    def _lowpass(self, samplestamps, samples):
+        filtered = self.filter.process(samples)
+        # Keep every factor-th sample of the stream, counted from its first sample across batches
+        start = (-self.phase) % self.factor
+        self.phase = (self.phase + len(samples)) % self.factor
+        if samplestamps is not None:
+            samplestamps = samplestamps[start::self.factor]
+        return samplestamps, filtered[start::self.factor]
+
+    def _envelope(self, samplestamps, samples):
+        if self.pending_samples is not None:
+            samples = np.concatenate([self.pending_samples, samples])
+            if samplestamps is not None:
+                samplestamps = np.concatenate([self.pending_stamps, samplestamps])
+        factor = self.factor
+        n_buckets = len(samples) // factor
+        n_full = n_buckets * factor
+        # The incomplete bucket (fewer than factor samples) waits for the next batch
+        if n_full < len(samples):
+            self.pending_samples = samples[n_full:].copy()
+            self.pending_stamps = samplestamps[n_full:].copy() if samplestamps is not None else None
+        else:
+            self.pending_stamps = self.pending_samples = None
+
+        buckets = samples[:n_full].reshape(n_buckets, factor, samples.shape[1])
+        points = np.empty((2 * n_buckets, samples.shape[1]), dtype=samples.dtype)
+        points[0::2] = buckets.min(axis=1)
+        points[1::2] = buckets.max(axis=1)
+        if samplestamps is None:
+            return None, points
+        stamps = np.empty(2 * n_buckets, dtype=samplestamps.dtype)
+        stamps[0::2] = samplestamps[:n_full:factor]
+        stamps[1::2] = samplestamps[factor - 1:n_full:factor]
+        return stamps, points
@@ -0,0 +1,234 @@
+import numpy as np
+from scipy import signal
+
+# Same band definitions as notebooks/compute_power.py
+BANDS = {
+    'Delta': (0.5, 4),
+    'Theta': (4, 8),
+    'Alpha': (8, 13),
+    'Beta': (13, 30),
+    'Gamma': (30, 70),
+    'High Gamma': (70, 150)
+}
+
+
+class StreamingSosFilter():
+    """Causal IIR filter applied batch by batch, with its state carried across batches
+
+    All channels are filtered in one `sosfilt` call along the sample axis, so the cost per sample is
+    constant whatever the batch size, including batch_size=1.
+    """
+
+    def __init__(self, sos: np.ndarray, steady_state: bool = True):
+        """Class constructor
+        Args:
+            sos (np.ndarray): second-order sections of shape (n_sections, 6), e.g. from `scipy.signal.butter(..., output='sos')`
+            steady_state (bool, optional): start from the steady state for the first sample instead of from zero, which avoids the start-up transient on signals with a DC offset. Defaults to True.
+        """
+        self.sos = np.asarray(sos, dtype=np.float64)
+        self.steady_state = steady_state
+        self.zi = None
+
+    def reset(self):
+        """Forget the filter state, the next batch starts the filter again"""
+        self.zi = None
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Filter a batch
+
+        Args:
+            samples (np.ndarray): batch of shape (n_samples, n_channels)
+
+        Returns:
+            np.ndarray: filtered batch of the same shape
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return samples
+        if self.zi is None:
+            # State shape is (n_sections, 2, n_channels) for filtering along axis 0
+            zi = signal.sosfilt_zi(self.sos)[:, :, np.newaxis]
+            self.zi = zi * samples[0] if self.steady_state else np.zeros(zi.shape[:2] + samples.shape[1:])
+        filtered, self.zi = signal.sosfilt(self.sos, samples, axis=0, zi=self.zi)
+        return filtered
+
+
+def preprocessing_sos(sfreq: float, band: tuple = (1.0, 100.0), line_freq: float = 60.0, harmonics: int = 3,
+                      notch_q: float = 30.0, order: int = 4) -> np.ndarray:
+    """Design the notch and band-pass filters of the preprocessing as one cascade of second-order sections
+
+    Args:
+        sfreq (float): sampling rate of the stream in Hz
+        band (tuple, optional): (low, high) cutoffs in Hz of the Butterworth band-pass, either may be None for a
+            high-pass or low-pass only, a high cutoff at or above the Nyquist frequency is dropped. None for no band-pass. Defaults to (1.0, 100.0).
+        line_freq (float, optional): power line frequency in Hz (50 or 60), None for no notch. Defaults to 60.0.
+        harmonics (int, optional): number of line frequency multiples notched, those above the Nyquist frequency are skipped. Defaults to 3.
+        notch_q (float, optional): quality factor of the notches (center frequency / bandwidth). Defaults to 30.0.
+        order (int, optional): order of the Butterworth filters. Defaults to 4.
+
+    Returns:
+        np.ndarray: second-order sections of shape (n_sections, 6), for `StreamingSosFilter`
+    """
+    nyquist = sfreq / 2
+    sections = []
+    if line_freq is not None:
+        for k in range(1, harmonics + 1):
+            if line_freq * k >= nyquist:
+                break
+            b, a = signal.iirnotch(line_freq * k, notch_q, fs=sfreq)
+            sections.append(signal.tf2sos(b, a))
+    if band is not None:
+        low_freq, high_freq = band
+        if high_freq is not None and high_freq >= nyquist:
+            high_freq = None
+        if low_freq is not None and high_freq is not None:
+            sections.append(signal.butter(order, (low_freq, high_freq), btype="bandpass", fs=sfreq, output="sos"))
+        elif low_freq is not None:
+            sections.append(signal.butter(order, low_freq, btype="highpass", fs=sfreq, output="sos"))
+        elif high_freq is not None:
+            sections.append(signal.butter(order, high_freq, btype="lowpass", fs=sfreq, output="sos"))
+    if not sections:
+        # Pass-through section
+        return np.array([[1.0, 0, 0, 1, 0, 0]])
+    return np.concatenate(sections)
+
+
+class Rereference():
+    """Re-referencing of a batch: common average or bipolar pairs
+
+    - "car": the mean of all the channels is subtracted from every channel
+    - "bipolar": each output channel is the difference of a pair of input channels
+    """
+
+    def __init__(self, mode: str = None, pairs: list = None):
+        """Class constructor
+        Args:
+            mode (str, optional): None, "car" or "bipolar". Defaults to None (samples are passed through).
+            pairs (list, optional): (channel, reference) index pairs for "bipolar". Defaults to None.
+        """
+        if mode not in (None, "car", "bipolar"):
+            raise ValueError("Unknown reference '{}', expected None, 'car' or 'bipolar'".format(mode))
+        if mode == "bipolar" and not pairs:
+            raise ValueError("Bipolar re-referencing needs channel pairs")
+        self.mode = mode
+        self.pairs = pairs
+        if mode == "bipolar":
+            self.channels = np.array([pair[0] for pair in pairs])
+            self.references = np.array([pair[1] for pair in pairs])
+
+    def output_channels(self, n_channels: int) -> int:
+        return len(self.pairs) if self.mode == "bipolar" else n_channels
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Re-reference a batch of shape (n_samples, n_channels)"""
+        if self.mode == "car":
+            return samples - samples.mean(axis=1, keepdims=True)
+        if self.mode == "bipolar":
+            return samples[:, self.channels] - samples[:, self.references]
+        return samples
+
+
+class FilterBankBandPower():
+    """Streaming band power from a bank of causal band-pass filters
+
+    Each band is band-passed with a Butterworth filter, squared, and smoothed with a one-pole
+    low-pass filter (an exponential moving average with time constant `smoothing`) to give the
+    power envelope. All filter states are kept between batches, so the output of a stream cut into
+    batches is the same as the output of the whole recording filtered at once.
+
+    Batches of up to `small_batch` samples are filtered sample by sample with every band and
+    channel updated in one vectorized step, which avoids paying one `sosfilt` call per band at
+    batch_size=1; longer batches go through `sosfilt`. Both paths share the same filter state.
+    """
+
+    def __init__(self, sfreq: float, bands: dict = BANDS, order: int = 4, smoothing: float = 0.25, small_batch: int = 4):
+        """Class constructor
+        Args:
+            sfreq (float): sampling rate of the stream in Hz
+            bands (dict, optional): frequency range (low, high) in Hz of each band. Defaults to BANDS.
+            order (int, optional): order of the Butterworth band-pass filters. Defaults to 4.
+            smoothing (float, optional): time constant of the power envelope in seconds. Defaults to 0.25.
+            small_batch (int, optional): largest batch filtered sample by sample. Defaults to 4.
+        """
+        self.sfreq = sfreq
+        self.bands = dict(bands)
+        self.small_batch = small_batch
+        nyquist = sfreq / 2
+
+        sos = []
+        for name, (low_freq, high_freq) in self.bands.items():
+            if low_freq >= nyquist:
+                raise ValueError("Band {} ({}-{} Hz) is above the Nyquist frequency of {} Hz".format(name, low_freq, high_freq, nyquist))
+            if high_freq >= nyquist:
+                sos.append(signal.butter(order, low_freq, btype="highpass", fs=sfreq, output="sos"))
+            else:
+                sos.append(signal.butter(order, (low_freq, high_freq), btype="bandpass", fs=sfreq, output="sos"))
+
+        # Pad every band to the same number of sections with pass-through sections
+        n_sections = max(len(band_sos) for band_sos in sos)
+        self.sos = np.tile([1.0, 0, 0, 1, 0, 0], (len(sos), n_sections, 1))
+        for i, band_sos in enumerate(sos):
+            self.sos[i, :len(band_sos)] = band_sos
+
+        # Coefficients of each section as (n_sections, n_bands, 1) arrays for the sample-by-sample path
+        self.b0, self.b1, self.b2, _, self.a1, self.a2 = (self.sos.transpose(2, 1, 0)[..., np.newaxis])
+
+        # Exponential moving average of the squared signal
+        self.alpha = 1 - np.exp(-1 / (smoothing * sfreq))
+        self.zi = None
+        self.envelope = None
+
+    @property
+    def band_names(self) -> list:
+        return list(self.bands)
+
+    def reset(self):
+        """Forget the filter states, the next batch starts the filters again"""
+        self.zi = None
+        self.envelope = None
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Compute the power of every band for a batch
+
+        Args:
+            samples (np.ndarray): batch of shape (n_samples, n_channels)
+
+        Returns:
+            np.ndarray: band power of shape (n_samples, n_bands, n_channels)
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        n_samples, n_channels = samples.shape
+        n_bands, n_sections = self.sos.shape[:2]
+        if self.zi is None:
+            # Filter state in the layout sosfilt uses, one (n_sections, 2, n_channels) state per band
+            self.zi = np.zeros((n_bands, n_sections, 2, n_channels))
+            self.envelope = np.zeros((n_bands, n_channels))
+
+        if n_samples <= self.small_batch:
+            return self._process_small(samples)
+
+        squared = np.empty((n_samples, n_bands, n_channels))
+        for i in range(n_bands):
+            squared[:, i], self.zi[i] = signal.sosfilt(self.sos[i], samples, axis=0, zi=self.zi[i])
+        squared **= 2
+
+        power, _ = signal.lfilter([self.alpha], [1, self.alpha - 1], squared, axis=0,
+                                   zi=((1 - self.alpha) * self.envelope)[np.newaxis])
+        self.envelope = power[-1].copy()
+        return power
+
+    def _process_small(self, samples: np.ndarray) -> np.ndarray:
+        """Filter a short batch sample by sample, all bands and channels at once (transposed direct form II)"""
+        power = np.empty((len(samples), len(self.sos), samples.shape[1]))
+        z0 = self.zi[:, :, 0].transpose(1, 0, 2)  # (n_sections, n_bands, n_channels) views
+        z1 = self.zi[:, :, 1].transpose(1, 0, 2)
+        for n, x in enumerate(samples):
+            x = np.broadcast_to(x, self.envelope.shape)
+            for s in range(len(z0)):
+                y = self.b0[s] * x + z0[s]
+                z0[s] = self.b1[s] * x - self.a1[s] * y + z1[s]
+                z1[s] = self.b2[s] * x - self.a2[s] * y
+                x = y
+            self.envelope += self.alpha * (x * x - self.envelope)
+            power[n] = self.envelope
+        return power
@@ -0,0 +1,141 @@
+import json
+import argparse
+import threading
+import zmq
+
+# Keys the sampling rate may be stored under in the study info, depending on the SDK version
+SAMPLING_RATE_KEYS = ("samplingRate", "sampleRate", "samplingFrequency", "sfreq")
+
+# Requests answered by InfoService; get_channel_names keeps its newline-separated reply for the
+# existing clients, the other replies are JSON. Errors are replied as "error: <message>".
+REQUESTS = ("get_channel_names", "get_sampling_rate", "get_channel_count", "get_seq", "get_config",
+            "get_info", "invalidate_info")
+
+
+class InfoService(threading.Thread):
+    """REP service thread answering requests about the study and the processor
+
+    The study info is fetched once, on the first request that needs it, and cached until an
+    "invalidate_info" request (or `invalidate`), so requests never reach the NeuroWorks info port
+    twice and never run on the processing loop. Every request gets a reply, errors included, so a
+    REQ client is never left waiting.
+
+    Processors call `study_info` from their own thread too, e.g. in their constructor. The fetch
+    uses the processor's info socket, which must not be used by two threads at once, so it is
+    serialized by a lock.
+    """
+
+    def __init__(self, context: zmq.Context, rep_port: int, fetch_info, status=None):
+        """Class constructor
+        Args:
+            context (zmq.Context): context to create the REP socket in
+            rep_port (int): port to reply on
+            fetch_info (callable): returns the study info dict, with at least "channelNames"
+            status (callable, optional): returns {"seq": ..., "config": ...} describing the processor. Defaults to None.
+        """
+        super().__init__(daemon=True)
+        self.context = context
+        self.rep_port = rep_port
+        self.fetch_info = fetch_info
+        self.status = status if status is not None else (lambda: {"seq": {}, "config": {}})
+        self.info = None
+        self.info_lock = threading.Lock()
+        self.running = threading.Event()
+        self.running.set()
+        # The socket is bound here so that a port in use fails the constructor, and only used by the thread
+        self.rep_socket = self.context.socket(zmq.REP)
+        self.rep_socket.bind("tcp://*:{}".format(self.rep_port))
+        print("Replying on: tcp://*:{}".format(self.rep_port))
+
+    def invalidate(self):
+        """Forget the cached study info, it is fetched again on the next request"""
+        with self.info_lock:
+            self.info = None
+
+    def study_info(self) -> dict:
+        """Return the cached study info, fetching it first if needed; safe to call from any thread"""
+        with self.info_lock:
+            if self.info is None:
+                self.info = self.fetch_info()
+            return self.info
+
+    def sampling_rate(self) -> float:
+        info = self.study_info()
+        for key in SAMPLING_RATE_KEYS:
+            if key in info:
+                return float(info[key])
+        raise KeyError("No sampling rate in the study info (keys: {})".format(", ".join(info)))
+
+    def answer(self, request: str) -> str:
+        """Compute the reply to a request
+
+        Args:
+            request (str): one of REQUESTS
+
+        Returns:
+            str: the reply
+        """
+        if request == "get_channel_names":
+            return '\n'.join(self.study_info()['channelNames'])
+        elif request == "get_sampling_rate":
+            return json.dumps(self.sampling_rate())
+        elif request == "get_channel_count":
+            return json.dumps(len(self.study_info()['channelNames']))
+        elif request == "get_seq":
+            return json.dumps(self.status()["seq"])
+        elif request == "get_config":
+            return json.dumps(self.status()["config"])
+        elif request == "get_info":
+            info = self.study_info()
+            try:
+                sampling_rate = self.sampling_rate()
+            except KeyError:
+                sampling_rate = None
+            return json.dumps({"channel_names": list(info['channelNames']), "channel_count": len(info['channelNames']),
+                               "sampling_rate": sampling_rate, **self.status()}, default=str)
+        elif request == "invalidate_info":
+            self.invalidate()
+            return "ok"
+        raise ValueError("Unknown request '{}', expected one of {}".format(request, ", ".join(REQUESTS)))
+
+    def run(self):
+        poller = zmq.Poller()
+        poller.register(self.rep_socket, zmq.POLLIN)
+        try:
+            while self.running.is_set():
+                # Wake up regularly to check for `stop`
+                if not poller.poll(100):
+                    continue
+                request = self.rep_socket.recv().decode(errors="replace")
+                try:
+                    reply = self.answer(request)
+                    print("Answered request {}!".format(request))
+                except Exception as e:
+                    reply = "error: {}".format(e)
+                    print("Error answering request {}: {}".format(request, e))
+                self.rep_socket.send_string(reply)
+        finally:
+            self.rep_socket.close(linger=0)
+
+    def stop(self):
+        """Stop answering and close the socket"""
+        self.running.clear()
+        self.join()
+
+
+if __name__ == "__main__":
+    # Stand-in for a processor's info service, to test clients without NeuroWorks
+    parser = argparse.ArgumentParser(description="Answer info requests with synthetic study info")
+    parser.add_argument("--port", type=int, default=6001, help="port to reply on")
+    parser.add_argument("--channels", type=int, default=32, help="number of channels")
+    parser.add_argument("--sfreq", type=float, default=1024.0, help="sampling rate in Hz")
+    args = parser.parse_args()
+
+    info = {"channelNames": ["Ch{}".format(i + 1) for i in range(args.channels)], "samplingRate": args.sfreq}
+    service = InfoService(zmq.Context.instance(), args.port, lambda: info,
+                          lambda: {"seq": {}, "config": {"stand_in": True}})
+    service.start()
+    try:
+        service.join()
+    except KeyboardInterrupt:
+        service.stop()
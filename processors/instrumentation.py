@@ -0,0 +1,188 @@
+import os
+import json
+import math
+import time
+import numpy as np
+
+
+class LatencyHistogram():
+    """Fixed-size histogram of durations with log-spaced bins
+
+    Recording costs one log and one increment whatever the number of values, and the memory is
+    fixed, so it can run on every batch for the whole session. Percentiles are read from the bin
+    edges, with a relative error of at most one bin width (12% with the default 20 bins per decade).
+    """
+
+    def __init__(self, min_ms: float = 1e-3, max_ms: float = 1e4, bins_per_decade: int = 20):
+        """Class constructor
+        Args:
+            min_ms (float, optional): upper edge of the first bin, shorter durations are counted in it. Defaults to 1e-3 (1 us).
+            max_ms (float, optional): lower edge of the overflow bin. Defaults to 1e4 (10 s).
+            bins_per_decade (int, optional): resolution of the histogram. Defaults to 20.
+        """
+        self.min_ms = min_ms
+        self.bins_per_decade = bins_per_decade
+        n_bins = int(math.ceil(math.log10(max_ms / min_ms) * bins_per_decade)) + 2
+        # Upper edge of every bin, the last one is the overflow bin
+        self.edges = min_ms * 10 ** (np.arange(n_bins - 1) / bins_per_decade)
+        self.edges = np.append(self.edges, np.inf)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(self.edges)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        if ms <= self.min_ms:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log10(ms / self.min_ms) * self.bins_per_decade)), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        """Return the upper edge of the bin holding the q-th percentile (0-100), capped at the maximum"""
+        if self.count == 0:
+            return 0.0
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, q / 100 * self.count))
+        return float(min(self.edges[index], self.max_ms))
+
+    def summary(self) -> dict:
+        return {"count": self.count,
+                "mean_ms": self.total_ms / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p90_ms": self.percentile(90), "p99_ms": self.percentile(99),
+                "max_ms": self.max_ms}
+
+
+class _Stage():
+    """Context manager timing one stage into its histogram"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record((time.perf_counter() - self.start) * 1000)
+
+
+class Instrumentation():
+    """Per-stage timings of a processor, reported periodically instead of printed per batch
+
+    Stages are timed with `with instrumentation.stage("send"):` into fixed-size histograms. Every
+    `interval` seconds (checked in `batch_done`) a summary is written to `stats_file` as JSON and
+    handed to `report`, e.g. to publish it on a stats topic. Per-batch messages go through `log`,
+    which only prints when `verbose` is set, so production runs do no console I/O per batch.
+    Values that are not durations, such as a queue depth, are kept with `gauge` (last, mean and
+    maximum) and events with `count`.
+    """
+
+    def __init__(self, verbose: bool = False, interval: float = 5.0, stats_file: str = None, report=None):
+        """Class constructor
+        Args:
+            verbose (bool, optional): print the per-batch messages. Defaults to False.
+            interval (float, optional): seconds between two summaries, 0 to disable them. Defaults to 5.0.
+            stats_file (str, optional): JSON file rewritten with every summary. Defaults to None.
+            report (callable, optional): called with every summary dict. Defaults to None.
+        """
+        self.verbose = verbose
+        self.interval = interval
+        self.stats_file = stats_file
+        self.report = report
+        self.stages = {}
+        self.gauges = {}
+        self.counters = {}
+        self.reset()
+
+    def reset(self):
+        for timer in self.stages.values():
+            timer.histogram.reset()
+        self.gauges = {}
+        self.counters = {}
+        self.interval_histogram = LatencyHistogram()
+        self.n_batches = 0
+        self.n_samples = 0
+        self.start_time = time.time()
+        self.last_batch_time = None
+        self.last_report_time = self.start_time
+        self.last_report_batches = 0
+
+    def stage(self, name: str) -> _Stage:
+        """Return the timer of a stage, to use as a context manager"""
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = _Stage(LatencyHistogram())
+        return timer
+
+    def record(self, name: str, ms: float):
+        """Record a duration measured elsewhere"""
+        self.stage(name).histogram.record(ms)
+
+    def gauge(self, name: str, value: float):
+        """Record the current value of a quantity, e.g. a queue depth"""
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            gauge = self.gauges[name] = {"last": value, "mean": float(value), "max": value, "count": 0}
+        gauge["count"] += 1
+        gauge["last"] = value
+        gauge["mean"] += (value - gauge["mean"]) / gauge["count"]
+        if value > gauge["max"]:
+            gauge["max"] = value
+
+    def count(self, name: str, n: int = 1):
+        """Count an event, e.g. a dropped batch"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def log(self, message: str, *args):
+        """Print a per-batch message, formatted only when verbose"""
+        if self.verbose:
+            print(message.format(*args))
+
+    def batch_done(self, n_samples: int):
+        """Count a processed batch and the time since the previous one, and report if due"""
+        now = time.time()
+        if self.last_batch_time is not None:
+            self.interval_histogram.record((now - self.last_batch_time) * 1000)
+        self.last_batch_time = now
+        self.n_batches += 1
+        self.n_samples += n_samples
+
+        if self.interval and now - self.last_report_time >= self.interval:
+            summary = self.summary(now)
+            self.last_report_time = now
+            self.last_report_batches = self.n_batches
+            self.write(summary)
+
+    def summary(self, now: float = None) -> dict:
+        """Return the counters and the histogram summary of every stage"""
+        if now is None:
+            now = time.time()
+        elapsed = now - self.last_report_time
+        return {"time": now,
+                "batches": self.n_batches,
+                "samples": self.n_samples,
+                "batches_per_s": (self.n_batches - self.last_report_batches) / elapsed if elapsed > 0 else 0.0,
+                "interval": self.interval_histogram.summary(),
+                "stages": {name: timer.histogram.summary() for name, timer in self.stages.items()},
+                "gauges": {name: dict(gauge) for name, gauge in self.gauges.items()},
+                "counters": dict(self.counters)}
+
+    def write(self, summary: dict):
+        if self.stats_file is not None:
+            # Written next to the file and renamed, so a reader never sees a partial file
+            tmp_file = self.stats_file + ".tmp"
+            with open(tmp_file, "w") as file:
+                json.dump(summary, file, indent=1)
+            os.replace(tmp_file, self.stats_file)
+        if self.report is not None:
+            self.report(summary)
@@ -0,0 +1,163 @@
+import time
+import pickle
+import numpy as np
+from ring_buffer import RingBuffer
+
+
+class OnlineDecoder():
+    """Streaming CSP + classifier decoder over a sliding window
+
+    Incoming batches (n_samples x n_channels, as published) are projected onto the CSP filters
+    once, and the projections are kept in a ring buffer of `win_size` samples per CSP component.
+    Running sums of the projections and of their squares give the variance of each component over
+    the window, so a prediction costs O(hop) instead of a recompute over the whole window. The
+    sums are shifted by the first projected sample to avoid cancellation on large DC offsets, and
+    are recomputed from the window every `recompute_every` samples so rounding errors cannot
+    accumulate.
+
+    Features match `extract_features` in the training notebook: log(var(filters @ window)).
+    """
+
+    def __init__(self, filters: np.ndarray, model, win_size: int = 2000, hop_size: int = 100,
+                 recompute_every: int = 100000):
+        """Class constructor
+        Args:
+            filters (np.ndarray): CSP filters of shape (n_components, n_channels)
+            model: trained classifier with a scikit-learn style `predict`
+            win_size (int, optional): samples per window, the trial length the model was trained on. Defaults to 2000.
+            hop_size (int, optional): samples between two predictions. Defaults to 100.
+            recompute_every (int, optional): samples between exact recomputes of the running sums. Defaults to 100000.
+        """
+        self.filters = np.asarray(filters, dtype=np.float64)
+        self.model = model
+        self.win_size = win_size
+        self.hop_size = hop_size
+        self.recompute_every = recompute_every
+        self.n_components = self.filters.shape[0]
+
+        self.window = RingBuffer(self.n_components, win_size)
+        self.shift = None
+        self.sum = np.zeros(self.n_components)
+        self.sum_sq = np.zeros(self.n_components)
+        self.since_prediction = 0
+        self.since_recompute = 0
+
+        self.n_predictions = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.total_latency_ms = 0.0
+
+    @classmethod
+    def from_files(cls, filters_file: str, model_file: str, **kwargs):
+        """Load the CSP filters (.npy) and the pickled model saved by the training notebook
+
+        Args:
+            filters_file (str): path to the saved CSP filters, e.g. notebooks/models/csp_filters.npy
+            model_file (str): path to the pickled classifier, e.g. notebooks/models/MI_model.pkl
+            **kwargs: passed to the constructor
+
+        Returns:
+            OnlineDecoder: the decoder
+        """
+        filters = np.load(filters_file)
+        with open(model_file, 'rb') as file:
+            model = pickle.load(file)
+        return cls(filters, model, **kwargs)
+
+    @property
+    def mean_latency_ms(self) -> float:
+        return self.total_latency_ms / self.n_predictions if self.n_predictions else 0.0
+
+    def reset(self):
+        """Drop the window, e.g. after a gap in the stream"""
+        self.window.clear()
+        self.shift = None
+        self.sum[:] = 0
+        self.sum_sq[:] = 0
+        self.since_prediction = 0
+        self.since_recompute = 0
+
+    def features(self) -> np.ndarray:
+        """Return the log-variance of each CSP component over the current window
+
+        Returns:
+            np.ndarray: features of shape (1, n_components)
+        """
+        n = len(self.window)
+        mean = self.sum / n
+        var = np.maximum(self.sum_sq / n - mean ** 2, np.finfo(np.float64).tiny)
+        return np.log(var).reshape(1, -1)
+
+    def update(self, samplestamps, samples) -> list:
+        """Add a batch to the window and return the predictions that became due
+
+        A batch spanning several hops yields one prediction per hop, each computed on the window
+        ending at the sample the hop falls on.
+
+        Args:
+            samplestamps ([1D array]): array of batch_size items, each item is a samplestamp
+            samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+
+        Returns:
+            list: one dict per prediction with "samplestamp", "prediction", "features" and "latency_ms"
+        """
+        start_time = time.perf_counter()
+        samplestamps = np.asarray(samplestamps)
+        projected = np.asarray(samples, dtype=np.float64) @ self.filters.T  # (n_samples, n_components)
+        if self.shift is None and len(projected) > 0:
+            self.shift = projected[0].copy()
+
+        predictions = []
+        start = 0
+        while start < len(projected):
+            # Advance to the next hop boundary, or to the end of the batch
+            stop = min(len(projected), start + self.hop_size - self.since_prediction)
+            self._add(projected[start:stop])
+            self.since_prediction += stop - start
+            start = stop
+
+            if self.since_prediction >= self.hop_size and len(self.window) == self.win_size:
+                features = self.features()
+                prediction = self.model.predict(features)[0]
+                latency_ms = (time.perf_counter() - start_time) * 1000
+                predictions.append({"samplestamp": samplestamps[stop - 1], "prediction": prediction,
+                                    "features": features[0], "latency_ms": latency_ms})
+                self._record_latency(latency_ms)
+            if self.since_prediction >= self.hop_size:
+                self.since_prediction = 0
+
+        return predictions
+
+    def _add(self, projected: np.ndarray):
+        """Add projected samples to the window and update the running sums"""
+        n_samples = len(projected)
+        if self.since_recompute + n_samples >= self.recompute_every or n_samples >= self.win_size:
+            self.window.write(projected)
+            self._recompute()
+            return
+
+        shifted = projected - self.shift
+        n_evicted = len(self.window) + n_samples - self.win_size
+        if n_evicted > 0:
+            evicted = self.window.view()[:, :n_evicted].T - self.shift
+            self.sum -= evicted.sum(axis=0)
+            self.sum_sq -= (evicted ** 2).sum(axis=0)
+        self.sum += shifted.sum(axis=0)
+        self.sum_sq += (shifted ** 2).sum(axis=0)
+        self.window.write(projected)
+        self.since_recompute += n_samples
+
+    def _recompute(self):
+        """Recompute the running sums exactly from the window"""
+        window = self.window.view().T
+        self.shift = window[-1].copy()
+        shifted = window - self.shift
+        self.sum = shifted.sum(axis=0)
+        self.sum_sq = (shifted ** 2).sum(axis=0)
+        self.since_recompute = 0
+
+    def _record_latency(self, latency_ms: float):
+        self.n_predictions += 1
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.total_latency_ms += latency_ms
@@ -0,0 +1,120 @@
+import numpy as np
+from filter_bank import StreamingSosFilter
+
+
+class Stage():
+    """One step of a PipelineZmqProcessor
+
+    A stage takes a batch (samplestamps of shape (n_samples,), samples of shape (n_samples,
+    n_channels)) and returns the batch for the next stage. `setup` is called once, on the
+    pipeline's worker thread, before the first batch, so that a stage can allocate the arrays it
+    writes into instead of allocating on every batch; it returns the channel count of its output.
+    A stage may modify the samples it receives in place, they belong to the pipeline.
+    """
+
+    name = "stage"
+
+    def setup(self, processor, n_channels: int, max_samples: int) -> int:
+        """Prepare for batches of up to `max_samples` samples of `n_channels` channels
+
+        Args:
+            processor (PipelineZmqProcessor): the processor running the pipeline, e.g. to publish
+            n_channels (int): channel count of the input batches
+            max_samples (int): largest number of samples per batch
+
+        Returns:
+            int: channel count of the output batches
+        """
+        return n_channels
+
+    def process(self, samplestamps: np.ndarray, samples: np.ndarray):
+        return samplestamps, samples
+
+
+class FunctionStage(Stage):
+    """Stage calling a function `(samplestamps, samples) -> (samplestamps, samples)`"""
+
+    def __init__(self, function, name: str = None):
+        self.function = function
+        self.name = name if name is not None else function.__name__
+
+    def process(self, samplestamps, samples):
+        return self.function(samplestamps, samples)
+
+
+class SosFilterStage(Stage):
+    """Causal IIR filter with its state carried across batches, see `filter_bank.StreamingSosFilter`"""
+
+    def __init__(self, sos: np.ndarray, name: str = "filter"):
+        self.filter = StreamingSosFilter(sos)
+        self.name = name
+
+    def process(self, samplestamps, samples):
+        return samplestamps, self.filter.process(samples)
+
+
+class CommonAverageStage(Stage):
+    """Common average re-reference: subtracts the mean of all the channels from every channel, in place"""
+
+    name = "car"
+
+    def setup(self, processor, n_channels, max_samples):
+        self.mean = np.empty(max_samples)
+        return n_channels
+
+    def process(self, samplestamps, samples):
+        if not np.issubdtype(samples.dtype, np.floating):
+            samples = samples.astype(np.float64)
+        mean = np.mean(samples, axis=1, out=self.mean[:len(samples)])
+        samples -= mean[:, np.newaxis]
+        return samplestamps, samples
+
+
+class SpatialFilterStage(Stage):
+    """Linear combination of the channels, e.g. CSP filters: output = samples @ filters.T"""
+
+    def __init__(self, filters: np.ndarray, name: str = "spatial_filter"):
+        """Class constructor
+        Args:
+            filters (np.ndarray): matrix of shape (n_outputs, n_channels), e.g. loaded from notebooks/models/csp_filters.npy
+            name (str, optional): name of the stage in the timings. Defaults to "spatial_filter".
+        """
+        self.filters = np.asarray(filters, dtype=np.float64)
+        self.name = name
+
+    def setup(self, processor, n_channels, max_samples):
+        if self.filters.shape[1] != n_channels:
+            raise ValueError("Spatial filters expect {} channels, the batches have {}".format(self.filters.shape[1], n_channels))
+        self.output = np.empty((max_samples, self.filters.shape[0]))
+        return self.filters.shape[0]
+
+    def process(self, samplestamps, samples):
+        output = self.output[:len(samples)]
+        np.dot(samples, self.filters.T, out=output)
+        return samplestamps, output
+
+
+class PublishStage(Stage):
+    """Publishes the batch with the processor's wire format, and passes it on unchanged
+
+    Without a topic the batch is published like PublisherZmqProcessor publishes the data: on
+    `pub_topic` (unless `publish_full` is False) and its channel groups on their own topics. With
+    a topic, e.g. for the output of a spatial filter, only on that topic.
+    """
+
+    def __init__(self, topic: str = None):
+        self.topic = topic
+        self.name = "publish_" + topic if topic is not None else "publish"
+
+    def setup(self, processor, n_channels, max_samples):
+        self.processor = processor
+        return n_channels
+
+    def process(self, samplestamps, samples):
+        # The pipeline's arrays are reused by the next batch while ZeroMQ may still be sending, which
+        # is fine since `publish` sends its own copy of the batch
+        if self.topic is None:
+            self.processor.publish_stream(samplestamps, samples)
+        else:
+            self.processor.publish(self.topic, samplestamps, samples)
+        return samplestamps, samples
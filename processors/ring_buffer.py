@@ -0,0 +1,96 @@
+import numpy as np
+from decimation import StreamingDecimator
+
+
+class RingBuffer():
+    """Fixed-size multichannel history of the most recent samples
+
+    Samples are stored channel-major in a preallocated array of shape (n_channels, 2 * win_size).
+    Every sample is written twice, `win_size` columns apart, so that the last `win_size` samples
+    are always one contiguous slice and can be read as a view without copying or re-ordering.
+
+    With `decimation` above 1, written batches first go through a `StreamingDecimator`, so the
+    buffer keeps a fixed number of points for the window whatever the sampling rate, e.g. about
+    as many as the plot is wide in pixels (see `decimation.display_factor`). `x_view` then still
+    counts in input samples.
+    """
+
+    def __init__(self, n_channels: int, win_size: int, dtype=np.float64, decimation: int = 1, mode: str = "envelope"):
+        """Class constructor
+        Args:
+            n_channels (int): number of channels to keep
+            win_size (int): number of input samples to keep per channel
+            dtype (optional): dtype of the stored samples. Defaults to np.float64.
+            decimation (int, optional): input samples per bucket of the decimator, 1 to store every sample. Defaults to 1.
+            mode (str, optional): decimation mode, "envelope" (min-max) or "lowpass". Defaults to "envelope".
+        """
+        self.n_channels = n_channels
+        self.decimator = StreamingDecimator(decimation, mode) if decimation > 1 else None
+        if self.decimator is not None:
+            # Points kept for the window, and the input sample each point stands for
+            points_per_bucket = self.decimator.points_per_bucket
+            win_size = max(1, win_size // decimation) * points_per_bucket
+            self.x = np.arange(win_size) * decimation / points_per_bucket
+        else:
+            self.x = np.arange(win_size)
+        self.win_size = win_size
+        self.buffer = np.zeros((n_channels, 2 * win_size), dtype=dtype)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def write(self, samples):
+        """Append a batch of samples, dropping the oldest ones once the window is full
+
+        Args:
+            samples ([2D array]): batch of shape (n_samples, n_channels), as received from the stream
+        """
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, self.n_channels)
+        if self.decimator is not None:
+            _, samples = self.decimator.process(None, samples)
+        samples = samples[-self.win_size:].T
+        n_samples = samples.shape[1]
+        if n_samples == 0:
+            return
+
+        win_size = self.win_size
+        first = min(n_samples, win_size - self.head)
+        self.buffer[:, self.head:self.head + first] = samples[:, :first]
+        self.buffer[:, self.head + win_size:self.head + win_size + first] = samples[:, :first]
+
+        rest = n_samples - first
+        if rest > 0:
+            self.buffer[:, :rest] = samples[:, first:]
+            self.buffer[:, win_size:win_size + rest] = samples[:, first:]
+
+        self.head = (self.head + n_samples) % win_size
+        self.count = min(self.count + n_samples, win_size)
+
+    def view(self) -> np.ndarray:
+        """Return the buffered samples, oldest first, without copying
+
+        Returns:
+            np.ndarray: view of shape (n_channels, len(self)), only valid until the next `write`
+        """
+        if self.count < self.win_size:
+            return self.buffer[:, :self.count]
+        return self.buffer[:, self.head:self.head + self.win_size]
+
+    def x_view(self) -> np.ndarray:
+        """Return the sample indices matching `view`, for use as the x data of a plot
+
+        Returns:
+            np.ndarray: view of shape (len(self),)
+        """
+        return self.x[:self.count]
+
+    def clear(self):
+        """Drop all buffered samples"""
+        self.head = 0
+        self.count = 0
+        if self.decimator is not None:
+            self.decimator.reset()
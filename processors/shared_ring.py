@@ -0,0 +1,187 @@
+"""Same-host transport: batches written to a shared-memory ring, announced by small ZMQ notifications
+
+A publisher writes each batch of a topic into that topic's ring, a `multiprocessing.shared_memory`
+segment holding the samplestamps and samples of the last `capacity` samples, then publishes a
+notification on SHM_TOPIC_PREFIX + topic:
+
+    [topic, header, segment name]
+
+where the header is NOTIFY_STRUCT: magic "NBCN", sequence number, position of the batch in the
+ring, number of samples and publish time. Subscribers on the same host map the segment and read
+the batch as NumPy views of it, without copying or decoding; remote subscribers keep using the
+topic itself over TCP.
+
+Batches are never split: a batch that does not fit before the end of the ring is written at its
+start. Positions count samples (and the unused end of each lap) since the ring was created, so a
+batch at position p is intact as long as the writer has not reserved past p + capacity.
+"""
+import os
+import struct
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+SHM_TOPIC_PREFIX = "shm:"
+NOTIFY_MAGIC = b"NBCN"
+# magic, sequence number, position, n_samples, timestamp
+NOTIFY_STRUCT = struct.Struct("<4sQQId")
+
+RING_MAGIC = b"NBCR"
+RING_VERSION = 1
+# magic, version, samplestamps dtype, samples dtype, n_channels, capacity; the write position
+# (uint64) follows at WRITE_POSITION_OFFSET and the arrays start at HEADER_SIZE
+RING_HEADER_STRUCT = struct.Struct("<4sB8s8sII")
+WRITE_POSITION_OFFSET = 32
+HEADER_SIZE = 64
+
+# Rings created in this process, which its resource tracker must keep removing at exit
+_created = set()
+
+
+def _samples_offset(capacity: int, stamps_dtype: np.dtype) -> int:
+    # Samples start on a 64-byte boundary after the samplestamps
+    return HEADER_SIZE + (capacity * stamps_dtype.itemsize + 63) // 64 * 64
+
+
+class SharedRingWriter():
+    """Creates a ring and writes batches into it, on the publisher's side"""
+
+    def __init__(self, n_channels: int, capacity: int, samplestamps_dtype=np.int64, samples_dtype=np.float32):
+        """Class constructor
+        Args:
+            n_channels (int): number of channels per sample
+            capacity (int): number of samples kept, the largest batch that can be written
+            samplestamps_dtype (optional): dtype of the samplestamps. Defaults to np.int64.
+            samples_dtype (optional): dtype of the samples. Defaults to np.float32.
+        """
+        self.n_channels = n_channels
+        self.capacity = capacity
+        stamps_dtype = np.dtype(samplestamps_dtype)
+        samples_dtype = np.dtype(samples_dtype)
+        samples_offset = _samples_offset(capacity, stamps_dtype)
+        size = samples_offset + capacity * n_channels * samples_dtype.itemsize
+
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+        _created.add(self.name)
+        RING_HEADER_STRUCT.pack_into(self.shm.buf, 0, RING_MAGIC, RING_VERSION, stamps_dtype.str.encode(),
+                                     samples_dtype.str.encode(), n_channels, capacity)
+        self.write_position = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf, offset=WRITE_POSITION_OFFSET)
+        self.write_position[0] = 0
+        self.samplestamps = np.ndarray((capacity,), dtype=stamps_dtype, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.samples = np.ndarray((capacity, n_channels), dtype=samples_dtype, buffer=self.shm.buf, offset=samples_offset)
+        self.position = 0
+
+    def fits(self, samplestamps: np.ndarray, samples: np.ndarray) -> bool:
+        """Return whether a batch has the ring's layout and size, else a new ring is needed"""
+        return (samples.ndim == 2 and samples.shape[1] == self.n_channels and len(samples) <= self.capacity
+                and samples.dtype == self.samples.dtype and samplestamps.dtype == self.samplestamps.dtype)
+
+    def write(self, samplestamps: np.ndarray, samples: np.ndarray) -> int:
+        """Copy a batch into the ring
+
+        Args:
+            samplestamps (np.ndarray): 1D array of samplestamps
+            samples (np.ndarray): 2D array of shape (n_samples, n_channels)
+
+        Returns:
+            int: position of the batch, to send in the notification
+        """
+        n_samples = len(samples)
+        offset = self.position % self.capacity
+        if offset + n_samples > self.capacity:
+            # Skip the end of the ring so that the batch stays contiguous
+            self.position += self.capacity - offset
+            offset = 0
+        position = self.position
+        # Announce the overwrite before writing, so that readers can tell a batch was overwritten
+        self.write_position[0] = position + n_samples
+        self.samplestamps[offset:offset + n_samples] = samplestamps
+        self.samples[offset:offset + n_samples] = samples
+        self.position = position + n_samples
+        return position
+
+    def close(self):
+        """Release and remove the segment, readers that still map it keep their mapping"""
+        del self.write_position, self.samplestamps, self.samples
+        self.shm.close()
+        self.shm.unlink()
+        _created.discard(self.name)
+
+
+class SharedRingReader():
+    """Maps a ring created by a SharedRingWriter and reads batches from it as views, on the subscriber's side"""
+
+    def __init__(self, name: str):
+        """Class constructor
+        Args:
+            name (str): name of the segment, as sent in the notifications
+        """
+        self.name = name
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every mapped segment is registered to be removed when this process
+            # exits, which would remove the publisher's ring under its other readers
+            self.shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix" and name not in _created:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        magic, version, stamps_dtype, samples_dtype, n_channels, capacity = RING_HEADER_STRUCT.unpack_from(self.shm.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.shm.close()
+            raise ValueError("Segment {} is not a ring of version {}".format(name, RING_VERSION))
+        stamps_dtype = np.dtype(stamps_dtype.rstrip(b"\x00").decode())
+        samples_dtype = np.dtype(samples_dtype.rstrip(b"\x00").decode())
+        self.n_channels = n_channels
+        self.capacity = capacity
+        self.write_position = np.ndarray((1,), dtype=np.uint64, buffer=self.shm.buf, offset=WRITE_POSITION_OFFSET)
+        self.samplestamps = np.ndarray((capacity,), dtype=stamps_dtype, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.samples = np.ndarray((capacity, n_channels), dtype=samples_dtype, buffer=self.shm.buf,
+                                  offset=_samples_offset(capacity, stamps_dtype))
+        # The arrays are read-only views for the subscriber
+        self.samplestamps.flags.writeable = False
+        self.samples.flags.writeable = False
+
+    def is_valid(self, position: int) -> bool:
+        """Return whether the batch at `position` has not been overwritten yet"""
+        return int(self.write_position[0]) - position <= self.capacity
+
+    def read(self, position: int, n_samples: int):
+        """Return a batch as views of the ring
+
+        The views are only valid until the writer wraps around, i.e. about `capacity` samples
+        later; check `is_valid(position)` after using them, or copy them to keep them longer.
+
+        Returns:
+            tuple: (samplestamps, samples) views, or None if the batch was already overwritten
+        """
+        if not self.is_valid(position):
+            return None
+        offset = position % self.capacity
+        return self.samplestamps[offset:offset + n_samples], self.samples[offset:offset + n_samples]
+
+    def close(self):
+        """Unmap the segment, unless views of it are still in use (they keep it mapped)"""
+        del self.write_position, self.samplestamps, self.samples
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+
+def encode_notification(seq: int, position: int, n_samples: int, timestamp: float, name: str) -> list:
+    """Return the frames (after the topic) announcing a batch written to a ring"""
+    return [NOTIFY_STRUCT.pack(NOTIFY_MAGIC, seq, position, n_samples, timestamp), name.encode()]
+
+
+def decode_notification(frames: list):
+    """Decode the frames of a notification
+
+    Returns:
+        tuple: (seq, position, n_samples, timestamp, segment name)
+    """
+    header, name = (frame.bytes if hasattr(frame, "bytes") else frame for frame in frames)
+    magic, seq, position, n_samples, timestamp = NOTIFY_STRUCT.unpack(header)
+    if magic != NOTIFY_MAGIC:
+        raise ValueError("Not a shared-memory notification (magic {})".format(magic))
+    return seq, position, n_samples, timestamp, name.decode()
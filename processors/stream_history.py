@@ -0,0 +1,75 @@
+import time
+from collections import deque
+import numpy as np
+
+# Snapshot protocol between a DEALER client and the publisher's ROUTER socket:
+#   request: [SNAPSHOT_REQUEST, topic]
+#   reply:   [SNAPSHOT_REPLY, topic, *binary frames of the concatenated history], no frames if there is no history
+SNAPSHOT_REQUEST = b"get_snapshot"
+SNAPSHOT_REPLY = b"snapshot"
+
+
+class StreamHistory():
+    """Bounded in-memory history of the batches published on each topic
+
+    Keeps the batches published in the last `seconds` (by publisher time), so a subscriber that
+    joins late can fetch the recent window in one transfer instead of starting with an empty one.
+    The history of a topic starts over when its channel count or dtypes change.
+    """
+
+    def __init__(self, seconds: float = 10.0):
+        """Class constructor
+        Args:
+            seconds (float, optional): how long a batch is kept. Defaults to 10.0.
+        """
+        self.seconds = seconds
+        self.batches = {}  # topic -> deque of (publish time, seq, samplestamps, samples)
+
+    def append(self, topic: str, seq: int, samplestamps, samples, publish_time: float = None, copy: bool = True):
+        """Add a published batch and forget the batches older than `seconds`
+
+        Args:
+            topic (str): topic the batch was published on
+            seq (int): sequence number of the batch on its topic
+            samplestamps ([1D array]): array of batch_size items, each item is a samplestamp
+            samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+            publish_time (float, optional): time the batch was published. Defaults to now.
+            copy (bool, optional): copy the arrays, False if the caller never modifies them. Defaults to True.
+        """
+        if publish_time is None:
+            publish_time = time.time()
+        # Copied, the caller may reuse its buffers for the next batch
+        samplestamps = np.array(samplestamps) if copy else np.asarray(samplestamps)
+        samples = np.array(samples) if copy else np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(len(samplestamps), -1)
+
+        batches = self.batches.setdefault(topic, deque())
+        if batches:
+            _, _, last_stamps, last_samples = batches[-1]
+            if (last_samples.shape[1] != samples.shape[1] or last_samples.dtype != samples.dtype
+                    or last_stamps.dtype != samplestamps.dtype):
+                # The stream changed, e.g. a new montage: the older batches cannot be concatenated with this one
+                batches.clear()
+        batches.append((publish_time, seq, samplestamps, samples))
+        while batches and batches[0][0] < publish_time - self.seconds:
+            batches.popleft()
+
+    def snapshot(self, topic: str):
+        """Concatenate the history of a topic
+
+        Args:
+            topic (str): topic of the batches
+
+        Returns:
+            tuple: (samplestamps, samples, seq of the newest batch), or None if there is no history for the topic
+        """
+        batches = self.batches.get(topic)
+        if not batches:
+            return None
+        samplestamps = np.concatenate([batch[2] for batch in batches])
+        samples = np.concatenate([batch[3] for batch in batches])
+        return samplestamps, samples, batches[-1][1]
+
+    def clear(self):
+        self.batches.clear()
@@ -0,0 +1,173 @@
+"""Wire format shared by the publishing processors and the client subscribers.
+
+A batch is published as a multipart message. Two layouts are supported:
+
+    binary (default): [topic, header, samplestamps, samples, timestamp]
+    pickle (legacy):  [topic, pickle(samplestamps), pickle(samples), timestamp]
+
+In the binary layout `samplestamps` and `samples` are the raw, C-contiguous buffers of the
+arrays and the header describes how to rebuild them with `np.frombuffer`. The legacy layout is
+kept so that subscribers written against the original pickle stream keep working; the two are
+told apart by the number of frames.
+
+UnityZmqProcessor publishes a simpler layout for C# clients, [topic, payload], where the payload
+is a fixed 24-byte little-endian header (magic "NBCU", uint32 n_samples, uint32 n_channels,
+uint32 sequence number, int64 samplestamp of the first sample) followed by the samples as
+row-major float32, which C# can copy into a float[] with `Buffer.BlockCopy(payload, 24, ...)`.
+"""
+
+import pickle
+import struct
+import numpy as np
+
+WIRE_MAGIC = b"NBCI"
+WIRE_VERSION = 1
+
+# magic, version, samplestamps dtype, samples dtype, n_samples, n_channels, sequence number
+HEADER_STRUCT = struct.Struct("<4sB8s8sIIQ")
+
+BINARY_FRAMES = 5
+PICKLE_FRAMES = 4
+
+WIRE_FORMATS = ("binary", "pickle")
+
+UNITY_MAGIC = b"NBCU"
+
+# magic, n_samples, n_channels, sequence number, first samplestamp
+UNITY_HEADER_STRUCT = struct.Struct("<4sIIIq")
+
+
+def pack_header(samplestamps: np.ndarray, samples: np.ndarray, seq: int) -> bytes:
+    """Pack the header frame describing a binary batch
+
+    Args:
+        samplestamps (np.ndarray): 1D array of samplestamps
+        samples (np.ndarray): 2D array of shape (n_samples, n_channels)
+        seq (int): sequence number of the batch on its topic
+
+    Returns:
+        bytes: the packed header
+    """
+    n_samples, n_channels = samples.shape
+    return HEADER_STRUCT.pack(WIRE_MAGIC, WIRE_VERSION,
+                              samplestamps.dtype.str.encode(), samples.dtype.str.encode(),
+                              n_samples, n_channels, seq)
+
+
+def unpack_header(header: bytes) -> dict:
+    """Unpack a header frame produced by `pack_header`
+
+    Args:
+        header (bytes): the header frame
+
+    Returns:
+        dict: the fields of the header
+    """
+    magic, version, stamps_dtype, samples_dtype, n_samples, n_channels, seq = HEADER_STRUCT.unpack(header)
+    if magic != WIRE_MAGIC:
+        raise ValueError("Not a binary batch header: {!r}".format(magic))
+    if version != WIRE_VERSION:
+        raise ValueError("Unsupported wire format version {}".format(version))
+
+    return {"samplestamps_dtype": np.dtype(stamps_dtype.rstrip(b"\x00").decode()),
+            "samples_dtype": np.dtype(samples_dtype.rstrip(b"\x00").decode()),
+            "n_samples": n_samples,
+            "n_channels": n_channels,
+            "seq": seq}
+
+
+def encode_batch(samplestamps, samples, timestamp: float, seq: int = 0, wire_format: str = "binary") -> list:
+    """Encode a batch into the frames that follow the topic frame
+
+    The binary frames reference the array memory directly, so they should be sent with `copy=False`
+    and the arrays must not be modified until the send has completed.
+
+    Args:
+        samplestamps ([1D array]): array of batch_size items, each item is a samplestamp
+        samples ([2D array]): array of batch_size items, each item (sample) is an array of channel data
+        timestamp (float): publisher time of the batch, in seconds since the epoch
+        seq (int, optional): sequence number of the batch on its topic. Defaults to 0.
+        wire_format (str, optional): "binary" or "pickle". Defaults to "binary".
+
+    Returns:
+        list: the encoded frames
+    """
+    samplestamps = np.ascontiguousarray(samplestamps)
+    samples = np.ascontiguousarray(samples)
+    if samples.ndim == 1:
+        samples = samples.reshape(len(samplestamps), -1)
+    timestamp = struct.pack("d", timestamp)
+
+    if wire_format == "binary":
+        return [pack_header(samplestamps, samples, seq), samplestamps, samples, timestamp]
+    elif wire_format == "pickle":
+        return [pickle.dumps(samplestamps), pickle.dumps(samples), timestamp]
+    else:
+        raise ValueError("Unknown wire format '{}', expected one of {}".format(wire_format, WIRE_FORMATS))
+
+
+def decode_batch(frames: list) -> tuple:
+    """Decode the frames that follow the topic frame
+
+    Binary batches are rebuilt with `np.frombuffer`, so the returned arrays are read-only views
+    on the received frames.
+
+    Args:
+        frames (list): the received frames (bytes, or zmq.Frame when received with `copy=False`)
+
+    Returns:
+        tuple: (samplestamps, samples, timestamp, seq), seq is None for pickle batches
+    """
+    if len(frames) == BINARY_FRAMES - 1:
+        header, samplestamps, samples, timestamp = frames
+        header = unpack_header(_buffer(header))
+        samplestamps = np.frombuffer(_buffer(samplestamps), dtype=header["samplestamps_dtype"])
+        samples = np.frombuffer(_buffer(samples), dtype=header["samples_dtype"])
+        samples = samples.reshape(header["n_samples"], header["n_channels"])
+        seq = header["seq"]
+    elif len(frames) == PICKLE_FRAMES - 1:
+        samplestamps, samples, timestamp = frames
+        samplestamps = pickle.loads(_buffer(samplestamps))
+        samples = pickle.loads(_buffer(samples))
+        seq = None
+    else:
+        raise ValueError("Unexpected number of frames: {}".format(len(frames) + 1))
+
+    timestamp = struct.unpack("d", _buffer(timestamp))[0]
+    return samplestamps, samples, timestamp, seq
+
+
+def _buffer(frame):
+    """Return a buffer for a frame received with or without `copy=False`"""
+    return frame.buffer if hasattr(frame, "buffer") else frame
+
+
+def encode_unity_batch(samplestamps, samples: np.ndarray, seq: int = 0) -> bytes:
+    """Encode a batch into the payload of the Unity binary layout
+
+    Args:
+        samplestamps ([1D array]): array of batch_size items, each item is a samplestamp
+        samples (np.ndarray): samples of shape (n_samples, n_channels), converted to little-endian float32
+        seq (int, optional): sequence number of the batch on its topic. Defaults to 0.
+
+    Returns:
+        bytes: header followed by the samples
+    """
+    samples = np.ascontiguousarray(samples, dtype="<f4")
+    n_samples, n_channels = samples.shape
+    first_samplestamp = int(samplestamps[0]) if n_samples else 0
+    return UNITY_HEADER_STRUCT.pack(UNITY_MAGIC, n_samples, n_channels, seq, first_samplestamp) + samples.tobytes()
+
+
+def decode_unity_batch(payload) -> tuple:
+    """Decode a payload of the Unity binary layout, e.g. to test a Unity stream from Python
+
+    Returns:
+        tuple: (first samplestamp, samples of shape (n_samples, n_channels), seq)
+    """
+    payload = _buffer(payload)
+    magic, n_samples, n_channels, seq, first_samplestamp = UNITY_HEADER_STRUCT.unpack_from(payload)
+    if magic != UNITY_MAGIC:
+        raise ValueError("Not a Unity batch (magic {!r})".format(magic))
+    samples = np.frombuffer(payload, dtype="<f4", count=n_samples * n_channels, offset=UNITY_HEADER_STRUCT.size)
+    return first_samplestamp, samples.reshape(n_samples, n_channels), seq